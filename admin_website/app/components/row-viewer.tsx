@@ -2,28 +2,45 @@ import { useState, useEffect } from "react";
 import type { AuthContextType} from "../contexts/auth-context";
 import {useAuth} from "../contexts/auth-context";
 
+export const PAGE_SIZE = 100;
+
+export interface RowPage {
+  rows: Record<string, string>[];
+  nextCursor: string | null;
+  total: string | null;
+}
+
 interface RowViewerState  {
   refreshing: boolean;
   rows: Record<string, string>[];
+  nextCursor: string | null;
+  total: string | null;
+  search: string;
   clientError: string | null;
 }
 
-export default function Component(fetchRows: (authContext: AuthContextType) => Promise<Record<string, string>[]>) {
+export default function Component(fetchRows: (authContext: AuthContextType, cursor: string | null, search: string) => Promise<RowPage>) {
   const authContext = useAuth();
   const [state, setState] = useState<RowViewerState>({
     refreshing: false,
     rows: new Array<Record<string, string>>(),
+    nextCursor: null,
+    total: null,
+    search: "",
     clientError: null,
   });
 
-  const refreshRows = async () => {
+  // Without a cursor the first page replaces the rows, with one the next page is appended
+  const loadRows = async (cursor: string | null) => {
     setState(prev => ({ ...prev, refreshing: true, clientError: null }));
    
-    await fetchRows(authContext)
-        .then(rows => {
+    await fetchRows(authContext, cursor, state.search)
+        .then(page => {
             setState(prev => ({
               ...prev,
-              rows: rows,
+              rows: cursor ? [...prev.rows, ...page.rows] : page.rows,
+              nextCursor: page.nextCursor,
+              total: page.total,
               clientError: "",
               refreshing: false,
             }));
@@ -37,6 +54,8 @@ export default function Component(fetchRows: (authContext: AuthContextType) => P
         });
   }
 
+  const refreshRows = () => loadRows(null);
+
   useEffect(() => {
       refreshRows();
   }, []);
@@ -64,7 +83,7 @@ export default function Component(fetchRows: (authContext: AuthContextType) => P
       <div className="mb-6">
         <h1 className="text-3xl font-bold text-gray-800 mb-2">Rows</h1>
         <div className="text-sm text-gray-600">
-          <span className="mr-4">rows: {state.rows.length}</span>
+          <span className="mr-4">rows: {state.rows.length}{state.total !== null && ` of ${state.total}`}</span>
         </div>
       </div>
 
@@ -84,7 +103,16 @@ export default function Component(fetchRows: (authContext: AuthContextType) => P
             'Refresh'
           )}
         </button>
-        
+
+        <input
+          type="search"
+          placeholder="Search by prefix"
+          value={state.search}
+          onChange={(e) => setState(prev => ({ ...prev, search: e.target.value }))}
+          onKeyDown={(e) => { if (e.key === "Enter") refreshRows(); }}
+          className="px-3 py-2 border rounded text-black"
+        />
+
       </div>
       {/* Error Display */}
       {currentError && (
@@ -109,6 +137,16 @@ export default function Component(fetchRows: (authContext: AuthContextType) => P
           {rows().map((row, index) => formatRow(row, index))}
         </tbody>
       </table>
+
+      {state.nextCursor && (
+        <button
+          onClick={() => loadRows(state.nextCursor)}
+          disabled={state.refreshing}
+          className="mt-4 px-4 py-2 bg-blue-500 text-white rounded hover:bg-blue-600 disabled:bg-blue-300 transition-colors"
+        >
+          Load more
+        </button>
+      )}
     </div>
   );
 }
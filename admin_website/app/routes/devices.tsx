@@ -1,20 +1,28 @@
 import type { Route } from "./+types/devices";
 import type { AuthContextType} from "../contexts/auth-context";
-import RowViewer from "../components/row-viewer";
+import RowViewer, { PAGE_SIZE } from "../components/row-viewer";
+import type { RowPage } from "../components/row-viewer";
 
 export async function loader({ params, request }: Route.LoaderArgs) {
     return {};
 }
 
-async function fetchDevices(authContext: AuthContextType): Promise<Record<string, string>[]> {
+async function fetchDevices(authContext: AuthContextType, cursor: string | null, search: string): Promise<RowPage> {
+    const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
+    if (cursor) params.set("cursor", cursor);
+    if (search) params.set("q", search);
 
-    return await fetch(`http://localhost:8000/admin/devices`, {
+    return await fetch(`http://localhost:8000/admin/devices?${params}`, {
       headers: authContext.getAuthHeaders(),
-    }).then(response => {
+    }).then(async response => {
         if (!response.ok) {
           throw new Error(`Failed to fetch devices: ${response.status}`);
         }
-        return response.json();
+        return {
+          rows: await response.json(),
+          nextCursor: response.headers.get("X-Next-Cursor"),
+          total: response.headers.get("X-Total-Count"),
+        };
     });
 }
 
@@ -7,8 +7,11 @@ export async function loader({ params, request }: Route.LoaderArgs) {
     return {};
 }
 
+// Only the newest lines are fetched, the backend reads them from the end of the log file
+const LOG_TAIL_LINES = 2000;
+
 async function fetchLogs(authContext: AuthContextType) {
-    return await fetch(`http://localhost:8000/admin/logs`, {
+    return await fetch(`http://localhost:8000/admin/logs?tail=${LOG_TAIL_LINES}`, {
       headers: authContext.getAuthHeaders(),
     }).then(response => {
         if (!response.ok) {
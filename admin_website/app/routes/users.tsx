@@ -1,19 +1,28 @@
 import type { Route } from "./+types/users";
 import type { AuthContextType} from "../contexts/auth-context";
-import RowViewer from "../components/row-viewer";
+import RowViewer, { PAGE_SIZE } from "../components/row-viewer";
+import type { RowPage } from "../components/row-viewer";
 
 export async function loader({ params, request }: Route.LoaderArgs) {
     return {};
 }
 
-async function fetchUsers(authContext: AuthContextType): Promise<Record<string, string>[]> {
-    return await fetch(`http://localhost:8000/admin/users`, {
+async function fetchUsers(authContext: AuthContextType, cursor: string | null, search: string): Promise<RowPage> {
+    const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
+    if (cursor) params.set("cursor", cursor);
+    if (search) params.set("q", search);
+
+    return await fetch(`http://localhost:8000/admin/users?${params}`, {
       headers: authContext.getAuthHeaders(),
-    }).then(response => {
+    }).then(async response => {
         if (!response.ok) {
           throw new Error(`Failed to fetch users: ${response.status}`);
         }
-        return response.json();
+        return {
+          rows: await response.json(),
+          nextCursor: response.headers.get("X-Next-Cursor"),
+          total: response.headers.get("X-Total-Count"),
+        };
     });
 }
 
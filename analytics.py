@@ -0,0 +1,173 @@
+"""
+Vectorized analytics over device location history.
+Requires NumPy, which the server itself does not need: `pip install numpy`.
+"""
+import sqlite3
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+from geo import EARTH_RADIUS_M
+
+TRACK_DTYPE = np.dtype([
+    ('latitude', np.float64),
+    ('longitude', np.float64),
+    ('speed', np.float64),
+    ('timestamp', np.float64),  # epoch seconds
+])
+
+
+class Track(NamedTuple):
+    """Column arrays of one device's fixes, ordered by time. Missing values are NaN."""
+    latitude: np.ndarray
+    longitude: np.ndarray
+    speed: np.ndarray
+    timestamp: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+
+class Stop(NamedTuple):
+    start_index: int
+    end_index: int  # inclusive
+    latitude: float
+    longitude: float
+    start_time: float
+    end_time: float
+
+    @property
+    def duration(self) -> float:
+        return self.end_time - self.start_time
+
+
+class DwellPoint(NamedTuple):
+    latitude: float
+    longitude: float
+    seconds: float
+
+
+def track_from_records(records: np.ndarray) -> Track:
+    return Track(records['latitude'], records['longitude'], records['speed'], records['timestamp'])
+
+def load_track(conn: sqlite3.Connection, device_id: str, start: Optional[float] = None, end: Optional[float] = None) -> Track:
+    """
+    Load one device's fixes between start and end (epoch seconds) straight from SQLite into arrays,
+    without building per-row dicts. Fixes without a position are skipped.
+    """
+    query = '''
+        SELECT latitude, longitude, speed, timestamp
+        FROM device_locations
+        WHERE device_id = (SELECT id FROM devices WHERE imei = ?) AND latitude IS NOT NULL AND longitude IS NOT NULL
+    '''
+    params: list = [device_id]
+    # Bounds in the stored epoch milliseconds so they can use an index
+    if start is not None:
+        query += ' AND timestamp >= ?'
+        params.append(round(start * 1000))
+    if end is not None:
+        query += ' AND timestamp < ?'
+        params.append(round(end * 1000))
+    query += ' ORDER BY timestamp'
+
+    rows = conn.execute(query, params).fetchall()
+    if not rows:
+        return track_from_records(np.empty(0, dtype=TRACK_DTYPE))
+
+    # One conversion per column instead of per row; a missing speed (None) becomes NaN
+    latitude, longitude, speed, timestamp = zip(*rows)
+    return Track(
+        np.array(latitude, dtype=np.float64),
+        np.array(longitude, dtype=np.float64),
+        np.array(speed, dtype=np.float64),
+        np.array(timestamp, dtype=np.float64) / 1000,
+    )
+
+def save_track_npz(path: str, track: Track):
+    """Write a track as a compressed columnar NumPy archive."""
+    np.savez_compressed(path, **track._asdict())
+
+def load_track_npz(path: str) -> Track:
+    with np.load(path) as archive:
+        return Track(*(archive[field] for field in Track._fields))
+
+
+def segment_distances_m(latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+    """Haversine distance between each pair of consecutive fixes, one shorter than the input."""
+    phi = np.radians(latitude)
+    lam = np.radians(longitude)
+    delta_phi = np.diff(phi)
+    delta_lambda = np.diff(lam)
+    a = np.sin(delta_phi / 2) ** 2 + np.cos(phi[:-1]) * np.cos(phi[1:]) * np.sin(delta_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def total_distance_m(track: Track) -> float:
+    if len(track) < 2:
+        return 0.0
+    return float(segment_distances_m(track.latitude, track.longitude).sum())
+
+def segment_speeds_mps(track: Track) -> np.ndarray:
+    """Speed derived from position and time between consecutive fixes."""
+    distances = segment_distances_m(track.latitude, track.longitude)
+    durations = np.diff(track.timestamp)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(durations > 0, distances / durations, 0.0)
+
+
+def detect_stops(track: Track, max_speed_mps: float = 0.5, min_duration_s: float = 300) -> List[Stop]:
+    """Find runs of consecutive fixes moving slower than max_speed_mps that last at least min_duration_s."""
+    if len(track) < 2:
+        return []
+
+    slow = segment_speeds_mps(track) < max_speed_mps
+    # Run boundaries are where the slow mask flips, padded so runs at either end are closed
+    edges = np.diff(np.concatenate(([False], slow, [False])).astype(np.int8))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)  # segment index one past the run, i.e. the last fix of the run
+
+    durations = track.timestamp[run_ends] - track.timestamp[run_starts]
+    stops = []
+    for start, end in zip(run_starts[durations >= min_duration_s], run_ends[durations >= min_duration_s]):
+        stops.append(Stop(
+            int(start), int(end),
+            float(track.latitude[start:end + 1].mean()),
+            float(track.longitude[start:end + 1].mean()),
+            float(track.timestamp[start]),
+            float(track.timestamp[end]),
+        ))
+    return stops
+
+def dwell_points(track: Track, cell_size_m: float = 50, top: int = 10) -> List[DwellPoint]:
+    """Places where the most time was spent, by summing time between fixes on a grid of cell_size_m cells."""
+    if len(track) < 2:
+        return []
+
+    cell_degrees = np.degrees(cell_size_m / EARTH_RADIUS_M)
+    rows = np.floor(track.latitude[:-1] / cell_degrees).astype(np.int64)
+    columns = np.floor(track.longitude[:-1] / cell_degrees).astype(np.int64)
+    # Pack both cell indexes into one integer key, unique over a 1-d array is much faster than over rows
+    cells, inverse = np.unique((rows << 32) + (columns & 0xFFFFFFFF), return_inverse=True)
+
+    seconds = np.bincount(inverse, weights=np.diff(track.timestamp), minlength=len(cells))
+    counts = np.bincount(inverse, minlength=len(cells))
+    latitude = np.bincount(inverse, weights=track.latitude[:-1], minlength=len(cells)) / counts
+    longitude = np.bincount(inverse, weights=track.longitude[:-1], minlength=len(cells)) / counts
+
+    order = np.argsort(seconds)[::-1][:top]
+    return [DwellPoint(float(latitude[i]), float(longitude[i]), float(seconds[i])) for i in order]
+
+def speed_profile(track: Track, bins: Optional[np.ndarray] = None) -> dict:
+    """Histogram and percentiles of reported speed, ignoring fixes without a speed."""
+    speed = track.speed[~np.isnan(track.speed)]
+    if bins is None:
+        bins = np.array([0, 0.5, 1, 2, 3, 5, 8, 12, 20, np.inf])
+    counts, _ = np.histogram(speed, bins=bins)
+    profile = {
+        'count': int(len(speed)),
+        'bins': bins.tolist(),
+        'histogram': counts.tolist(),
+    }
+    if len(speed):
+        p50, p90, p99 = np.percentile(speed, [50, 90, 99])
+        profile.update({'mean': float(speed.mean()), 'max': float(speed.max()), 'p50': float(p50), 'p90': float(p90), 'p99': float(p99)})
+    return profile
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+
+class CachedToken(NamedTuple):
+    user_uuid: str
+    expiry: float  # epoch seconds, taken from the token's 'exp' claim
+
+
+# Token Cache
+class TokenCache:
+    """Bounded LRU cache of already verified JWTs, with a revocation list."""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, CachedToken] = OrderedDict()
+        self._revoked: Dict[str, float] = {}  # token -> expiry
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[CachedToken]:
+        """Return the cached entry for a token, or None if unknown, expired or revoked."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry.expiry <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return entry
+
+    def put(self, token: str, user_uuid: str, expiry: float):
+        """Cache a verified token."""
+        with self._lock:
+            if token in self._revoked:
+                return
+            self._entries[token] = CachedToken(user_uuid, expiry)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def revoke(self, token: str, expiry: float):
+        """Revoke a token until it would have expired anyway."""
+        with self._lock:
+            self._entries.pop(token, None)
+            self._revoked[token] = expiry
+            self._prune_revoked()
+
+    def is_revoked(self, token: str) -> bool:
+        with self._lock:
+            return token in self._revoked
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._revoked.clear()
+
+    def _prune_revoked(self):
+        now = time.time()
+        expired = [token for token, expiry in self._revoked.items() if expiry <= now]
+        for token in expired:
+            del self._revoked[token]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Role Cache
+class RoleCache:
+    """Bounded LRU cache of user roles, invalidated whenever a role changes."""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._roles: OrderedDict[str, str] = OrderedDict()  # user_uuid -> role
+        self._lock = threading.Lock()
+
+    def get(self, user_uuid: str) -> Optional[str]:
+        with self._lock:
+            role = self._roles.get(user_uuid)
+            if role is not None:
+                self._roles.move_to_end(user_uuid)
+            return role
+
+    def put(self, user_uuid: str, role: str):
+        with self._lock:
+            self._roles[user_uuid] = role
+            self._roles.move_to_end(user_uuid)
+            while len(self._roles) > self.max_size:
+                self._roles.popitem(last=False)
+
+    def invalidate(self, user_uuid: str):
+        with self._lock:
+            self._roles.pop(user_uuid, None)
+
+    def clear(self):
+        with self._lock:
+            self._roles.clear()
@@ -0,0 +1,134 @@
+"""
+Online backups of the live database with the SQLite backup API.
+Pages are copied in small steps with sleeps in between, from a separate connection in a worker
+thread, so ingest keeps writing while a backup runs.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from database_manager import DatabaseManager
+
+BACKUP_FILE_PREFIX = 'dog_tracker-'
+BACKUP_FILE_SUFFIX = '.db'
+
+
+class BackupInProgressError(Exception):
+    pass
+
+
+# Backup Manager
+class BackupManager:
+    """Creates, lists and prunes backups in `backup_dir`, on demand or on a schedule."""
+
+    def __init__(self, db_manager: DatabaseManager, backup_dir: str, logger: logging.Logger,
+                 keep: int = 24, pages_per_step: int = 256, step_sleep_seconds: float = 0.01):
+        self.db_manager = db_manager
+        self.backup_dir = backup_dir
+        self.logger = logger
+        self.keep = keep
+        self.pages_per_step = pages_per_step
+        self.step_sleep_seconds = step_sleep_seconds
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def in_progress(self) -> bool:
+        return self._lock.locked()
+
+    def _copy_from_file(self, target_path: str) -> int:
+        """Copy the database file page by page, returning the page count. Runs in a worker thread."""
+        source = sqlite3.connect(self.db_manager.db_path)
+        target = sqlite3.connect(target_path)
+        try:
+            # Pin one read snapshot for the whole copy. In WAL mode writers carry on, and since the
+            # snapshot never changes the backup does not restart when they commit.
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            pages = [0]
+            source.backup(target, pages=self.pages_per_step, sleep=self.step_sleep_seconds,
+                          progress=lambda status, remaining, total: pages.__setitem__(0, total))
+            source.rollback()
+            return pages[0]
+        finally:
+            target.close()
+            source.close()
+
+    def _copy_in_memory(self, target_path: str) -> int:
+        # An in-memory database is only reachable through its own connection, and is small
+        target = sqlite3.connect(target_path)
+        try:
+            self.db_manager.get_connection().backup(target)
+            return target.execute('PRAGMA page_count').fetchone()[0]
+        finally:
+            target.close()
+
+    async def create_backup(self) -> dict:
+        """Back up the database to a new timestamped file, then prune old backups."""
+        if self._lock.locked():
+            raise BackupInProgressError("A backup is already running")
+
+        async with self._lock:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            path = os.path.join(self.backup_dir,
+                                f'{BACKUP_FILE_PREFIX}{datetime.now().strftime("%Y%m%d-%H%M%S")}{BACKUP_FILE_SUFFIX}')
+            partial_path = f'{path}.partial'
+            started = time.perf_counter()
+            try:
+                if self.db_manager.db_path == ':memory:':
+                    pages = self._copy_in_memory(partial_path)
+                else:
+                    pages = await asyncio.to_thread(self._copy_from_file, partial_path)
+                os.replace(partial_path, path)
+            except Exception:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                raise
+
+            seconds = time.perf_counter() - started
+            self.logger.info(f"Backed up {pages} pages to {path} in {seconds:.1f}s")
+            self.prune()
+            return {'name': os.path.basename(path), 'size': os.path.getsize(path), 'pages': pages, 'seconds': seconds}
+
+    def list_backups(self) -> List[dict]:
+        """Completed backups, newest first."""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        backups = []
+        for name in os.listdir(self.backup_dir):
+            if name.startswith(BACKUP_FILE_PREFIX) and name.endswith(BACKUP_FILE_SUFFIX):
+                stat = os.stat(os.path.join(self.backup_dir, name))
+                backups.append({'name': name, 'size': stat.st_size,
+                                'created_at': datetime.fromtimestamp(stat.st_mtime).isoformat()})
+        return sorted(backups, key=lambda backup: backup['name'], reverse=True)
+
+    def prune(self):
+        for backup in self.list_backups()[self.keep:]:
+            os.remove(os.path.join(self.backup_dir, backup['name']))
+            self.logger.info(f"Removed old backup {backup['name']}")
+
+    async def _run(self, interval_seconds: float):
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.create_backup()
+            except BackupInProgressError:
+                pass
+            except Exception as e:
+                self.logger.error(f"Scheduled backup failed: {e}")
+
+    def start(self, interval_seconds: float):
+        self._task = asyncio.get_running_loop().create_task(self._run(interval_seconds))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,100 @@
+"""
+Compares the vectorized analytics against the per-row path over a synthetic track.
+
+    python -m benchmarks.analytics_benchmark --fixes 1000000
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from typing import Callable, List
+
+import numpy as np
+
+import analytics
+from database_manager import DatabaseManager
+from geo import haversine_distance_m
+
+DEVICE_ID = 'benchmark-device'
+START = 1735689600.0  # 2025-01-01T00:00:00Z
+
+
+def seed(conn: sqlite3.Connection, fixes: int, interval_s: float = 10):
+    """A random walk that stands still for a while every few hundred fixes."""
+    rng = np.random.default_rng(42)
+    steps = rng.normal(0, 0.00005, size=(fixes, 2))
+    steps[(np.arange(fixes) // 100) % 5 == 0] = 0
+    positions = np.array([60.0, 10.0]) + np.cumsum(steps, axis=0)
+    speeds = rng.uniform(0, 4, size=fixes)
+    timestamps = [round((START + index * interval_s) * 1000) for index in range(fixes)]
+
+    conn.execute('INSERT OR IGNORE INTO devices (imei, owner_uuid, name) VALUES (?, ?, ?)', (DEVICE_ID, 'benchmark', 'benchmark'))
+    device_key = conn.execute('SELECT id FROM devices WHERE imei = ?', (DEVICE_ID,)).fetchone()[0]
+    conn.executemany(
+        'INSERT INTO device_locations (device_id, latitude, longitude, speed, timestamp) VALUES (?, ?, ?, ?, ?)',
+        ((device_key, float(lat), float(lon), float(speed), timestamp)
+         for (lat, lon), speed, timestamp in zip(positions, speeds, timestamps)))
+    conn.commit()
+
+
+def per_row_distance(conn: sqlite3.Connection) -> float:
+    """The way the API reads history today, a dict per row and a Python loop."""
+    cursor = conn.execute('''
+        SELECT d.imei, dl.latitude, dl.longitude, dl.speed, dl.timestamp
+        FROM device_locations dl
+        JOIN devices d ON d.id = dl.device_id
+        WHERE d.imei = ? ORDER BY dl.timestamp
+    ''', (DEVICE_ID,))
+    locations: List[dict] = [
+        {'device_id': row[0], 'latitude': row[1], 'longitude': row[2], 'speed': row[3], 'timestamp': row[4]}
+        for row in cursor.fetchall()
+    ]
+    distance = 0.0
+    for previous, current in zip(locations, locations[1:]):
+        distance += haversine_distance_m(previous['latitude'], previous['longitude'],
+                                         current['latitude'], current['longitude'])
+    return distance
+
+
+def measure(name: str, function: Callable, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    print(f'{name:<32} best {min(timings) * 1000:10.1f} ms')
+    return result, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixes', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(logging.getLogger(__name__), ':memory:')
+    conn = db_manager.get_connection()
+    seed(conn, args.fixes)
+    print(f'{args.fixes} fixes')
+
+    row_distance, row_seconds = measure('per-row distance', lambda: per_row_distance(conn), args.repeat)
+    track, load_seconds = measure('load_track', lambda: analytics.load_track(conn, DEVICE_ID), args.repeat)
+    array_distance, array_seconds = measure('total_distance_m', lambda: analytics.total_distance_m(track), args.repeat)
+    measure('detect_stops', lambda: analytics.detect_stops(track), args.repeat)
+    measure('dwell_points', lambda: analytics.dwell_points(track), args.repeat)
+    measure('speed_profile', lambda: analytics.speed_profile(track), args.repeat)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'track.npz')
+        analytics.save_track_npz(path, track)
+        _, npz_seconds = measure('load_track_npz', lambda: analytics.load_track_npz(path), args.repeat)
+
+    print(f'distance per-row {row_distance:.1f} m, vectorized {array_distance:.1f} m')
+    print(f'speedup loading from SQLite: {row_seconds / (load_seconds + array_seconds):.1f}x, '
+          f'from the columnar export: {row_seconds / (npz_seconds + array_seconds):.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,465 @@
+"""
+End-to-end load benchmark of the REST API, WebSocket sessions and MQTT ingest.
+
+    python -m benchmarks.load_benchmark --preset small
+    python -m benchmarks.load_benchmark --preset realistic --db /tmp/load-realistic.db
+    python -m benchmarks.load_benchmark --preset small --save-baseline baseline-small.json
+    python -m benchmarks.load_benchmark --preset small --compare baseline-small.json --tolerance 0.2
+
+A database with a realistic graph of users, friends, groups, devices, shares and location history is seeded
+once per configuration and reused. The app is then driven in process through its ASGI interface on one
+event loop, so the numbers are the backend's own, without network or client overhead:
+
+- reconnect storm: all WebSocket clients connect at once, latency until their initial data is sent
+- ingest -> broadcast: every client sends device fixes, latency until each friend receives the update
+- MQTT ingest: simulated trackers publish their topics through a local broker stand-in into mqtt_handler,
+  latency from the first topic of an update until it is stored and broadcast
+- REST: concurrent GETs of the listing and history endpoints
+
+Results are printed as throughput and latency percentiles. A saved baseline is only comparable with runs
+of the same preset on the same machine; --compare exits with status 1 when a scenario got slower or its
+throughput dropped by more than the tolerance.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence
+
+import httpx
+
+from database_manager import DatabaseManager
+from models import to_epoch_ms
+
+PRESETS = {
+    # Seconds to seed and run, for before/after checks while working on a change
+    'small': {'users': 500, 'devices': 2000, 'fixes': 200000, 'friends_per_user': 6,
+              'clients': 100, 'updates_per_client': 5, 'trackers': 200, 'tracker_updates': 5,
+              'requests': 2000, 'concurrency': 50},
+    # The size of a large deployment
+    'realistic': {'users': 10000, 'devices': 50000, 'fixes': 2000000, 'friends_per_user': 20,
+                  'clients': 1000, 'updates_per_client': 10, 'trackers': 5000, 'tracker_updates': 10,
+                  'requests': 20000, 'concurrency': 200},
+}
+SEEDED_PASSWORD_HASH = '$2b$04$benchmarkbenchmarkbenchmarkbenchmarkbenchmarkbenchm'
+HISTORY_DAYS = 30
+SEED_CHUNK_SIZE = 50000
+RANDOM_SEED = 42
+
+logger = logging.getLogger(__name__)
+
+
+# Seeding
+def user_id(index: int) -> str:
+    return f'user-{index:06d}'
+
+def device_imei(index: int) -> str:
+    return f'35{index:013d}'
+
+def device_owner_index(device_index: int, users: int) -> int:
+    return device_index % users
+
+def seed_database(path: str, users: int, devices: int, fixes: int, friends_per_user: int, **_):
+    """Fill a new database. Device i belongs to user i % users; fixes are spread evenly over the devices."""
+    rng = random.Random(RANDOM_SEED)
+    db_manager = DatabaseManager(logger, path)
+    conn = db_manager.get_connection()
+    conn.execute('PRAGMA synchronous = OFF')
+    now = datetime.now()
+
+    with conn:
+        conn.executemany('INSERT INTO users (uuid, email, password_hash, nickname) VALUES (?, ?, ?, ?)',
+                         ((user_id(index), f'{user_id(index)}@load.test', SEEDED_PASSWORD_HASH, f'User {index}')
+                          for index in range(users)))
+
+        friendships = set()
+        for index in range(users):
+            for _ in range(friends_per_user // 2):
+                other = rng.randrange(users)
+                if other != index and (other, index) not in friendships:
+                    friendships.add((index, other))
+        conn.executemany("INSERT OR IGNORE INTO friends (user_uuid, friend_uuid, status) VALUES (?, ?, 'accepted')",
+                         ((user_id(a), user_id(b)) for a, b in friendships))
+
+        groups = [(f'group-{index:05d}', f'Group {index}', None, user_id(rng.randrange(users)))
+                  for index in range(max(1, users // 10))]
+        conn.executemany('INSERT INTO groups (id, name, description, owner_id) VALUES (?, ?, ?, ?)', groups)
+        conn.executemany('INSERT OR IGNORE INTO group_members (group_id, user_uuid) VALUES (?, ?)',
+                         ((group[0], user_id(rng.randrange(users))) for group in groups for _ in range(8)))
+
+        conn.executemany('INSERT INTO devices (imei, owner_uuid, name) VALUES (?, ?, ?)',
+                         ((device_imei(index), user_id(device_owner_index(index, users)), f'Dog {index}')
+                          for index in range(devices)))
+        # One device in ten is shared with a random user
+        conn.executemany('INSERT OR IGNORE INTO device_shares (device_imei, owner_uuid, shared_with_uuid) VALUES (?, ?, ?)',
+                         ((device_imei(index), user_id(device_owner_index(index, users)), user_id(rng.randrange(users)))
+                          for index in range(0, devices, 10)))
+
+        # Users and devices get the keys 1, 2, ... in the order they were inserted
+        conn.executemany('''
+            INSERT INTO user_locations (user_id, latitude, longitude, altitude, speed, battery, accuracy, timestamp)
+            VALUES (?, ?, ?, 0, 0, 80, 5, ?)
+        ''', ((index + 1, 59 + rng.random(), 10 + rng.random(), to_epoch_ms(now)) for index in range(users)))
+
+    # Fixes in chunks, each its own transaction, oldest first like they arrive
+    per_device = max(1, fixes // max(1, devices))
+    interval = timedelta(days=HISTORY_DAYS) / per_device
+    start = now - timedelta(days=HISTORY_DAYS)
+
+    def fix_rows():
+        for step in range(per_device):
+            timestamp = to_epoch_ms(start + step * interval)
+            for index in range(devices):
+                yield (index + 1, 59 + (index % 1000) / 1000 + step * 1e-5, 10 + rng.random() * 1e-3,
+                       rng.uniform(0, 4), 100 - step * 50 // per_device, 'lte', timestamp)
+
+    rows = fix_rows()
+    while True:
+        chunk = [row for _, row in zip(range(SEED_CHUNK_SIZE), rows)]
+        if not chunk:
+            break
+        with conn:
+            conn.executemany('''
+                INSERT INTO device_locations (device_id, latitude, longitude, speed, battery, connection_type, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', chunk)
+    conn.execute('PRAGMA optimize')
+    conn.close()
+
+def ensure_seeded(path: str, config: dict):
+    """Seed `path` unless it was already seeded with the same configuration."""
+    seed_keys = ('users', 'devices', 'fixes', 'friends_per_user')
+    seed_config = {key: config[key] for key in seed_keys}
+    marker_path = f'{path}.seed.json'
+    if os.path.exists(path) and os.path.exists(marker_path):
+        with open(marker_path) as file:
+            if json.load(file) == seed_config:
+                return
+    for stale_path in (path, f'{path}-wal', f'{path}-shm'):
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+
+    started = time.perf_counter()
+    seed_database(path, **seed_config)
+    with open(marker_path, 'w') as file:
+        json.dump(seed_config, file)
+    print(f"Seeded {path} in {time.perf_counter() - started:.1f}s: {seed_config}")
+
+
+# Measurements
+def percentile(sorted_samples: Sequence[float], percent: float) -> float:
+    """Nearest rank percentile."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+def summarize(samples: List[float], seconds: float, errors: int = 0) -> dict:
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'errors': errors,
+        'throughput_per_s': len(ordered) / seconds if seconds > 0 else 0.0,
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p95_ms': percentile(ordered, 95) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'max_ms': (ordered[-1] if ordered else 0.0) * 1000,
+    }
+
+
+# In-process WebSocket client
+class WebSocketSession:
+    """A WebSocket client speaking ASGI to the app directly."""
+
+    def __init__(self, app, token: str):
+        self.app = app
+        self.token = token
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.closed = False
+        self._to_app: asyncio.Queue = asyncio.Queue()
+        self._receive_calls = 0
+        self._waiting = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _receive(self) -> dict:
+        # The app asks for the next message once it is done with the previous one
+        async with self._waiting:
+            self._receive_calls += 1
+            self._waiting.notify_all()
+        return await self._to_app.get()
+
+    async def _send(self, message: dict):
+        if message['type'] == 'websocket.send':
+            self.incoming.put_nowait(json.loads(message['text']))
+        elif message['type'] == 'websocket.close':
+            self.closed = True
+            async with self._waiting:
+                self._waiting.notify_all()
+
+    async def _handled(self, messages: int):
+        """Wait until the app handled the connect and `messages` further messages."""
+        async with self._waiting:
+            await self._waiting.wait_for(lambda: self.closed or self._receive_calls >= messages + 2)
+
+    async def connect(self):
+        """Connect and wait until the initial data was sent."""
+        scope = {
+            'type': 'websocket', 'asgi': {'version': '3.0'}, 'scheme': 'ws', 'http_version': '1.1',
+            'path': '/ws', 'raw_path': b'/ws', 'root_path': '', 'query_string': f'token={self.token}'.encode(),
+            'headers': [], 'client': ('127.0.0.1', 0), 'server': ('benchmark', 80), 'subprotocols': [],
+        }
+        self._to_app.put_nowait({'type': 'websocket.connect'})
+        self._task = asyncio.create_task(self.app(scope, self._receive, self._send))
+        await self._handled(0)
+        if self.closed:
+            raise RuntimeError("WebSocket was closed by the server")
+
+    async def send_json(self, data: dict):
+        self._to_app.put_nowait({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def wait_handled(self, messages: int):
+        await self._handled(messages)
+
+    async def close(self):
+        self._to_app.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+        await self._task
+
+
+# Scenarios
+async def reconnect_storm(app, tokens: Dict[str, str]) -> tuple:
+    sessions = {uuid: WebSocketSession(app, token) for uuid, token in tokens.items()}
+
+    async def connect(session: WebSocketSession) -> float:
+        started = time.perf_counter()
+        await session.connect()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(connect(session) for session in sessions.values()))
+    return sessions, summarize(list(latencies), time.perf_counter() - started)
+
+async def ingest_broadcast(sessions: Dict[str, WebSocketSession], owned_devices: Dict[str, List[str]],
+                           updates_per_client: int) -> dict:
+    """Each client sends fixes for its own devices; the fix's `time` field carries an id to match deliveries."""
+    for session in sessions.values():
+        while not session.incoming.empty():
+            session.incoming.get_nowait()
+
+    sent_at: Dict[str, float] = {}
+    latencies: List[float] = []
+
+    async def collect(session: WebSocketSession):
+        while True:
+            message = await session.incoming.get()
+            if message.get('type') == 'device_locations':
+                received = time.perf_counter()
+                for location in message['data']:
+                    if location.get('time') in sent_at:
+                        latencies.append(received - sent_at[location['time']])
+
+    async def send(uuid: str, session: WebSocketSession):
+        devices = owned_devices.get(uuid)
+        if not devices:
+            return
+        for index in range(updates_per_client):
+            update_id = f'{uuid}/{index}'
+            sent_at[update_id] = time.perf_counter()
+            await session.send_json({'type': 'device_location', 'data': {
+                'device_id': devices[index % len(devices)], 'latitude': 59.9 + index * 1e-4, 'longitude': 10.7,
+                'battery': 80, 'speed': 1.2, 'connection_type': 'lte', 'time': update_id}})
+        await session.wait_handled(updates_per_client)
+
+    collectors = [asyncio.create_task(collect(session)) for session in sessions.values()]
+    started = time.perf_counter()
+    await asyncio.gather(*(send(uuid, session) for uuid, session in sessions.items()))
+    seconds = time.perf_counter() - started
+    await asyncio.sleep(0)
+    for collector in collectors:
+        collector.cancel()
+
+    summary = summarize(latencies, seconds)
+    summary['updates'] = len(sent_at)
+    summary['updates_per_s'] = len(sent_at) / seconds if seconds > 0 else 0.0
+    return summary
+
+async def mqtt_ingest(handle_update: Callable, owners: Dict[str, str], trackers: int, tracker_updates: int,
+                      concurrency: int) -> dict:
+    """Trackers publish the four topics of each update through a local broker stand-in into mqtt_handler."""
+    import mqtt_handler
+    from mqtt_replay import handler_publisher
+
+    assembled: List[dict] = []
+    mqtt_handler.backend_callback = assembled.append
+    mqtt_handler.device_buffers.clear()
+    imeis = list(owners)[:trackers]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    handled = 0
+    errors = 0
+
+    publish = handler_publisher()
+
+    async def track(imei: str, offset: int):
+        nonlocal handled, errors
+        for step in range(tracker_updates):
+            async with semaphore:
+                started = time.perf_counter()
+                publish(f'{imei}/Position/latitude', f'{59.5 + offset * 1e-4 + step * 1e-5:.6f}')
+                publish(f'{imei}/Position/longitude', f'{10.5 + step * 1e-5:.6f}')
+                publish(f'{imei}/battery', str(90 - step))
+                publish(f'{imei}/bark', '0')
+                updates = [update for update in assembled if update['payload']['dog']['device_id'] == imei]
+                for update in updates:
+                    assembled.remove(update)
+                    dog = update['payload']['dog']
+                    await handle_update(dict(dog), owners[dog['device_id']])
+                    handled += 1
+                if not updates:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(track(imei, offset) for offset, imei in enumerate(imeis)))
+    finally:
+        mqtt_handler.backend_callback = None
+    seconds = time.perf_counter() - started
+    summary = summarize(latencies, seconds, errors)
+    # Once a tracker's buffer is complete, mqtt_handler dispatches an update on every topic
+    summary['updates'] = handled
+    summary['messages_per_s'] = len(latencies) * 4 / seconds if seconds > 0 else 0.0
+    return summary
+
+async def rest_requests(app, tokens: Dict[str, str], owned_devices: Dict[str, List[str]], requests: int,
+                        concurrency: int) -> Dict[str, dict]:
+    rng = random.Random(RANDOM_SEED)
+    endpoints = {
+        'GET /device_locations': lambda uuid: '/device_locations',
+        'GET /friends': lambda uuid: '/friends',
+        'GET /groups': lambda uuid: '/groups',
+        'GET /devices': lambda uuid: '/devices',
+        'GET /devices/{imei}/locations': lambda uuid: f'/devices/{owned_devices[uuid][0]}/locations?limit=500',
+    }
+    uuids = [uuid for uuid in tokens if owned_devices.get(uuid)]
+    latencies: Dict[str, List[float]] = {name: [] for name in endpoints}
+    errors: Dict[str, int] = {name: 0 for name in endpoints}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://benchmark') as client:
+        async def request(name: str, uuid: str):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(endpoints[name](uuid), headers={'Authorization': f'Bearer {tokens[uuid]}'})
+                latencies[name].append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors[name] += 1
+
+        plan = [(rng.choice(list(endpoints)), rng.choice(uuids)) for _ in range(requests)]
+        started = time.perf_counter()
+        await asyncio.gather(*(request(name, uuid) for name, uuid in plan))
+        seconds = time.perf_counter() - started
+
+    return {f'rest {name}': summarize(samples, seconds, errors[name]) for name, samples in latencies.items()}
+
+
+async def run_benchmark(db_path: str, config: dict) -> Dict[str, dict]:
+    # main checks these when it is imported
+    os.environ.setdefault('BOOTSTRAP_ADMIN_EMAIL', 'admin@load.test')
+    os.environ.setdefault('BOOTSTRAP_ADMIN_PASSWORD', 'benchmark')
+    os.environ.setdefault('PASSWORD_HASH_ROUNDS', '4')
+    # Per message INFO logs would be mostly console output here, set LOG_LEVELS to include them
+    os.environ.setdefault('LOG_LEVELS', 'main=WARNING,mqtt_handler=WARNING')
+    import main
+
+    os.environ[main.DB_PATH_ENV_VAR] = db_path
+
+    users = config['users']
+    clients = min(config['clients'], users)
+    owned_devices: Dict[str, List[str]] = {}
+    for index in range(config['devices']):
+        owned_devices.setdefault(user_id(device_owner_index(index, users)), []).append(device_imei(index))
+    owners = {imei: uuid for uuid, imeis in owned_devices.items() for imei in imeis}
+
+    results = {}
+    async with main.lifespan(main.app):
+        tokens = {user_id(index): main.create_jwt_token(user_id(index)) for index in range(clients)}
+
+        sessions, results['reconnect storm'] = await reconnect_storm(main.app, tokens)
+        results['ingest -> broadcast'] = await ingest_broadcast(sessions, owned_devices, config['updates_per_client'])
+        results['mqtt ingest'] = await mqtt_ingest(main.handle_device_location_update, owners, config['trackers'],
+                                                   config['tracker_updates'], config['concurrency'])
+        results.update(await rest_requests(main.app, tokens, owned_devices, config['requests'], config['concurrency']))
+
+        await asyncio.gather(*(session.close() for session in sessions.values()))
+    return results
+
+
+# Reporting
+def print_results(results: Dict[str, dict]):
+    print(f"{'scenario':<34} {'count':>7} {'err':>5} {'per s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, summary in results.items():
+        print(f"{name:<34} {summary['count']:>7} {summary['errors']:>5} {summary['throughput_per_s']:>9.1f} "
+              f"{summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f} {summary['p99_ms']:>9.2f} {summary['max_ms']:>9.2f}")
+
+def compare(baseline: Dict[str, dict], results: Dict[str, dict], tolerance: float) -> List[str]:
+    """Scenarios whose p95 latency grew, or throughput fell, by more than the tolerance."""
+    regressions = []
+    for name, summary in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if summary['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f} ms -> {summary['p95_ms']:.2f} ms")
+        if summary['throughput_per_s'] < before['throughput_per_s'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput_per_s']:.1f}/s -> {summary['throughput_per_s']:.1f}/s")
+        if summary['errors'] > before['errors']:
+            regressions.append(f"{name}: errors {before['errors']} -> {summary['errors']}")
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--preset', choices=list(PRESETS), default='small')
+    parser.add_argument('--db', help='Seeded database file, reused between runs (default: load-<preset>.db in the temp directory)')
+    for key, value in PRESETS['small'].items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=int, help=f'Override the preset (small: {value})')
+    parser.add_argument('--save-baseline', metavar='PATH', help='Write the results to PATH')
+    parser.add_argument('--compare', metavar='PATH', help='Compare with the baseline at PATH')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression (default 0.2)')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    config = dict(PRESETS[args.preset])
+    for key in config:
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    db_path = args.db or os.path.join(os.environ.get('TMPDIR', '/tmp'), f'load-{args.preset}.db')
+
+    ensure_seeded(db_path, config)
+    results = asyncio.run(run_benchmark(db_path, config))
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as file:
+            json.dump({'config': config, 'results': results}, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if baseline['config'] != config:
+            print(f"Baseline was taken with a different configuration: {baseline['config']}")
+            return 1
+        regressions = compare(baseline['results'], results, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
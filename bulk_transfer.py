@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Streaming bulk export and import of the Dog Tracker database as NDJSON or CSV, one file per table.
+
+    python -m bulk_transfer export --db dog_tracker.db --dir export/ --format ndjson
+    python -m bulk_transfer import --db new.db --dir export/ [--tables users devices] [--on-conflict ignore]
+
+Rows are streamed from the cursor and written in chunks with executemany, so memory use does not
+grow with the table size. On import, secondary indexes of a table are dropped and rebuilt once at the end,
+except unique ones, which --on-conflict needs in place to find the conflicts.
+In CSV files an empty field is NULL.
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from database_manager import DatabaseManager
+
+# In dependency order, so foreign keys are satisfied when importing in this order
+TRANSFER_TABLES = ['users', 'devices', 'device_shares', 'friends', 'groups', 'group_members',
+                   'user_locations', 'device_locations', 'user_location_history']
+# Tables without a rowid are exported in primary key order
+EXPORT_ORDER = {'user_location_history': 'user_id, timestamp'}
+FORMATS = {'ndjson': '.ndjson', 'csv': '.csv'}
+CONFLICT_CLAUSES = {'abort': 'INSERT', 'ignore': 'INSERT OR IGNORE', 'replace': 'INSERT OR REPLACE'}
+DEFAULT_CHUNK_SIZE = 10000
+
+logger = logging.getLogger(__name__)
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+def check_table(table: str):
+    # Table names are interpolated into SQL, only ever accept the known ones
+    if table not in TRANSFER_TABLES:
+        raise ValueError(f"Unknown table {table}")
+
+def format_for_path(path: str) -> str:
+    for format_name, extension in FORMATS.items():
+        if path.endswith(extension):
+            return format_name
+    raise ValueError(f"Cannot tell the format of {path}, expected one of {', '.join(FORMATS.values())}")
+
+
+# Export
+def export_table(conn: sqlite3.Connection, table: str, path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Write every row of a table to path, in the format given by its extension. Returns the row count."""
+    check_table(table)
+    format_name = format_for_path(path)
+    cursor = conn.execute(f'SELECT * FROM "{table}" ORDER BY {EXPORT_ORDER.get(table, "rowid")}')
+    columns = [column[0] for column in cursor.description]
+
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = None
+        if format_name == 'csv':
+            writer = csv.writer(file)
+            writer.writerow(columns)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            if writer:
+                writer.writerows(['' if value is None else value for value in row] for row in rows)
+            else:
+                file.writelines(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+            count += len(rows)
+    return count
+
+def export_database(db_path: str, directory: str, format_name: str = 'ndjson',
+                    tables: Sequence[str] = TRANSFER_TABLES) -> dict:
+    os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    try:
+        counts = {}
+        for table in tables:
+            started = time.perf_counter()
+            counts[table] = export_table(conn, table, os.path.join(directory, f'{table}{FORMATS[format_name]}'))
+            logger.info(f"Exported {counts[table]} rows from {table} in {time.perf_counter() - started:.1f}s")
+        return counts
+    finally:
+        conn.close()
+
+
+# Import
+def read_records(path: str) -> Tuple[List[str], Iterator[tuple]]:
+    """Open an export file, returning its columns and a lazy iterator over its rows."""
+    format_name = format_for_path(path)
+    file = open(path, newline='', encoding='utf-8')
+
+    if format_name == 'csv':
+        reader = csv.reader(file)
+        columns = next(reader, [])
+
+        def csv_rows():
+            with file:
+                for row in reader:
+                    yield tuple(None if value == '' else value for value in row)
+        return columns, csv_rows()
+
+    lines = (line for line in file if line.strip())
+    first = next(lines, None)
+    if first is None:
+        file.close()
+        return [], iter(())
+    first_record = json.loads(first)
+    columns = list(first_record)
+
+    def ndjson_rows():
+        with file:
+            for record in itertools.chain([first_record], (json.loads(line) for line in lines)):
+                yield tuple(record.get(column) for column in columns)
+    return columns, ndjson_rows()
+
+def chunked(rows: Iterable[tuple], chunk_size: int) -> Iterator[List[tuple]]:
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def drop_indexes(conn: sqlite3.Connection, table: str) -> List[str]:
+    """Drop the secondary indexes of a table that are not unique, returning the statements to recreate them."""
+    unique = {row[1] for row in conn.execute(f'PRAGMA index_list("{table}")') if row[2]}
+    indexes = [(name, sql) for name, sql in conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,)).fetchall() if name not in unique]
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+    return [sql for _, sql in indexes]
+
+def import_table(conn: sqlite3.Connection, table: str, path: str, on_conflict: str = 'abort',
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Insert the rows of an export file into a table in one transaction. Indexes are rebuilt after
+    the rows are in, which is much faster than maintaining them row by row. Returns the number of rows
+    inserted, which with on_conflict 'ignore' leaves out the rows skipped.
+    """
+    check_table(table)
+    columns, rows = read_records(path)
+    if not columns:
+        return 0
+    unknown = set(columns) - set(table_columns(conn, table))
+    if unknown:
+        raise ValueError(f"Columns {', '.join(sorted(unknown))} do not exist in {table}")
+
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    placeholders = ', '.join('?' for _ in columns)
+    statement = f'{CONFLICT_CLAUSES[on_conflict]} INTO "{table}" ({column_list}) VALUES ({placeholders})'
+
+    count = 0
+    with conn:
+        # Explicit so dropping the indexes is rolled back too if the import fails
+        conn.execute('BEGIN')
+        index_statements = drop_indexes(conn, table)
+        for chunk in chunked(rows, chunk_size):
+            changes = conn.total_changes
+            conn.executemany(statement, chunk)
+            count += conn.total_changes - changes
+            logger.debug(f"Imported {count} rows into {table}")
+        for index_statement in index_statements:
+            conn.execute(index_statement)
+    return count
+
+def import_database(db_path: str, directory: str, tables: Sequence[str] = TRANSFER_TABLES,
+                    on_conflict: str = 'abort', chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    # Creates the schema when importing into a new file
+    conn = DatabaseManager(logger, db_path).get_connection()
+    # Imports go into a new or backed up file, an import interrupted by a crash is redone from scratch
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -262144')  # 256 MiB
+    try:
+        counts = {}
+        for table in sorted(tables, key=TRANSFER_TABLES.index):
+            path = find_export_file(directory, table)
+            if not path:
+                logger.warning(f"No export of {table} in {directory}, skipping")
+                continue
+            started = time.perf_counter()
+            counts[table] = import_table(conn, table, path, on_conflict, chunk_size)
+            logger.info(f"Imported {counts[table]} rows into {table} in {time.perf_counter() - started:.1f}s")
+        conn.execute('PRAGMA optimize')
+        return counts
+    finally:
+        conn.close()
+
+def find_export_file(directory: str, table: str) -> Optional[str]:
+    for extension in FORMATS.values():
+        path = os.path.join(directory, f'{table}{extension}')
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Export tables to a directory')
+    export_parser.add_argument('--format', choices=list(FORMATS), default='ndjson')
+
+    import_parser = subparsers.add_parser('import', help='Import tables from a directory')
+    import_parser.add_argument('--on-conflict', choices=list(CONFLICT_CLAUSES), default='abort')
+    import_parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    for subparser in (export_parser, import_parser):
+        subparser.add_argument('--db', required=True, help='SQLite database file')
+        subparser.add_argument('--dir', required=True, help='Directory with one file per table')
+        subparser.add_argument('--tables', nargs='+', choices=TRANSFER_TABLES, default=TRANSFER_TABLES)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s: %(name)s (%(levelname)s) %(message)s')
+
+    try:
+        if args.command == 'export':
+            export_database(args.db, args.dir, args.format, args.tables)
+        else:
+            import_database(args.db, args.dir, args.tables, args.on_conflict, args.chunk_size)
+    except (ValueError, sqlite3.Error) as e:
+        logger.error(f"{args.command.capitalize()} failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
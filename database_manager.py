@@ -1,24 +1,55 @@
 
 import sqlite3
 import logging
+from typing import Optional
+
+from query_profiler import ProfiledConnection, QueryProfiler
+from queries import STATEMENT_CACHE_SIZE
+from ingest_dedup import device_time_ms
+
+# Kept in PRAGMA user_version. Version 0 keyed history rows by IMEI and UUID text and stamped them with datetime text,
+# version 1 stored every resend of a fix, version 2 keyed fixes by sequence number alone and parsed device times to the minute.
+SCHEMA_VERSION = 3
+# Tables rebuilt on the migration from version 0, with integer keys for users and devices and epoch millisecond timestamps
+INTEGER_KEY_TABLES = ['users', 'devices', 'user_locations', 'device_locations']
+EPOCH_MS_NOW = "(CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER))"
+
+def epoch_ms_from_text(column: str) -> str:
+    """SQL converting the local datetime text of schema version 0 to epoch milliseconds."""
+    return f"CAST(round((julianday({column}, 'utc') - 2440587.5) * 86400000) AS INTEGER)"
 
 # Database Manager
 class DatabaseManager:
-    def __init__(self, logger: logging.Logger, db_path: str = "dog_tracker.db"):
+    def __init__(self, logger: logging.Logger, db_path: str = "dog_tracker.db", profiler: Optional[QueryProfiler] = None):
         self.logger = logger
         self.db_path = db_path
-        self._connection = sqlite3.connect(db_path)
+        self._connection = sqlite3.connect(db_path, factory=ProfiledConnection, cached_statements=STATEMENT_CACHE_SIZE)
+        self._connection.profiler = profiler
+        if db_path != ':memory:':
+            # Lets backups and other readers on their own connections run alongside the writer
+            self._connection.execute('PRAGMA journal_mode = WAL')
         self.init_database()
 
     def init_database(self):
         """Initialize the database with all required tables."""
         with self._connection:
             cursor = self._connection.cursor()
-            
-            # Users table
+            # The migration and the new tables are committed together or not at all
+            cursor.execute('BEGIN')
+            version = self.schema_version() if self.table_exists('users') else SCHEMA_VERSION
+            migrate = version == 0
+            if migrate:
+                # The old tables move aside without the references of other tables following them
+                cursor.execute('PRAGMA legacy_alter_table = ON')
+                for table in INTEGER_KEY_TABLES:
+                    cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_v0')
+                cursor.execute('PRAGMA legacy_alter_table = OFF')
+
+            # Users table, referenced by uuid except from the location tables
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS users (
-                    uuid TEXT PRIMARY KEY,
+                    id INTEGER PRIMARY KEY,
+                    uuid TEXT UNIQUE NOT NULL,
                     email TEXT UNIQUE NOT NULL,
                     password_hash TEXT NOT NULL,
                     nickname TEXT NOT NULL,
@@ -29,24 +60,41 @@ class DatabaseManager:
             ''')
 
             # User locations table
-            cursor.execute('''
+            cursor.execute(f'''
                 CREATE TABLE IF NOT EXISTS user_locations (
-                    uuid TEXT PRIMARY KEY,
+                    user_id INTEGER PRIMARY KEY,
                     latitude REAL,
                     longitude REAL,
                     altitude REAL,
                     speed REAL,
                     battery INTEGER,
                     accuracy REAL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (uuid) REFERENCES users (uuid)
+                    timestamp INTEGER NOT NULL DEFAULT {EPOCH_MS_NOW},
+                    FOREIGN KEY (user_id) REFERENCES users (id)
                 )
             ''')
             
-            # Devices table
+            # Track history of users who record it (location_history.py), clustered by user and time
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS user_location_history (
+                    user_id INTEGER NOT NULL,
+                    timestamp INTEGER NOT NULL,
+                    latitude REAL NOT NULL,
+                    longitude REAL NOT NULL,
+                    altitude REAL,
+                    speed REAL,
+                    battery INTEGER,
+                    accuracy REAL,
+                    PRIMARY KEY (user_id, timestamp),
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                ) WITHOUT ROWID
+            ''')
+
+            # Devices table, referenced by imei except from the location tables
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS devices (
-                    imei TEXT PRIMARY KEY,
+                    id INTEGER PRIMARY KEY,
+                    imei TEXT UNIQUE NOT NULL,
                     owner_uuid TEXT NOT NULL,
                     name TEXT NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -55,11 +103,11 @@ class DatabaseManager:
                 )
             ''')
             
-            # Device locations table
-            cursor.execute('''
+            # Device locations table, timestamps in epoch milliseconds
+            cursor.execute(f'''
                 CREATE TABLE IF NOT EXISTS device_locations (
                     id INTEGER PRIMARY KEY,
-                    device_id TEXT,
+                    device_id INTEGER NOT NULL,
                     latitude REAL,
                     longitude REAL,
                     altitude REAL,
@@ -72,8 +120,10 @@ class DatabaseManager:
                     lora_rssi INTEGER,
                     connection_type TEXT,
                     time TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (device_id) REFERENCES devices (imei)
+                    timestamp INTEGER NOT NULL DEFAULT {EPOCH_MS_NOW},
+                    seq INTEGER,
+                    device_time INTEGER,
+                    FOREIGN KEY (device_id) REFERENCES devices (id)
                 )
             ''')
             
@@ -128,9 +178,150 @@ class DatabaseManager:
                 )
             ''')
             
+            # Per device, per day rollups of device_locations, maintained on ingest
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS device_daily_stats (
+                    device_id TEXT,
+                    day TEXT,
+                    fix_count INTEGER NOT NULL DEFAULT 0,
+                    distance_m REAL NOT NULL DEFAULT 0,
+                    max_speed REAL,
+                    speed_sum REAL NOT NULL DEFAULT 0,
+                    speed_count INTEGER NOT NULL DEFAULT 0,
+                    bark_count INTEGER NOT NULL DEFAULT 0,
+                    first_battery INTEGER,
+                    first_battery_at REAL,
+                    last_battery INTEGER,
+                    last_battery_at REAL,
+                    last_latitude REAL,
+                    last_longitude REAL,
+                    last_fix_at REAL,
+                    last_connection_type TEXT,
+                    PRIMARY KEY (device_id, day),
+                    FOREIGN KEY (device_id) REFERENCES devices (imei)
+                ) WITHOUT ROWID
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS device_daily_uptime (
+                    device_id TEXT,
+                    day TEXT,
+                    connection_type TEXT,
+                    seconds REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (device_id, day, connection_type),
+                    FOREIGN KEY (device_id) REFERENCES devices (imei)
+                ) WITHOUT ROWID
+            ''')
+
+            # Signed out tokens, by SHA-256 of the token, until they would have expired anyway; shared by all workers
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS revoked_tokens (
+                    token_hash TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+
+            # Written on the primary every second while a read replica is configured, to measure its lag
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS replication_heartbeat (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    at REAL NOT NULL
+                )
+            ''')
+
+            if migrate:
+                self._migrate_to_integer_keys(cursor)
+            if version < 2:
+                self._migrate_to_unique_fixes(cursor, version)
+            elif version == 2:
+                self._migrate_to_device_time_fix_keys(cursor)
+
+            # Indexes for keyset pagination of the admin listings
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at, uuid)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_devices_name ON devices (name, imei)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_devices_created_at ON devices (created_at, imei)')
+
+            # Indexes for the hot lookups; tests/test_query_plans.py checks the queries keep using them
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_device_locations_device_timestamp ON device_locations (device_id, timestamp)')
+            # A resent fix is ignored on insert (ingest_dedup.py), by its sequence number and parsed device time,
+            # or else the device time alone. Sequence numbers start over on a reboot and are no key by themselves.
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_device_locations_device_seq_time ON device_locations '
+                           '(device_id, seq, device_time) WHERE seq IS NOT NULL AND device_time IS NOT NULL')
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_device_locations_device_time ON device_locations (device_id, device_time) '
+                           'WHERE seq IS NULL AND device_time IS NOT NULL')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_devices_owner ON devices (owner_uuid)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_friends_friend ON friends (friend_uuid, status)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_device_shares_shared_with ON device_shares (shared_with_uuid)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_group_members_user ON group_members (user_uuid)')
+
+            cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
             self._connection.commit()
             self.logger.info("Database initialized successfully")
 
+    def _migrate_to_integer_keys(self, cursor: sqlite3.Cursor):
+        """Copy the renamed version 0 tables into the new ones and drop them."""
+        user_columns = 'uuid, email, password_hash, nickname, created_at, last_seen, role'
+        cursor.execute(f'INSERT INTO users ({user_columns}) SELECT {user_columns} FROM users_v0 ORDER BY rowid')
+        device_columns = 'imei, owner_uuid, name, created_at, last_seen'
+        cursor.execute(f'INSERT INTO devices ({device_columns}) SELECT {device_columns} FROM devices_v0 ORDER BY rowid')
+        cursor.execute(f'''
+            INSERT INTO user_locations (user_id, latitude, longitude, altitude, speed, battery, accuracy, timestamp)
+            SELECT u.id, ul.latitude, ul.longitude, ul.altitude, ul.speed, ul.battery, ul.accuracy,
+                   COALESCE({epoch_ms_from_text('ul.timestamp')}, {EPOCH_MS_NOW})
+            FROM user_locations_v0 ul
+            JOIN users u ON u.uuid = ul.uuid
+        ''')
+        fix_columns = ('latitude, longitude, altitude, speed, battery, battery_mv, bark, satellites, '
+                       'lte_signal, lora_rssi, connection_type, time')
+        # Fixes of devices that no longer exist have nothing to be keyed by and are dropped
+        cursor.execute(f'''
+            INSERT INTO device_locations (id, device_id, {fix_columns}, timestamp)
+            SELECT dl.id, d.id, {', '.join(f'dl.{column}' for column in fix_columns.split(', '))},
+                   COALESCE({epoch_ms_from_text('dl.timestamp')}, {EPOCH_MS_NOW})
+            FROM device_locations_v0 dl
+            JOIN devices d ON d.imei = dl.device_id
+            ORDER BY dl.id
+        ''')
+        for table in INTEGER_KEY_TABLES:
+            cursor.execute(f'DROP TABLE {table}_v0')
+        self.logger.info(f"Migrated {', '.join(INTEGER_KEY_TABLES)} to schema version {SCHEMA_VERSION}")
+
+    def _migrate_to_unique_fixes(self, cursor: sqlite3.Cursor, version: int):
+        """
+        Add the dedup key columns and keep only the first stored copy of each resent fix.
+        Only fixes whose device time parses as a full date and time can be told to be resends.
+        """
+        if version == 1:
+            cursor.execute('ALTER TABLE device_locations ADD COLUMN seq INTEGER')
+            cursor.execute('ALTER TABLE device_locations ADD COLUMN device_time INTEGER')
+        # Parsed by the same function as on ingest
+        self._connection.create_function('device_time_ms', 1, device_time_ms, deterministic=True)
+        cursor.execute('UPDATE device_locations SET device_time = device_time_ms(time) WHERE time IS NOT NULL')
+        cursor.execute('''
+            DELETE FROM device_locations
+            WHERE device_time IS NOT NULL AND id NOT IN (
+                SELECT MIN(id) FROM device_locations WHERE device_time IS NOT NULL GROUP BY device_id, device_time
+            )
+        ''')
+        self.logger.info(f"Removed {cursor.rowcount} resent fixes from device_locations, schema version {SCHEMA_VERSION}")
+
+    def _migrate_to_device_time_fix_keys(self, cursor: sqlite3.Cursor):
+        """
+        Drop the version 2 index keying fixes by sequence number alone, and parse device times again,
+        as ones to the minute no longer count. Fixes it dropped or removed as resends are not restored.
+        """
+        cursor.execute('DROP INDEX IF EXISTS idx_device_locations_device_seq')
+        self._connection.create_function('device_time_ms', 1, device_time_ms, deterministic=True)
+        cursor.execute('UPDATE device_locations SET device_time = device_time_ms(time) WHERE device_time IS NOT NULL')
+        self.logger.info(f"Rekeyed resent fixes by device time, schema version {SCHEMA_VERSION}")
+
+    def schema_version(self) -> int:
+        return self._connection.execute('PRAGMA user_version').fetchone()[0]
+
+    def table_exists(self, table: str) -> bool:
+        return self._connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                        (table,)).fetchone() is not None
+
     def get_connection(self):
         """Get a database connection."""
         return self._connection
@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+LOW_BATTERY_PERCENT = 20
+WEAK_LTE_SIGNAL = -105  # dBm
+WEAK_LORA_RSSI = -115  # dBm
+STALE_AFTER_SECONDS = 24 * 60 * 60
+BATTERY_BUCKET_SIZE = 10
+
+
+@dataclass(slots=True)
+class DeviceSnapshot:
+    battery: Optional[int] = None
+    connection_type: Optional[str] = None
+    lte_signal: Optional[int] = None
+    lora_rssi: Optional[int] = None
+    last_seen: Optional[float] = None  # epoch seconds
+
+
+def battery_bucket(battery: Optional[int]) -> str:
+    if battery is None:
+        return 'unknown'
+    low = min(max(int(battery), 0) // BATTERY_BUCKET_SIZE * BATTERY_BUCKET_SIZE, 100 - BATTERY_BUCKET_SIZE)
+    return f'{low}-{low + BATTERY_BUCKET_SIZE}'
+
+def has_weak_signal(snapshot: DeviceSnapshot) -> bool:
+    return ((snapshot.lte_signal is not None and snapshot.lte_signal < WEAK_LTE_SIGNAL) or
+            (snapshot.lora_rssi is not None and snapshot.lora_rssi < WEAK_LORA_RSSI))
+
+
+# Fleet Stats
+class FleetStats:
+    """
+    Fleet health aggregates kept up to date on every ingested location, so reading
+    them never scans device_locations.
+    """
+
+    def __init__(self):
+        # Ordered by last_seen, least recently seen first, so stale devices are always at the front
+        self._devices: OrderedDict[str, DeviceSnapshot] = OrderedDict()
+        self._by_connection_type: Counter = Counter()
+        self._battery_histogram: Counter = Counter()
+        self._low_battery: set = set()
+        self._weak_signal: set = set()
+        self._lock = threading.Lock()
+
+    def _add(self, imei: str, snapshot: DeviceSnapshot):
+        self._devices[imei] = snapshot
+        self._by_connection_type[snapshot.connection_type or 'unknown'] += 1
+        self._battery_histogram[battery_bucket(snapshot.battery)] += 1
+        if snapshot.battery is not None and snapshot.battery < LOW_BATTERY_PERCENT:
+            self._low_battery.add(imei)
+        if has_weak_signal(snapshot):
+            self._weak_signal.add(imei)
+
+    def _remove(self, imei: str) -> Optional[DeviceSnapshot]:
+        snapshot = self._devices.pop(imei, None)
+        if snapshot is None:
+            return None
+        self._by_connection_type[snapshot.connection_type or 'unknown'] -= 1
+        self._battery_histogram[battery_bucket(snapshot.battery)] -= 1
+        self._low_battery.discard(imei)
+        self._weak_signal.discard(imei)
+        return snapshot
+
+    def load(self, snapshots: Dict[str, DeviceSnapshot]):
+        """Replace all state, used once at startup with the latest known state of every device."""
+        with self._lock:
+            self._devices.clear()
+            self._by_connection_type.clear()
+            self._battery_histogram.clear()
+            self._low_battery.clear()
+            self._weak_signal.clear()
+            for imei, snapshot in sorted(snapshots.items(), key=lambda item: item[1].last_seen or 0):
+                self._add(imei, snapshot)
+
+    def add_device(self, imei: str):
+        """Register a device that has not reported yet."""
+        with self._lock:
+            if imei not in self._devices:
+                self._add(imei, DeviceSnapshot())
+                self._devices.move_to_end(imei, last=False)
+
+    def remove_device(self, imei: str):
+        with self._lock:
+            self._remove(imei)
+
+    def record_location(self, imei: str, battery: Optional[int], connection_type: Optional[str],
+                        lte_signal: Optional[int], lora_rssi: Optional[int], seen_at: Optional[float] = None):
+        """Update the aggregates with a newly ingested location."""
+        with self._lock:
+            self._remove(imei)
+            self._add(imei, DeviceSnapshot(battery, connection_type, lte_signal, lora_rssi, seen_at or time.time()))
+
+    def stale_devices(self, now: Optional[float] = None, limit: int = 100) -> List[str]:
+        cutoff = (now or time.time()) - STALE_AFTER_SECONDS
+        stale = []
+        with self._lock:
+            for imei, snapshot in self._devices.items():
+                if len(stale) >= limit or (snapshot.last_seen is not None and snapshot.last_seen >= cutoff):
+                    break
+                stale.append(imei)
+        return stale
+
+    def summary(self, limit: int = 100) -> dict:
+        stale = self.stale_devices(limit=limit)
+        with self._lock:
+            return {
+                'device_count': len(self._devices),
+                'by_connection_type': {key: count for key, count in self._by_connection_type.items() if count},
+                'battery_histogram': {key: count for key, count in sorted(self._battery_histogram.items()) if count},
+                'low_battery_count': len(self._low_battery),
+                'low_battery': sorted(self._low_battery)[:limit],
+                'weak_signal_count': len(self._weak_signal),
+                'weak_signal': sorted(self._weak_signal)[:limit],
+                'stale': stale,
+            }
@@ -0,0 +1,69 @@
+"""
+Deduplication of resent device fixes on ingest.
+Trackers and phones resend a fix they got no acknowledgement for, so the same fix can arrive several times.
+A fix is identified by its device, the sequence number the client gave it and the device's own `time` of the fix,
+or without a sequence number by the device time alone. `time` is free text, often just a clock time repeating
+every day, so it is only a key once parsed as a full date and time to the second, and is stored parsed as
+device_time. The keys of recent fixes are held in a bounded set, so most resends are dropped before the database;
+device_locations has unique indexes on the keys with a device time for resends the set has forgotten. Sequence
+counters start over when a tracker reboots or wraps, so a sequence number is never a key on its own in the
+database. Fixes with neither are always stored.
+"""
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Optional, Tuple
+
+from models import to_epoch_ms
+
+DEFAULT_RECENT_FIX_KEYS = 100_000
+
+FixKey = Tuple[Any, ...]
+
+
+def sequence_number(value: Any) -> Optional[int]:
+    """A client sequence number, None unless it is an integer."""
+    return value if isinstance(value, int) and not isinstance(value, bool) else None
+
+def device_time_ms(value: Any) -> Optional[int]:
+    """
+    Epoch milliseconds of a device time with a date and a time of day to the second, like '2025-01-01T12:00:00Z',
+    None for anything else. Device times without an offset are UTC, as GPS receivers report them.
+    """
+    # A date alone, a clock time or a time to the minute does not identify one fix
+    if not isinstance(value, str) or len(value) < 19 or value[10] not in 'T ':
+        return None
+    try:
+        parsed = datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+    except ValueError:
+        return None
+    return to_epoch_ms(parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc))
+
+def fix_key(device_id: str, fix: dict) -> Optional[FixKey]:
+    """The identity of a fix, None when it has neither a sequence number nor a full device time to be told apart by."""
+    at_ms = device_time_ms(fix.get('time'))
+    if fix.get('seq') is not None:
+        return (device_id, 'seq', fix['seq'], at_ms)
+    if at_ms is not None:
+        return (device_id, 'time', at_ms)
+    return None
+
+
+# Recent Keys
+class RecentKeys:
+    """The last `max_size` keys added, forgetting the oldest first. Adding a key again makes it the newest."""
+
+    def __init__(self, max_size: int = DEFAULT_RECENT_FIX_KEYS):
+        self.max_size = max_size
+        self._keys: OrderedDict = OrderedDict()
+
+    def __contains__(self, key) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key):
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        if len(self._keys) > self.max_size:
+            self._keys.popitem(last=False)
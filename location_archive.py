@@ -0,0 +1,267 @@
+"""
+Columnar archive of cold device location history.
+Fixes older than a threshold are moved out of SQLite into compressed Arrow IPC files,
+one per device and month, which the history API reads back through memory maps. Files are
+written in record batches of ARCHIVE_BATCH_ROWS fixes, and reads decompress and filter one batch
+at a time, stopping once past the window or the limit, so a read never holds a whole partition.
+Requires pyarrow (`pip install pyarrow`); without it the archive is disabled.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from database_manager import DatabaseManager
+from models import from_epoch_ms, to_epoch_ms
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+    pc = None
+
+# Every device_locations column, in table order. Archived fixes hold the device's IMEI as device_id
+# and naive local times, as the first schema did, so older files stay readable.
+LOCATION_COLUMNS = ['id', 'device_id', 'latitude', 'longitude', 'altitude', 'speed', 'battery', 'battery_mv',
+                    'bark', 'satellites', 'lte_signal', 'lora_rssi', 'connection_type', 'time', 'timestamp']
+STORED_COLUMNS = [column for column in LOCATION_COLUMNS if column != 'device_id']
+ARCHIVE_FILE_SUFFIX = '.arrow'
+ARCHIVE_COMPRESSION = 'zstd'
+ARCHIVE_BATCH_ROWS = 10_000
+
+
+def archive_available() -> bool:
+    return pa is not None
+
+def archive_schema() -> 'pa.Schema':
+    return pa.schema([
+        ('id', pa.int64()),
+        ('device_id', pa.string()),
+        ('latitude', pa.float64()),
+        ('longitude', pa.float64()),
+        ('altitude', pa.float64()),
+        ('speed', pa.float64()),
+        ('battery', pa.int32()),
+        ('battery_mv', pa.int32()),
+        ('bark', pa.int32()),
+        ('satellites', pa.int32()),
+        ('lte_signal', pa.int32()),
+        ('lora_rssi', pa.int32()),
+        ('connection_type', pa.string()),
+        ('time', pa.string()),
+        ('timestamp', pa.timestamp('us')),
+    ])
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+def next_month(value: datetime) -> datetime:
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+def months_between(start: datetime, end: datetime) -> List[str]:
+    """Names of the monthly partitions overlapping [start, end)."""
+    months = []
+    current = month_start(start)
+    while current < end:
+        months.append(current.strftime('%Y-%m'))
+        current = next_month(current)
+    return months
+
+
+# Location Archive
+class LocationArchive:
+    """Reads and writes the per device, per month archive files under `root`."""
+
+    def __init__(self, root: str):
+        if not archive_available():
+            raise RuntimeError("pyarrow is required for the location archive")
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def device_path(self, device_id: str) -> str:
+        # Device ids come from users, quote them so they can never escape the archive directory
+        return os.path.join(self.root, f'device={quote(device_id, safe="")}')
+
+    def partition_path(self, device_id: str, month: str) -> str:
+        return os.path.join(self.device_path(device_id), f'{month}{ARCHIVE_FILE_SUFFIX}')
+
+    def _read_table(self, path: str) -> 'pa.Table':
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).read_all()
+
+    def _read_batches(self, path: str) -> Iterator['pa.RecordBatch']:
+        """The record batches of a file in order, each decompressed only once it is reached."""
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for index in range(reader.num_record_batches):
+                yield reader.get_batch(index)
+
+    def write_partition(self, device_id: str, month: str, rows: List[tuple]):
+        """
+        Add rows (in LOCATION_COLUMNS order) to a partition. The file is replaced atomically and rows
+        already archived, e.g. by a run that crashed before deleting them from SQLite, are not duplicated.
+        """
+        schema = archive_schema()
+        columns = list(zip(*rows)) if rows else [[] for _ in LOCATION_COLUMNS]
+        # SQLite columns are loosely typed, convert what was stored rather than reject it.
+        # Timestamps may be datetimes or their text.
+        arrays = [pa.array(column).cast(field.type, safe=False) for column, field in zip(columns, schema)]
+        table = pa.Table.from_arrays(arrays, schema=schema)
+
+        path = self.partition_path(device_id, month)
+        if os.path.exists(path):
+            existing = self._read_table(path)
+            new_rows = table.filter(pc.invert(pc.is_in(table['id'], value_set=existing['id'])))
+            table = pa.concat_tables([existing, new_rows])
+        table = table.sort_by([('timestamp', 'ascending'), ('id', 'ascending')])
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.tmp'
+        options = pa.ipc.IpcWriteOptions(compression=ARCHIVE_COMPRESSION)
+        with pa.OSFile(temp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, schema, options=options) as writer:
+                writer.write_table(table, max_chunksize=ARCHIVE_BATCH_ROWS)
+        with open(temp_path, 'rb') as file:
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+
+    def read(self, device_id: str, start: datetime, end: datetime, limit: Optional[int] = None) -> List[dict]:
+        """
+        Archived fixes of a device in [start, end), oldest first and at most `limit` of them,
+        as dicts like rows of device_locations.
+        """
+        locations = []
+        start_scalar, end_scalar = pa.scalar(start, pa.timestamp('us')), pa.scalar(end, pa.timestamp('us'))
+        for month in months_between(start, end):
+            path = self.partition_path(device_id, month)
+            if not os.path.exists(path):
+                continue
+            for batch in self._read_batches(path):
+                timestamps = batch.column('timestamp')
+                mask = pc.and_(pc.greater_equal(timestamps, start_scalar), pc.less(timestamps, end_scalar))
+                for location in batch.filter(mask).to_pylist():
+                    # Like the fields of repository.HISTORY_FIELDS. Archived timestamps are naive local time,
+                    # so a fix in the hour repeated when clocks go back is taken as the first of the two.
+                    location['timestamp_ms'] = to_epoch_ms(location['timestamp'])
+                    location['timestamp'] = location['timestamp'].isoformat(sep=' ', timespec='milliseconds')
+                    locations.append(location)
+                    if limit is not None and len(locations) >= limit:
+                        return locations
+                # Partitions are sorted by timestamp, the batches after this one are past the window
+                last = pc.max(timestamps).as_py()
+                if last is not None and last >= end:
+                    return locations
+        return locations
+
+    def remove_device(self, device_id: str):
+        shutil.rmtree(self.device_path(device_id), ignore_errors=True)
+
+
+# Location Archiver
+class LocationArchiver:
+    """
+    Periodically moves fixes older than `archive_after` from device_locations into the archive.
+    The latest fix of every device always stays in SQLite, it is the device's current location.
+    """
+
+    def __init__(self, archive: LocationArchive, db_manager: DatabaseManager, logger: logging.Logger,
+                 archive_after: timedelta, interval_seconds: float = 60 * 60):
+        self.archive = archive
+        self.db_manager = db_manager
+        self.logger = logger
+        self.archive_after = archive_after
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._connection: Optional[sqlite3.Connection] = None
+
+    async def _in_thread(self, func, *args):
+        """
+        Run a query off the event loop on the archiver's own connection. An in-memory database
+        is only reachable through the shared connection, and is queried inline.
+        """
+        if self.db_manager.db_path == ':memory:':
+            return func(self.db_manager.get_connection(), *args)
+        if self._connection is None:
+            # Used by one worker thread at a time, the archiver runs partitions one after another
+            self._connection = sqlite3.connect(self.db_manager.db_path, check_same_thread=False)
+        return await asyncio.to_thread(func, self._connection, *args)
+
+    def _cold_partitions(self, conn: sqlite3.Connection, cutoff: datetime) -> List[Tuple[str, int, str]]:
+        """The IMEI, key and local month of every device and month with fixes before the cutoff."""
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT DISTINCT d.imei, d.id, strftime('%Y-%m', dl.timestamp / 1000, 'unixepoch', 'localtime')
+            FROM device_locations dl
+            JOIN devices d ON d.id = dl.device_id
+            WHERE dl.timestamp < ?
+            ORDER BY 1, 3
+        ''', (to_epoch_ms(cutoff),))
+        return cursor.fetchall()
+
+    def _partition_filter(self, device_key: int, month: str, cutoff: datetime) -> Tuple[str, tuple]:
+        start = datetime.strptime(month, '%Y-%m')
+        end = min(next_month(start), cutoff)
+        where = '''
+            device_id = ? AND timestamp >= ? AND timestamp < ?
+            AND id != (SELECT id FROM device_locations WHERE device_id = ? ORDER BY timestamp DESC LIMIT 1)
+        '''
+        return where, (device_key, to_epoch_ms(start), to_epoch_ms(end), device_key)
+
+    def _select_partition(self, conn: sqlite3.Connection, device_id: str, where: str, params: tuple) -> List[tuple]:
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT {", ".join(STORED_COLUMNS)} FROM device_locations WHERE {where}', params)
+        return [(row[0], device_id, *row[1:-1], from_epoch_ms(row[-1])) for row in cursor.fetchall()]
+
+    def _delete_partition(self, conn: sqlite3.Connection, where: str, params: tuple, last_id: int):
+        with conn:
+            conn.execute(f'DELETE FROM device_locations WHERE {where} AND id <= ?', params + (last_id,))
+
+    async def archive_partition(self, device_id: str, device_key: int, month: str, cutoff: datetime) -> int:
+        """Archive the fixes of a device (its IMEI and devices.id) in a local month before the cutoff."""
+        where, params = self._partition_filter(device_key, month, cutoff)
+        rows = await self._in_thread(self._select_partition, device_id, where, params)
+        if not rows:
+            return 0
+
+        # The file is durable before the rows are deleted, a crash in between only repeats the work
+        await asyncio.to_thread(self.archive.write_partition, device_id, month, rows)
+        await self._in_thread(self._delete_partition, where, params, max(row[0] for row in rows))
+        return len(rows)
+
+    async def run_once(self, now: Optional[datetime] = None) -> int:
+        """Archive everything older than the threshold, returning the number of fixes moved."""
+        cutoff = (now or datetime.now()) - self.archive_after
+        archived = 0
+        for device_id, device_key, month in await self._in_thread(self._cold_partitions, cutoff):
+            try:
+                archived += await self.archive_partition(device_id, device_key, month, cutoff)
+            except Exception as e:
+                self.logger.error(f"Error archiving locations of device {device_id} for {month}: {e}")
+        if archived:
+            self.logger.info(f"Archived {archived} locations older than {cutoff.isoformat(sep=' ')}")
+        return archived
+
+    async def _run(self):
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,75 @@
+"""
+Optional track history of users' phones, so a walk can be shown and replayed next to the dog's.
+Phones report far more often than a track needs, so fixes are downsampled on ingest: a fix is stored when it is
+far enough in time or distance from the last one stored for the user. Replays merge the user's and a device's
+fixes into one timeline and send it at an accelerated pace. Both are ordered and timed by the fixes'
+epoch milliseconds, `timestamp_ms`, since local time text repeats an hour when clocks go back.
+"""
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from geo import haversine_distance_m
+from models import to_epoch_ms
+
+DEFAULT_MIN_INTERVAL_SECONDS = 15
+DEFAULT_MIN_DISTANCE_M = 20
+# Long pauses in a track are shortened to this many seconds of replay, whatever the speed
+REPLAY_MAX_GAP_SECONDS = 2.0
+
+
+# Track Downsampler
+class TrackDownsampler:
+    """
+    Keeps a fix when it is at least `min_interval_seconds` after the last kept fix of its track
+    or at least `min_distance_m` away from it. Only the last kept fix of each track is held in memory.
+    """
+
+    def __init__(self, min_interval_seconds: float = DEFAULT_MIN_INTERVAL_SECONDS,
+                 min_distance_m: float = DEFAULT_MIN_DISTANCE_M):
+        self.min_interval_ms = min_interval_seconds * 1000
+        self.min_distance_m = min_distance_m
+        self._last_kept: Dict[str, Tuple[int, float, float]] = {}
+
+    def keep(self, track: str, latitude: Optional[float], longitude: Optional[float], at: datetime) -> bool:
+        """Whether to store a fix of `track`, remembering it as the last kept one if so. Fixes without a position are not."""
+        if latitude is None or longitude is None:
+            return False
+        at_ms = to_epoch_ms(at)
+        last = self._last_kept.get(track)
+        if last is not None:
+            last_ms, last_latitude, last_longitude = last
+            # A fix older than the last kept one is out of order and would not extend the track
+            if at_ms < last_ms:
+                return False
+            if (at_ms - last_ms < self.min_interval_ms and
+                    haversine_distance_m(last_latitude, last_longitude, latitude, longitude) < self.min_distance_m):
+                return False
+        self._last_kept[track] = (at_ms, latitude, longitude)
+        return True
+
+    def forget(self, track: str):
+        self._last_kept.pop(track, None)
+
+
+# Replay
+def merge_tracks(tracks: Dict[str, List[dict]]) -> List[Tuple[str, dict]]:
+    """The fixes of named tracks in one timeline of (track name, fix), oldest first."""
+    timeline = [(name, fix) for name, fixes in tracks.items() for fix in fixes]
+    timeline.sort(key=lambda item: item[1]['timestamp_ms'])
+    return timeline
+
+async def replay(timeline: List[Tuple[str, dict]], speed: float, send: Callable[[str, dict], Awaitable[None]],
+                 max_gap_seconds: float = REPLAY_MAX_GAP_SECONDS) -> int:
+    """
+    Send every fix of a timeline, waiting between fixes for the time between them divided by `speed`,
+    at most `max_gap_seconds`. Returns the number of fixes sent.
+    """
+    previous_ms = None
+    for name, fix in timeline:
+        at_ms = fix['timestamp_ms']
+        if previous_ms is not None:
+            await asyncio.sleep(min((at_ms - previous_ms) / 1000 / speed, max_gap_seconds))
+        previous_ms = at_ms
+        await send(name, fix)
+    return len(timeline)
@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+from typing import Iterator, List, Optional, Tuple
+
+LOG_LEVEL_NAMES = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
+READ_BLOCK_SIZE = 64 * 1024
+
+
+# Line Filter
+class LineFilter:
+    """Matches log lines by minimum level and substring, for both JSON and plain text lines."""
+
+    def __init__(self, min_level: Optional[str] = None, contains: Optional[str] = None):
+        self.contains = contains
+        self.levels = None
+        self.level_markers = None
+        if min_level:
+            min_levelno = logging.getLevelName(min_level.upper())
+            if not isinstance(min_levelno, int):
+                raise ValueError(f"Unknown log level {min_level}")
+            self.levels = {name for name in LOG_LEVEL_NAMES if logging.getLevelName(name) >= min_levelno}
+            # The old text format, '2025-01-01 00:00:00,000: main (INFO) message'
+            self.level_markers = [f'({name})' for name in self.levels]
+
+    def matches(self, line: str) -> bool:
+        if self.contains and self.contains not in line:
+            return False
+        if not self.levels:
+            return True
+        if line.startswith('{'):
+            return self._level(line) in self.levels
+        return any(marker in line for marker in self.level_markers)
+
+    @staticmethod
+    def _level(line: str) -> Optional[str]:
+        """The level field of a JsonFormatter line, so a message mentioning a level does not count."""
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        return entry.get('level') if isinstance(entry, dict) else None
+
+
+def rotated_log_paths(path: str, backup_count: int) -> List[str]:
+    """The log file followed by its rotated backups, newest first."""
+    return [path] + [f'{path}.{index}' for index in range(1, backup_count + 1)]
+
+def _reverse_lines(path: str, end: Optional[int] = None) -> Iterator[bytes]:
+    """Yield the lines of a file from the last to the first, reading blocks from the end."""
+    with open(path, 'rb') as file:
+        position = file.seek(0, os.SEEK_END) if end is None else end
+        remainder = b''
+        while position > 0:
+            read_size = min(READ_BLOCK_SIZE, position)
+            position -= read_size
+            file.seek(position)
+            lines = (file.read(read_size) + remainder).split(b'\n')
+            remainder = lines[0]
+            yield from reversed(lines[1:])
+        yield remainder
+
+def tail_lines(paths: List[str], count: int, line_filter: LineFilter, end: Optional[int] = None) -> List[str]:
+    """
+    Get the last `count` matching lines, continuing into older files in `paths` when needed.
+    `end` limits how much of the first (current) file is read.
+    """
+    if count <= 0:
+        return []
+    matched = []
+    for index, path in enumerate(paths):
+        if not os.path.exists(path):
+            continue
+        for raw_line in _reverse_lines(path, end if index == 0 else None):
+            line = raw_line.decode('utf-8', errors='replace').rstrip('\r')
+            if line and line_filter.matches(line):
+                matched.append(line)
+                if len(matched) >= count:
+                    return matched[::-1]
+    return matched[::-1]
+
+def read_lines_from_offset(path: str, offset: int, limit: int) -> Tuple[List[str], int]:
+    """Read complete lines starting at byte offset, up to about `limit` bytes. Returns the lines and the next offset."""
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        data = file.read(limit)
+
+    if not data:
+        return [], offset
+
+    last_newline = data.rfind(b'\n')
+    if last_newline != -1:
+        data = data[:last_newline + 1]
+    elif len(data) < limit:
+        # A partial line still being written, wait for the rest
+        return [], offset
+
+    lines = [line.rstrip('\r') for line in data.decode('utf-8', errors='replace').split('\n') if line]
+    return lines, offset + len(data)
+
+
+# Log Follower
+class LogFollower:
+    """Tracks a read offset in a log file and returns lines appended since, following rotation to `.1`."""
+
+    def __init__(self, path: str, offset: Optional[int] = None, read_limit: int = 1024 * 1024):
+        self.path = path
+        self.read_limit = read_limit
+        try:
+            stat = os.stat(path)
+            self.inode = stat.st_ino
+            self.offset = stat.st_size if offset is None else offset
+        except FileNotFoundError:
+            self.inode = None
+            self.offset = 0
+
+    def _read_to_end(self, path: str, offset: int) -> Tuple[List[str], int]:
+        lines = []
+        while True:
+            new_lines, next_offset = read_lines_from_offset(path, offset, self.read_limit)
+            lines.extend(new_lines)
+            if next_offset == offset:
+                return lines, offset
+            offset = next_offset
+
+    def read_new_lines(self) -> List[str]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+
+        lines = []
+        if stat.st_ino != self.inode:
+            # The file we were reading was rotated, finish it before starting on the new one
+            rotated_path = f'{self.path}.1'
+            if self.inode is not None and os.path.exists(rotated_path) and os.stat(rotated_path).st_ino == self.inode:
+                lines, _ = self._read_to_end(rotated_path, self.offset)
+            self.inode = stat.st_ino
+            self.offset = 0
+        elif stat.st_size < self.offset:
+            # Truncated in place
+            self.offset = 0
+
+        new_lines, self.offset = self._read_to_end(self.path, self.offset)
+        return lines + new_lines
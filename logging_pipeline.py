@@ -0,0 +1,126 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Tuple
+
+# Attributes every LogRecord has, anything else was passed through `extra` and is structured data
+_STANDARD_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class CallSiteRateLimitFilter(logging.Filter):
+    """
+    Lets through at most `burst` records per `interval` seconds from each logging call site.
+    Records at `min_unlimited_level` and above always pass. The next record let through from
+    a throttled call site carries the number of dropped records as `suppressed`.
+    """
+
+    def __init__(self, burst: int = 10, interval: float = 1.0, min_unlimited_level: int = logging.WARNING):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.min_unlimited_level = min_unlimited_level
+        self._windows: Dict[Tuple[str, int], List[float]] = {}  # call site -> [window start, count, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.min_unlimited_level:
+            return True
+
+        now = time.monotonic()
+        call_site = (record.pathname, record.lineno)
+        with self._lock:
+            window = self._windows.get(call_site)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[call_site] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = int(suppressed)
+                return True
+
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+
+            window[2] += 1
+            return False
+
+
+def parse_log_levels(spec: Optional[str]) -> Dict[str, int]:
+    """Parse 'logger=LEVEL,other=LEVEL' into a logger name -> level mapping."""
+    levels = {}
+    for part in (spec or '').split(','):
+        if '=' not in part:
+            continue
+        name, level = (item.strip() for item in part.split('=', 1))
+        levels[name] = logging.getLevelName(level.upper())
+    return {name: level for name, level in levels.items() if isinstance(level, int)}
+
+
+# Logging Pipeline
+class LoggingPipeline:
+    """
+    Non-blocking logging: callers only put records on a queue, a listener thread
+    formats them and does the file and console I/O.
+    """
+
+    def __init__(self, handlers: List[logging.Handler], queue_size: int = 10000,
+                 rate_limit_burst: int = 10, rate_limit_interval: float = 1.0):
+        self.queue: queue.Queue = queue.Queue(queue_size)
+        self.queue_handler = _DroppingQueueHandler(self.queue)
+        self.queue_handler.addFilter(CallSiteRateLimitFilter(rate_limit_burst, rate_limit_interval))
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self._started = False
+
+    @property
+    def dropped(self) -> int:
+        return self.queue_handler.dropped
+
+    def install(self, logger: logging.Logger):
+        logger.addHandler(self.queue_handler)
+
+    def start(self):
+        self.listener.start()
+        self._started = True
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._started:
+            self._started = False
+            self.listener.stop()
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Queue handler that drops records instead of blocking when the listener falls behind."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
@@ -15,24 +15,45 @@ Features:
 
 from enum import Enum 
 import asyncio
+import hashlib
 import json
+import math
+import time
 import sqlite3
-import hashlib
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi import Response
 import jwt
 import logging
 from logging.handlers import RotatingFileHandler
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Set
-from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Set, Tuple
 from contextlib import asynccontextmanager
 
 from database_manager import DatabaseManager
+from repository import Repository, SQLiteRepository, DEVICE_FIX_COLUMNS
+from models import DeviceLocation, DeviceLocationType, Friend, Group, IngestResult, UserLocation, to_json
+from read_pool import ReadPool, DEFAULT_READ_CONNECTIONS, DEFAULT_MAX_STALENESS_SECONDS
+from query_profiler import QueryProfiler, DEFAULT_SLOW_QUERY_MS
+from tracing import Tracer, TracedProxy, JsonLinesSpanExporter
+from sampling_profiler import SamplingProfiler
+from logging_pipeline import LoggingPipeline, JsonFormatter, parse_log_levels
+from fleet_stats import FleetStats, DeviceSnapshot
+from rollups import DailyRollups, RollupWorker, Fix, utc_day
+from backup import BackupManager, BackupInProgressError
+from location_archive import LocationArchive, LocationArchiver, archive_available
+from location_history import TrackDownsampler, merge_tracks, replay, DEFAULT_MIN_INTERVAL_SECONDS, DEFAULT_MIN_DISTANCE_M
+from ingest_dedup import RecentKeys, fix_key, sequence_number, DEFAULT_RECENT_FIX_KEYS
+from pagination import MAX_PAGE_SIZE, fetch_keyset_page, estimate_count, prefix_range
+from log_reader import LineFilter, LogFollower, rotated_log_paths, tail_lines, read_lines_from_offset
+from auth_cache import TokenCache, RoleCache
+from password_hashing import PasswordHasher, PasswordHasherBusyError, hash_password
+from rate_limiter import RateLimiter, InMemoryRateLimiterBackend, SQLiteRateLimiterBackend
+from metrics import REGISTRY, Counter, Gauge, Histogram, DEFAULT_SIZE_BUCKETS, timed
 
 from dotenv import load_dotenv
 import os
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, status
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr
@@ -42,6 +63,7 @@ import uvicorn
 JWT_SECRET = "your-secret-key-change-in-production"
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24 * 7  # 7 days
+JWT_CACHE_MAX_SIZE = 10000
 
 ROLE_ADMIN = 'A'
 ROLE_USER = 'U'
@@ -52,39 +74,93 @@ BOOTSTRAP_ADMIN_PASSWORD_ENV_VAR = 'BOOTSTRAP_ADMIN_PASSWORD'
 DB_PATH_ENV_VAR = 'DB_PATH'
 SERVER_HOST_ENV_VAR = 'SERVER_HOST'
 SERVER_PORT_ENV_VAR = 'SERVER_PORT'
+PASSWORD_HASH_ROUNDS_ENV_VAR = 'PASSWORD_HASH_ROUNDS'
+PASSWORD_HASH_WORKERS_ENV_VAR = 'PASSWORD_HASH_WORKERS'
+RATE_LIMIT_DB_PATH_ENV_VAR = 'RATE_LIMIT_DB_PATH'
+LOCATION_ARCHIVE_DIR_ENV_VAR = 'LOCATION_ARCHIVE_DIR'
+LOCATION_ARCHIVE_AFTER_DAYS_ENV_VAR = 'LOCATION_ARCHIVE_AFTER_DAYS'
+BACKUP_DIR_ENV_VAR = 'BACKUP_DIR'
+BACKUP_INTERVAL_HOURS_ENV_VAR = 'BACKUP_INTERVAL_HOURS'
+BACKUP_KEEP_ENV_VAR = 'BACKUP_KEEP'
+DB_READ_CONNECTIONS_ENV_VAR = 'DB_READ_CONNECTIONS'
+DB_READ_REPLICA_PATH_ENV_VAR = 'DB_READ_REPLICA_PATH'
+DB_READ_MAX_STALENESS_SECONDS_ENV_VAR = 'DB_READ_MAX_STALENESS_SECONDS'
+DB_SLOW_QUERY_MS_ENV_VAR = 'DB_SLOW_QUERY_MS'
+TRACE_EXPORT_PATH_ENV_VAR = 'TRACE_EXPORT_PATH'
+TRACE_SAMPLE_RATE_ENV_VAR = 'TRACE_SAMPLE_RATE'
+USER_LOCATION_HISTORY_ENV_VAR = 'USER_LOCATION_HISTORY'
+USER_LOCATION_HISTORY_MIN_INTERVAL_SECONDS_ENV_VAR = 'USER_LOCATION_HISTORY_MIN_INTERVAL_SECONDS'
+USER_LOCATION_HISTORY_MIN_DISTANCE_M_ENV_VAR = 'USER_LOCATION_HISTORY_MIN_DISTANCE_M'
+INGEST_RECENT_FIX_KEYS_ENV_VAR = 'INGEST_RECENT_FIX_KEYS'
+
+# Sign in/up throttling, burst size and sustained requests per minute
+AUTH_RATE_LIMIT_IP_BURST = 20
+AUTH_RATE_LIMIT_IP_PER_MINUTE = 20
+AUTH_RATE_LIMIT_EMAIL_BURST = 5
+AUTH_RATE_LIMIT_EMAIL_PER_MINUTE = 5
 
 PROD_ENV_PATH = "prod.env"
 
 LOG_DIR_PATH = 'logs'
 LOG_FILE_PATH = f'{LOG_DIR_PATH}/dogtracker_backend.log'
+LOG_BACKUP_COUNT = 3
+LOG_READ_LIMIT_BYTES = 1024 * 1024
+# Lines returned by a filtered read of the log without `tail` or `offset`
+LOG_TAIL_DEFAULT_LINES = 1000
+LOG_FOLLOW_POLL_SECONDS = 0.5
+LOG_FOLLOW_KEEPALIVE_SECONDS = 15
+
+DEFAULT_LOCATION_ARCHIVE_AFTER_DAYS = 90
+LOCATION_ARCHIVE_INTERVAL_SECONDS = 60 * 60
+LOCATION_HISTORY_DEFAULT_HOURS = 24
+LOCATION_HISTORY_MAX_FIXES = 10000
+
+# Replays of a walk over the WebSocket, as multiples of real time
+REPLAY_DEFAULT_SPEED = 10
+REPLAY_MAX_SPEED = 3600
+
+DEFAULT_BACKUP_DIR = 'backups'
+DEFAULT_BACKUP_KEEP = 24
+
+# Bounds of an on demand sampling profile
+PROFILE_MAX_SECONDS = 60
+PROFILE_MIN_INTERVAL_MS = 1
+PROFILE_MAX_INTERVAL_MS = 1000
+
 
+LOG_LEVELS_ENV_VAR = 'LOG_LEVELS'
+DEFAULT_LOG_LEVELS = {'main': logging.INFO, 'mqtt_handler': logging.INFO}
+
+log_pipeline = None
 
 def create_and_configure_logger():
+    global log_pipeline
     os.makedirs(LOG_DIR_PATH, exist_ok=True)
 
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging.INFO)
-
     max_log_size_in_mb = 10
-    file_handler = RotatingFileHandler(LOG_FILE_PATH, maxBytes=max_log_size_in_mb*1000000, backupCount=3)
+    file_handler = RotatingFileHandler(LOG_FILE_PATH, maxBytes=max_log_size_in_mb*1000000, backupCount=LOG_BACKUP_COUNT)
+    file_handler.setFormatter(JsonFormatter())
 
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(logging.Formatter('%(asctime)s: %(name)s (%(levelname)s) %(message)s'))
 
-    formatter = logging.Formatter('%(asctime)s: %(name)s (%(levelname)s) %(message)s')
+    # File and console I/O happen on the pipeline's listener thread, never on the event loop
+    log_pipeline = LoggingPipeline([file_handler, console_handler])
+    log_pipeline.install(logging.getLogger())
+    log_pipeline.start()
 
-    file_handler.setFormatter(formatter)
-    console_handler.setFormatter(formatter)
+    # Per subsystem levels, e.g. LOG_LEVELS="main=DEBUG,mqtt_handler=WARNING"
+    levels = {**DEFAULT_LOG_LEVELS, **parse_log_levels(os.getenv(LOG_LEVELS_ENV_VAR))}
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
 
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    return logging.getLogger(__name__)
 
-    return logger
+load_dotenv(dotenv_path=PROD_ENV_PATH)
 
 logger = create_and_configure_logger()
 
-load_dotenv(dotenv_path=PROD_ENV_PATH)
-
 if not os.getenv(BOOTSTRAP_ADMIN_EMAIL_ENV_VAR):
     logger.error(f"{BOOTSTRAP_ADMIN_EMAIL_ENV_VAR} not defined in {PROD_ENV_PATH}, exiting")
     exit(1)
@@ -96,95 +172,50 @@ if not os.getenv(BOOTSTRAP_ADMIN_PASSWORD_ENV_VAR):
 # Security
 security = HTTPBearer()
 
+# Metrics
+HTTP_REQUEST_SECONDS = Histogram('dogtracker_http_request_seconds', 'REST request latency by route', ['method', 'route', 'status'])
+DB_QUERY_SECONDS = Histogram('dogtracker_db_query_seconds', 'Time spent in named database queries', ['query'])
+WEBSOCKET_ACTIVE_SESSIONS = Gauge('dogtracker_websocket_active_sessions', 'Currently connected WebSocket users')
+WEBSOCKET_MESSAGES_RECEIVED = Counter('dogtracker_websocket_messages_received_total', 'WebSocket messages received by type', ['type'])
+WEBSOCKET_MESSAGES_SENT = Counter('dogtracker_websocket_messages_sent_total', 'WebSocket messages sent by type', ['type'])
+WEBSOCKET_SEND_SECONDS = Histogram('dogtracker_websocket_send_seconds', 'Time to serialize and send one WebSocket message')
+BROADCAST_FANOUT = Histogram('dogtracker_broadcast_fanout_recipients', 'Recipients per broadcast', ['target'], buckets=DEFAULT_SIZE_BUCKETS)
+PASSWORD_HASH_PENDING = Gauge('dogtracker_password_hash_pending', 'Password hashing jobs queued or running')
+LOG_QUEUE_DEPTH = Gauge('dogtracker_log_queue_depth', 'Log records waiting to be written')
+LOG_RECORDS_DROPPED = Gauge('dogtracker_log_records_dropped', 'Log records dropped because the log queue was full')
+ROLLUP_QUEUE_DEPTH = Gauge('dogtracker_rollup_queue_depth', 'Fixes waiting to be folded into the daily rollups')
+INGEST_DUPLICATE_FIXES = Counter('dogtracker_ingest_duplicate_fixes_total', 'Resent device fixes dropped, by where they were caught', ['source'])
+LOG_QUEUE_DEPTH.set_function(lambda: log_pipeline.queue.qsize())
+LOG_RECORDS_DROPPED.set_function(lambda: log_pipeline.dropped)
+
+WEBSOCKET_MESSAGE_TYPES = {'user_location', 'device_location', 'replay', 'replay_stop'}
+
 # Database manager will be initialized in startup event
 
 db_manager = None
+query_profiler = None
+read_pool = None
+# Spans are no-ops until on_startup configures an exporter
+tracer = Tracer()
+# The sampling profile currently running, if any
+active_profile = None
+repository = None
+password_hasher = None
+ip_rate_limiter = None
+email_rate_limiter = None
+daily_rollups = None
+rollup_worker = None
+location_archive = None
+location_archiver = None
+backup_manager = None
+# Decides which phone fixes go into the user track history, None when the history is not recorded
+user_track_downsampler = None
+# The running replay of each connected user
+replay_tasks: Dict[str, asyncio.Task] = {}
+# Keys of recently stored device fixes, so resends are dropped before the database
+recent_fix_keys = RecentKeys()
 
 # Data Models
-@dataclass
-class User:
-    uuid: str
-    email: str
-    password_hash: str
-    nickname: str
-    created_at: datetime
-    role: str
-    last_seen: Optional[datetime] = None
-
-@dataclass
-class UserLocation:
-    uuid: str
-    email: str
-    nickname: str
-    latitude: Optional[float]
-    longitude: Optional[float]
-    altitude: Optional[float]
-    speed: Optional[float]
-    battery: Optional[int]
-    accuracy: Optional[float]
-    timestamp: datetime
-
-@dataclass
-class Device:
-    imei: str
-    owner_uuid: str
-    name: str
-    created_at: datetime
-    last_seen: Optional[datetime] = None
-
-class DeviceLocationType(Enum):
-    OWN = 'own'
-    SHARED = 'shared'
-    FRIEND = 'friend'
-    GROUP_MEMBER = 'group_member'
-
-@dataclass
-class DeviceLocation:
-    device_id: str
-    owner_uuid: str
-    owner_email: str
-    owner_nickname: str
-    device_name: str
-    latitude: Optional[float]
-    longitude: Optional[float]
-    altitude: Optional[float]
-    speed: Optional[float]
-    battery: Optional[int]
-    battery_mv: Optional[int]
-    bark: Optional[int]
-    satellites: Optional[int]
-    lte_signal: Optional[int]
-    lora_rssi: Optional[int]
-    connection_type: Optional[str]
-    time: Optional[str]
-    timestamp: datetime
-    type: DeviceLocationType  # 'own', 'shared', 'friend', 'group_member'
-
-@dataclass
-class Friend:
-    uuid: str
-    email: str
-    nickname: str
-    status: str  # 'pending', 'accepted', 'blocked'
-    created_at: datetime
-    request_sent_by: str
-
-@dataclass
-class Group:
-    id: str
-    name: str
-    description: Optional[str]
-    owner_id: str
-    member_ids: List[str]
-    created_at: datetime
-
-@dataclass
-class DeviceShare:
-    device_imei: str
-    owner_uuid: str
-    shared_with_uuid: str
-    created_at: datetime
-
 # Pydantic Models for API
 class SignUpRequest(BaseModel):
     email: EmailStr
@@ -223,6 +254,13 @@ class UpdateDeviceRequest(BaseModel):
 class ShareDeviceRequest(BaseModel):
     email: EmailStr
 
+class UpdateUserRoleRequest(BaseModel):
+    role: str
+
+# Caches for verified tokens and user roles
+token_cache = TokenCache(JWT_CACHE_MAX_SIZE)
+role_cache = RoleCache(JWT_CACHE_MAX_SIZE)
+
 # Connection Manager for WebSockets
 class ConnectionManager:
     def __init__(self):
@@ -241,72 +279,50 @@ class ConnectionManager:
     async def send_personal_message(self, message: dict, user_uuid: str):
         if user_uuid in self.active_connections:
             try:
-                await self.active_connections[user_uuid].send_text(json.dumps(message))
+                start = time.perf_counter()
+                with tracer.span("serialize"):
+                    text = json.dumps(message, default=to_json)
+                with tracer.span("websocket.send"):
+                    await self.active_connections[user_uuid].send_text(text)
+                WEBSOCKET_SEND_SECONDS.observe(time.perf_counter() - start)
+                WEBSOCKET_MESSAGES_SENT.labels(message.get('type', 'unknown')).inc()
             except Exception as e:
                 logger.error(f"Error sending message to {user_uuid}: {e}")
                 self.disconnect(user_uuid)
 
-    async def broadcast_to_friends(self, message: dict, user_uuid: str, db: DatabaseManager):
+    async def broadcast_to_friends(self, message: dict, user_uuid: str, repository: Repository):
         """Broadcast message to all friends of the user."""
-        friends = self.get_user_friends(user_uuid, db)
-        for friend in friends:
-            if friend.status == 'accepted':
+        friends = [friend for friend in await self.get_user_friends(user_uuid, repository) if friend.status == 'accepted']
+        BROADCAST_FANOUT.labels('friends').observe(len(friends))
+        with tracer.span("fanout.friends", recipients=len(friends)):
+            for friend in friends:
                 await self.send_personal_message(message, friend.uuid)
 
-    async def broadcast_to_group_members(self, message: dict, group_id: str, db: DatabaseManager):
+    async def broadcast_to_group_members(self, message: dict, group_id: str, repository: Repository):
         """Broadcast message to all members of a group."""
-        members = self.get_group_members(group_id, db)
-        for member_uuid in members:
-            await self.send_personal_message(message, member_uuid)
-
-    def get_user_friends(self, user_uuid: str, db: DatabaseManager) -> List[Friend]:
+        members = await self.get_group_members(group_id, repository)
+        BROADCAST_FANOUT.labels('group_members').observe(len(members))
+        with tracer.span("fanout.group_members", recipients=len(members)):
+            for member_uuid in members:
+                await self.send_personal_message(message, member_uuid)
+
+    @timed(DB_QUERY_SECONDS, 'get_user_friends')
+    async def get_user_friends(self, user_uuid: str, repository: Repository) -> List[Friend]:
         """Get all accepted and pending friends of a user."""
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT u.uuid, u.email, u.nickname, f.status, f.created_at, f.user_uuid
-                FROM friends f
-                JOIN users u ON f.friend_uuid = u.uuid
-                WHERE f.user_uuid = ?
-                UNION
-                SELECT u.uuid, u.email, u.nickname, f.status, f.created_at, f.user_uuid
-                FROM friends f
-                JOIN users u ON f.user_uuid = u.uuid
-                WHERE f.friend_uuid = ? AND (f.status = 'accepted' OR f.status = 'pending')
-            ''', (user_uuid, user_uuid))
-            
-            friends = []
-            for row in cursor.fetchall():
-                friends.append(Friend(
-                    uuid=row[0],
-                    email=row[1],
-                    nickname=row[2],
-                    status=row[3],
-                    created_at=datetime.fromisoformat(row[4]),
-                    request_sent_by=row[5]
-                ))
-            return friends
-
-    def get_group_members(self, group_id: str, db: DatabaseManager) -> List[str]:
+        return await repository.get_friends(user_uuid)
+
+    @timed(DB_QUERY_SECONDS, 'get_group_members')
+    async def get_group_members(self, group_id: str, repository: Repository) -> List[str]:
         """Get all member UUIDs of a group."""
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT user_uuid FROM group_members WHERE group_id = ?', (group_id,))
-            return [row[0] for row in cursor.fetchall()]
+        return await repository.get_group_members(group_id)
 
 # Initialize managers
 connection_manager = ConnectionManager()
+fleet_stats = FleetStats()
+WEBSOCKET_ACTIVE_SESSIONS.set_function(lambda: len(connection_manager.active_connections))
 
 
 # Authentication utilities
-def hash_password(password: str) -> str:
-    """Hash a password using SHA-256."""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def verify_password(password: str, password_hash: str) -> bool:
-    """Verify a password against its hash."""
-    return hash_password(password) == password_hash
-
 def create_jwt_token(user_uuid: str) -> str:
     """Create a JWT token for a user."""
     payload = {
@@ -315,11 +331,32 @@ def create_jwt_token(user_uuid: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def is_token_revoked(token: str) -> bool:
+    """Whether a token was signed out, here or on any other worker, including before a restart."""
+    if token_cache.is_revoked(token):
+        return True
+    row = db_manager.get_connection().execute('SELECT expires_at FROM revoked_tokens WHERE token_hash = ?',
+                                              (token_hash(token),)).fetchone()
+    if row is None:
+        return False
+    token_cache.revoke(token, row[0])
+    return True
+
 def decode_jwt_token(token: str) -> Optional[str]:
     """Decode a JWT token and return the user UUID."""
+    if is_token_revoked(token):
+        logger.warning("Revoked JWT token")
+        return None
+
+    cached = token_cache.get(token)
+    if cached:
+        return cached.user_uuid
+
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload.get('user_uuid')
     except jwt.ExpiredSignatureError:
         logger.warning("JWT token expired")
         return None
@@ -327,9 +364,48 @@ def decode_jwt_token(token: str) -> Optional[str]:
         logger.warning("Invalid JWT token")
         return None
 
+    user_uuid = payload.get('user_uuid')
+    if user_uuid and 'exp' in payload:
+        token_cache.put(token, user_uuid, payload['exp'])
+    return user_uuid
+
+def revoke_jwt_token(token: str):
+    """Revoke a JWT token so it is rejected until it expires, by every worker and across restarts."""
+    cached = token_cache.get(token)
+    if cached:
+        expiry = cached.expiry
+    else:
+        try:
+            expiry = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])['exp']
+        except (jwt.InvalidTokenError, KeyError):
+            return
+
+    token_cache.revoke(token, expiry)
+    with db_manager.get_connection() as conn:
+        conn.execute('INSERT OR REPLACE INTO revoked_tokens (token_hash, expires_at) VALUES (?, ?)', (token_hash(token), expiry))
+        # Expired tokens are rejected by their signature check alone
+        conn.execute('DELETE FROM revoked_tokens WHERE expires_at <= ?', (time.time(),))
+
+def get_user_role(user_uuid: str) -> Optional[str]:
+    """Get the role of a user, served from the role cache when possible."""
+    role = role_cache.get(user_uuid)
+    if role:
+        return role
+
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT role FROM users WHERE uuid = ?', (user_uuid,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+
+    role_cache.put(user_uuid, row[0])
+    return row[0]
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
     """Get the current user from JWT token."""
-    user_uuid = decode_jwt_token(credentials.credentials)
+    with tracer.span("auth.token"):
+        user_uuid = decode_jwt_token(credentials.credentials)
     if not user_uuid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -338,26 +414,28 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         )
     return user_uuid
 
-async def get_current_user_if_admin(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+async def get_current_user_if_admin(current_user: str = Depends(get_current_user)) -> str:
     """Get the current user from JWT token, but only if the user is an admin."""
-    user_uuid = decode_jwt_token(credentials.credentials)
-    if not user_uuid:
+    with tracer.span("auth.role"):
+        role = get_user_role(current_user)
+    if role != ROLE_ADMIN:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="User does not have admin rights")
 
-    with db_manager.get_connection() as conn:
-        cursor = conn.cursor()
-        # Check if user is admin
-        cursor.execute('SELECT uuid FROM users WHERE uuid = ? AND role = ?', (user_uuid, ROLE_ADMIN))
-        if cursor.rowcount == 0:
-            raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="User does not have admin rights")
+    return current_user
 
-        return user_uuid
+def enforce_auth_rate_limits(http_request: Request, email: str):
+    """Reject sign in/up attempts over the per IP or per email limits, before any DB or hashing work."""
+    client_ip = http_request.client.host if http_request.client else "unknown"
+    retry_after = max(ip_rate_limiter.check(client_ip), email_rate_limiter.check(email.lower()))
+    if retry_after > 0:
+        logger.warning(f"Rate limited {http_request.url.path} from {client_ip} for {email}")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
 
 # Generate UUID
 import uuid
@@ -389,7 +467,7 @@ def create_bootstrap_admin():
 
             # Create new user
             user_uuid = generate_uuid()
-            password_hash = hash_password(admin_password)
+            password_hash = hash_password(admin_password, password_hasher.rounds)
 
             cursor.execute('''
                 INSERT INTO users (uuid, email, password_hash, nickname, role)
@@ -403,14 +481,120 @@ def create_bootstrap_admin():
         logger.error(f"Error creating bootstrap admin: {e}")
         raise
 
+def parse_db_timestamp(value: Optional[str]) -> Optional[float]:
+    """Convert a timestamp stored by sqlite3 from a datetime to epoch seconds."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+def load_fleet_stats():
+    """Seed the fleet aggregates with the latest location of every device."""
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT d.imei, dl.battery, dl.connection_type, dl.lte_signal, dl.lora_rssi, d.last_seen
+            FROM devices d
+            LEFT JOIN device_locations dl ON dl.id = (
+                SELECT id FROM device_locations WHERE device_id = d.id ORDER BY timestamp DESC LIMIT 1
+            )
+        ''')
+        fleet_stats.load({
+            row[0]: DeviceSnapshot(row[1], row[2], row[3], row[4], parse_db_timestamp(row[5]))
+            for row in cursor.fetchall()
+        })
+
 def on_startup():
-    global db_manager
+    global db_manager, query_profiler, read_pool, repository, password_hasher, ip_rate_limiter, email_rate_limiter, daily_rollups, rollup_worker
+    global location_archive, location_archiver, backup_manager, tracer, user_track_downsampler, recent_fix_keys
     logger.info("Dog Tracker Backend starting up...")
    
     # Initialize database manager with current environment configuration
     db_path = os.getenv(DB_PATH_ENV_VAR, "dog_tracker.db")
-    db_manager = DatabaseManager(logger, db_path)
+    query_profiler = QueryProfiler(logger, float(os.getenv(DB_SLOW_QUERY_MS_ENV_VAR, str(DEFAULT_SLOW_QUERY_MS))))
+    db_manager = DatabaseManager(logger, db_path, query_profiler)
+
+    # Listings read on their own connections, off the event loop, so read bursts do not hold up ingest
+    read_pool = None
+    read_connections = int(os.getenv(DB_READ_CONNECTIONS_ENV_VAR, str(DEFAULT_READ_CONNECTIONS)))
+    if db_path != ':memory:' and read_connections > 0:
+        read_pool = ReadPool(db_path, logger, read_connections, os.getenv(DB_READ_REPLICA_PATH_ENV_VAR),
+                             float(os.getenv(DB_READ_MAX_STALENESS_SECONDS_ENV_VAR, str(DEFAULT_MAX_STALENESS_SECONDS))),
+                             profiler=query_profiler)
+        read_pool.start(db_manager)
+        logger.info(f"Reading from {read_connections} read connections"
+                    + (f", preferring replica {read_pool.replica_path}" if read_pool.replica_path else ""))
+    # Always SQLite: auth, admin listings, rollups, archiving and backups use db_manager directly,
+    # so postgres_repository.py is not selectable here
+    repository = SQLiteRepository(db_manager, read_pool)
     logger.info("Database initialized")
+
+    # Spans of requests and WebSocket messages go to a file when configured
+    trace_path = os.getenv(TRACE_EXPORT_PATH_ENV_VAR)
+    tracer = Tracer()
+    if trace_path:
+        tracer = Tracer(JsonLinesSpanExporter(trace_path), float(os.getenv(TRACE_SAMPLE_RATE_ENV_VAR, "1.0")))
+        tracer.exporter.start()
+        repository = TracedProxy(repository, tracer, 'db')
+        logger.info(f"Tracing {tracer.sample_rate:.0%} of requests and WebSocket messages to {trace_path}")
+
+    token_cache.clear()
+    role_cache.clear()
+    load_fleet_stats()
+
+    daily_rollups = DailyRollups(db_manager, logger)
+    rollup_worker = RollupWorker(daily_rollups, logger)
+    rollup_worker.start()
+    ROLLUP_QUEUE_DEPTH.set_function(lambda: rollup_worker.pending)
+
+    # Old history moves to columnar files when an archive directory is configured
+    location_archive = None
+    location_archiver = None
+    archive_dir = os.getenv(LOCATION_ARCHIVE_DIR_ENV_VAR)
+    if archive_dir and not archive_available():
+        logger.warning(f"{LOCATION_ARCHIVE_DIR_ENV_VAR} is set but pyarrow is not installed, location archiving disabled")
+    elif archive_dir:
+        archive_after_days = int(os.getenv(LOCATION_ARCHIVE_AFTER_DAYS_ENV_VAR, str(DEFAULT_LOCATION_ARCHIVE_AFTER_DAYS)))
+        location_archive = LocationArchive(archive_dir)
+        location_archiver = LocationArchiver(location_archive, db_manager, logger, timedelta(days=archive_after_days),
+                                             LOCATION_ARCHIVE_INTERVAL_SECONDS)
+        location_archiver.start()
+        logger.info(f"Archiving locations older than {archive_after_days} days to {archive_dir}")
+
+    # Phone tracks are recorded, downsampled, when enabled
+    user_track_downsampler = None
+    if os.getenv(USER_LOCATION_HISTORY_ENV_VAR, '').lower() in ('1', 'true', 'yes'):
+        user_track_downsampler = TrackDownsampler(
+            float(os.getenv(USER_LOCATION_HISTORY_MIN_INTERVAL_SECONDS_ENV_VAR, str(DEFAULT_MIN_INTERVAL_SECONDS))),
+            float(os.getenv(USER_LOCATION_HISTORY_MIN_DISTANCE_M_ENV_VAR, str(DEFAULT_MIN_DISTANCE_M))))
+        logger.info(f"Recording user location history, a fix every {user_track_downsampler.min_interval_ms / 1000:g} s "
+                    f"or {user_track_downsampler.min_distance_m:g} m")
+
+    recent_fix_keys = RecentKeys(int(os.getenv(INGEST_RECENT_FIX_KEYS_ENV_VAR, str(DEFAULT_RECENT_FIX_KEYS))))
+
+    backup_manager = BackupManager(db_manager, os.getenv(BACKUP_DIR_ENV_VAR, DEFAULT_BACKUP_DIR), logger,
+                                   keep=int(os.getenv(BACKUP_KEEP_ENV_VAR, str(DEFAULT_BACKUP_KEEP))))
+    backup_interval_hours = float(os.getenv(BACKUP_INTERVAL_HOURS_ENV_VAR, "0"))
+    if backup_interval_hours > 0:
+        backup_manager.start(backup_interval_hours * 60 * 60)
+        logger.info(f"Backing up the database every {backup_interval_hours} hours to {backup_manager.backup_dir}")
+
+    password_hasher = PasswordHasher(
+        rounds=int(os.getenv(PASSWORD_HASH_ROUNDS_ENV_VAR, "12")),
+        max_workers=int(os.getenv(PASSWORD_HASH_WORKERS_ENV_VAR, "2")),
+    )
+
+    # Workers on the same host share buckets through a SQLite file when configured, kept across restarts
+    rate_limit_db_path = os.getenv(RATE_LIMIT_DB_PATH_ENV_VAR)
+    if rate_limit_db_path:
+        rate_limit_backend = SQLiteRateLimiterBackend(rate_limit_db_path, logger)
+    else:
+        rate_limit_backend = InMemoryRateLimiterBackend()
+    PASSWORD_HASH_PENDING.set_function(lambda: password_hasher.pending)
+    ip_rate_limiter = RateLimiter("auth_ip", AUTH_RATE_LIMIT_IP_BURST, AUTH_RATE_LIMIT_IP_PER_MINUTE, rate_limit_backend)
+    email_rate_limiter = RateLimiter("auth_email", AUTH_RATE_LIMIT_EMAIL_BURST, AUTH_RATE_LIMIT_EMAIL_PER_MINUTE, rate_limit_backend)
     
     # Create bootstrap admin after database is initialized
     try:
@@ -425,12 +609,20 @@ def on_startup():
 # Shutdown event
 def on_shutdown():
     logger.info("Dog Tracker Backend shutting down...")
+    password_hasher.shutdown()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     on_startup()
     yield
+    await backup_manager.stop()
+    if location_archiver:
+        await location_archiver.stop()
+    await rollup_worker.stop()
+    if read_pool:
+        await read_pool.stop()
     on_shutdown()
+    tracer.shutdown()
 
 # FastAPI app
 app = FastAPI(title="Dog Tracker Backend", version="1.0.0", lifespan=lifespan)
@@ -442,17 +634,39 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "X-Total-Count-Exact", "X-Log-Offset"],
 )
 
+@app.middleware("http")
+async def observe_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    with tracer.span(f"HTTP {request.method}", root=True) as span:
+        response = await call_next(request)
+        # Label by route template rather than raw path to keep the label set small
+        route = request.scope.get("route")
+        route_path = route.path if route else "unmatched"
+        if span:
+            span.name = f"HTTP {request.method} {route_path}"
+            span.set_attribute("http.status_code", response.status_code)
+    HTTP_REQUEST_SECONDS.labels(request.method, route_path, str(response.status_code)).observe(time.perf_counter() - start)
+    return response
+
 # Health check
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Metrics in the Prometheus text exposition format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 # Authentication endpoints
 @app.post("/signup")
-async def sign_up(request: SignUpRequest):
+async def sign_up(request: SignUpRequest, http_request: Request):
     """Register a new user."""
+    enforce_auth_rate_limits(http_request, request.email)
+
     try:
         with db_manager.get_connection() as conn:
             cursor = conn.cursor()
@@ -461,10 +675,15 @@ async def sign_up(request: SignUpRequest):
             cursor.execute('SELECT uuid FROM users WHERE email = ?', (request.email,))
             if cursor.fetchone():
                 raise HTTPException(status_code=400, detail="Email already registered")
-            
+
+        # Hash outside of the transaction, other requests run while the worker pool is busy
+        password_hash = await password_hasher.hash(request.password)
+
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+
             # Create new user
             user_uuid = generate_uuid()
-            password_hash = hash_password(request.password)
             
             cursor.execute('''
                 INSERT INTO users (uuid, email, password_hash, nickname)
@@ -486,6 +705,9 @@ async def sign_up(request: SignUpRequest):
             
     except sqlite3.IntegrityError:
         raise HTTPException(status_code=400, detail="Email already registered")
+    except PasswordHasherBusyError as e:
+        logger.warning(f"Sign up rejected: {e}")
+        raise HTTPException(status_code=503, detail="Server busy, try again later", headers={"Retry-After": "1"})
     except HTTPException:
         raise
     except Exception as e:
@@ -493,8 +715,10 @@ async def sign_up(request: SignUpRequest):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @app.post("/signin")
-async def sign_in(request: SignInRequest):
+async def sign_in(request: SignInRequest, http_request: Request):
     """Sign in an existing user."""
+    enforce_auth_rate_limits(http_request, request.email)
+
     try:
         with db_manager.get_connection() as conn:
             cursor = conn.cursor()
@@ -503,11 +727,23 @@ async def sign_in(request: SignInRequest):
             ''', (request.email,))
             
             user = cursor.fetchone()
-            if not user or not verify_password(request.password, user[1]):
+            if not user:
                 raise HTTPException(status_code=401, detail="Invalid email or password")
-            
-            user_uuid, _, nickname = user
-            
+
+        user_uuid, password_hash, nickname = user
+
+        password_matches, new_password_hash = await password_hasher.verify(request.password, password_hash)
+        if not password_matches:
+            raise HTTPException(status_code=401, detail="Invalid email or password")
+
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+
+            # Replace legacy SHA-256 hashes transparently
+            if new_password_hash:
+                cursor.execute('UPDATE users SET password_hash = ? WHERE uuid = ?', (new_password_hash, user_uuid))
+                logger.info(f"Rehashed legacy password for user {user_uuid}")
+
             # Update last seen
             cursor.execute('UPDATE users SET last_seen = ? WHERE uuid = ?', 
                          (datetime.now(), user_uuid))
@@ -524,19 +760,35 @@ async def sign_in(request: SignInRequest):
                 "nickname": nickname
             }
             
+    except PasswordHasherBusyError as e:
+        logger.warning(f"Sign in rejected: {e}")
+        raise HTTPException(status_code=503, detail="Server busy, try again later", headers={"Retry-After": "1"})
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Sign in error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.post("/signout")
+async def sign_out(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Sign out by revoking the presented token."""
+    if not decode_jwt_token(credentials.credentials):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    revoke_jwt_token(credentials.credentials)
+    return {"message": "Signed out"}
+
 # Friends endpoints
 @app.get("/friends")
 async def get_friends(current_user: str = Depends(get_current_user)):
     """Get user's friends list."""
     try:
-        friends = connection_manager.get_user_friends(current_user, db_manager)
-        return [asdict(friend) for friend in friends]
+        friends = await connection_manager.get_user_friends(current_user, repository)
+        return [{**friend.to_dict(), 'created_at': friend.created_at_datetime()} for friend in friends]
     except Exception as e:
         logger.error(f"Get friends error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -545,46 +797,27 @@ async def get_friends(current_user: str = Depends(get_current_user)):
 async def add_friend(request: AddFriendRequest, current_user: str = Depends(get_current_user)):
     """Send a friend request."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Find the friend by email
-            cursor.execute('SELECT uuid FROM users WHERE email = ?', (request.email,))
-            friend = cursor.fetchone()
-            if not friend:
-                raise HTTPException(status_code=404, detail="User not found")
-            
-            friend_uuid = friend[0]
-            
-            if friend_uuid == current_user:
-                raise HTTPException(status_code=400, detail="Cannot add yourself as friend")
-            
-            # Check if friendship already exists
-            cursor.execute('''
-                SELECT status FROM friends 
-                WHERE (user_uuid = ? AND friend_uuid = ?) OR (user_uuid = ? AND friend_uuid = ?)
-            ''', (current_user, friend_uuid, friend_uuid, current_user))
-            
-            existing = cursor.fetchone()
-            if existing:
-                raise HTTPException(status_code=400, detail="Friend relationship already exists")
-            
-            # Add friend request
-            cursor.execute('''
-                INSERT INTO friends (user_uuid, friend_uuid, status)
-                VALUES (?, ?, 'pending')
-            ''', (current_user, friend_uuid))
-            
-            conn.commit()
-            
-            # Notify the friend via WebSocket
-            await connection_manager.send_personal_message({
-                "type": "friend_request",
-                "data": {"from": current_user, "email": request.email}
-            }, friend_uuid)
-            
-            return {"message": "Friend request sent"}
-            
+        # Find the friend by email
+        friend_uuid = await repository.get_user_uuid_by_email(request.email)
+        if not friend_uuid:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        if friend_uuid == current_user:
+            raise HTTPException(status_code=400, detail="Cannot add yourself as friend")
+
+        if await repository.friendship_exists(current_user, friend_uuid):
+            raise HTTPException(status_code=400, detail="Friend relationship already exists")
+
+        await repository.add_friend_request(current_user, friend_uuid)
+
+        # Notify the friend via WebSocket
+        await connection_manager.send_personal_message({
+            "type": "friend_request",
+            "data": {"from": current_user, "email": request.email}
+        }, friend_uuid)
+
+        return {"message": "Friend request sent"}
+
     except HTTPException:
         raise
     except Exception as e:
@@ -595,28 +828,17 @@ async def add_friend(request: AddFriendRequest, current_user: str = Depends(get_
 async def accept_friend_request(friend_uuid: str, current_user: str = Depends(get_current_user)):
     """Accept a friend request."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Update the friend request status
-            cursor.execute('''
-                UPDATE friends SET status = 'accepted' 
-                WHERE user_uuid = ? AND friend_uuid = ? AND status = 'pending'
-            ''', (friend_uuid, current_user))
-            
-            if cursor.rowcount == 0:
-                raise HTTPException(status_code=404, detail="Friend request not found")
-            
-            conn.commit()
-            
-            # Notify the requester via WebSocket
-            await connection_manager.send_personal_message({
-                "type": "friend_accepted",
-                "data": {"by": current_user}
-            }, friend_uuid)
-            
-            return {"message": "Friend request accepted"}
-            
+        if not await repository.accept_friend_request(friend_uuid, current_user):
+            raise HTTPException(status_code=404, detail="Friend request not found")
+
+        # Notify the requester via WebSocket
+        await connection_manager.send_personal_message({
+            "type": "friend_accepted",
+            "data": {"by": current_user}
+        }, friend_uuid)
+
+        return {"message": "Friend request accepted"}
+
     except HTTPException:
         raise
     except Exception as e:
@@ -627,22 +849,11 @@ async def accept_friend_request(friend_uuid: str, current_user: str = Depends(ge
 async def remove_friend(friend_uuid: str, current_user: str = Depends(get_current_user)):
     """Remove a friend."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Remove the friendship (both directions)
-            cursor.execute('''
-                DELETE FROM friends 
-                WHERE (user_uuid = ? AND friend_uuid = ?) OR (user_uuid = ? AND friend_uuid = ?)
-            ''', (current_user, friend_uuid, friend_uuid, current_user))
-            
-            if cursor.rowcount == 0:
-                raise HTTPException(status_code=404, detail="Friend relationship not found")
-            
-            conn.commit()
-            
-            return {"message": "Friend removed"}
-            
+        if not await repository.remove_friend(current_user, friend_uuid):
+            raise HTTPException(status_code=404, detail="Friend relationship not found")
+
+        return {"message": "Friend removed"}
+
     except HTTPException:
         raise
     except Exception as e:
@@ -654,35 +865,7 @@ async def remove_friend(friend_uuid: str, current_user: str = Depends(get_curren
 async def get_groups(current_user: str = Depends(get_current_user)):
     """Get user's groups."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT g.id, g.name, g.description, g.owner_id, g.created_at
-                FROM groups g
-                LEFT JOIN group_members gm ON g.id = gm.group_id
-                WHERE g.owner_id = ? OR gm.user_uuid = ?
-                GROUP BY g.id
-            ''', (current_user, current_user))
-            
-            groups = []
-            for row in cursor.fetchall():
-                group_id = row[0]
-                
-                # Get member IDs
-                cursor.execute('SELECT user_uuid FROM group_members WHERE group_id = ?', (group_id,))
-                member_ids = [member[0] for member in cursor.fetchall()]
-                
-                groups.append({
-                    'id': group_id,
-                    'name': row[1],
-                    'description': row[2],
-                    'owner_id': row[3],
-                    'member_ids': member_ids,
-                    'created_at': row[4]
-                })
-            
-            return groups
-            
+        return [group.to_dict() for group in await repository.get_user_groups(current_user)]
     except Exception as e:
         logger.error(f"Get groups error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -691,33 +874,18 @@ async def get_groups(current_user: str = Depends(get_current_user)):
 async def create_group(request: CreateGroupRequest, current_user: str = Depends(get_current_user)):
     """Create a new group."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            group_id = generate_uuid()
-            
-            cursor.execute('''
-                INSERT INTO groups (id, name, description, owner_id)
-                VALUES (?, ?, ?, ?)
-            ''', (group_id, request.name, request.description, current_user))
-            
-            # Add owner as member
-            cursor.execute('''
-                INSERT INTO group_members (group_id, user_uuid)
-                VALUES (?, ?)
-            ''', (group_id, current_user))
-            
-            conn.commit()
-            
-            return {
-                "id": group_id,
-                "name": request.name,
-                "description": request.description,
-                "owner_id": current_user,
-                "member_ids": [current_user],
-                "created_at": datetime.now().isoformat()
-            }
-            
+        group_id = generate_uuid()
+        await repository.create_group(group_id, request.name, request.description, current_user)
+
+        return {
+            "id": group_id,
+            "name": request.name,
+            "description": request.description,
+            "owner_id": current_user,
+            "member_ids": [current_user],
+            "created_at": datetime.now().isoformat()
+        }
+
     except Exception as e:
         logger.error(f"Create group error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -726,28 +894,17 @@ async def create_group(request: CreateGroupRequest, current_user: str = Depends(
 async def delete_group(group_id: str, current_user: str = Depends(get_current_user)):
     """Delete a group (owner only)."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Check if user is the owner
-            cursor.execute('SELECT owner_id FROM groups WHERE id = ?', (group_id,))
-            group = cursor.fetchone()
-            if not group:
-                raise HTTPException(status_code=404, detail="Group not found")
-            
-            if group[0] != current_user:
-                raise HTTPException(status_code=403, detail="Only group owner can delete the group")
-            
-            # Delete group members first
-            cursor.execute('DELETE FROM group_members WHERE group_id = ?', (group_id,))
-            
-            # Delete the group
-            cursor.execute('DELETE FROM groups WHERE id = ?', (group_id,))
-            
-            conn.commit()
-            
-            return {"message": "Group deleted"}
-            
+        owner_uuid = await repository.get_group_owner(group_id)
+        if not owner_uuid:
+            raise HTTPException(status_code=404, detail="Group not found")
+
+        if owner_uuid != current_user:
+            raise HTTPException(status_code=403, detail="Only group owner can delete the group")
+
+        await repository.delete_group(group_id)
+
+        return {"message": "Group deleted"}
+
     except HTTPException:
         raise
     except Exception as e:
@@ -758,43 +915,23 @@ async def delete_group(group_id: str, current_user: str = Depends(get_current_us
 async def add_group_member(group_id: str, request: AddGroupMemberRequest, current_user: str = Depends(get_current_user)):
     """Add a member to a group."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Check if user is the owner or member of the group
-            cursor.execute('''
-                SELECT g.owner_id FROM groups g
-                LEFT JOIN group_members gm ON g.id = gm.group_id
-                WHERE g.id = ? AND (g.owner_id = ? OR gm.user_uuid = ?)
-            ''', (group_id, current_user, current_user))
-            
-            if not cursor.fetchone():
-                raise HTTPException(status_code=403, detail="Not authorized to add members to this group")
-            
-            # Find user by email
-            cursor.execute('SELECT uuid FROM users WHERE email = ?', (request.email,))
-            user = cursor.fetchone()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
-            
-            user_uuid = user[0]
-            
-            # Add member to group
-            cursor.execute('''
-                INSERT OR IGNORE INTO group_members (group_id, user_uuid)
-                VALUES (?, ?)
-            ''', (group_id, user_uuid))
-            
-            conn.commit()
-            
-            # Notify the new member via WebSocket
-            await connection_manager.send_personal_message({
-                "type": "group_invitation",
-                "data": {"group_id": group_id, "by": current_user}
-            }, user_uuid)
-            
-            return {"message": "Member added to group"}
-            
+        if not await repository.is_group_owner_or_member(group_id, current_user):
+            raise HTTPException(status_code=403, detail="Not authorized to add members to this group")
+
+        user_uuid = await repository.get_user_uuid_by_email(request.email)
+        if not user_uuid:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        await repository.add_group_member(group_id, user_uuid)
+
+        # Notify the new member via WebSocket
+        await connection_manager.send_personal_message({
+            "type": "group_invitation",
+            "data": {"group_id": group_id, "by": current_user}
+        }, user_uuid)
+
+        return {"message": "Member added to group"}
+
     except HTTPException:
         raise
     except Exception as e:
@@ -805,30 +942,19 @@ async def add_group_member(group_id: str, request: AddGroupMemberRequest, curren
 async def remove_group_member(group_id: str, member_uuid: str, current_user: str = Depends(get_current_user)):
     """Remove a member from a group."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Check if user is the owner of the group or removing themselves
-            cursor.execute('SELECT owner_id FROM groups WHERE id = ?', (group_id,))
-            group = cursor.fetchone()
-            if not group:
-                raise HTTPException(status_code=404, detail="Group not found")
-            
-            if group[0] != current_user and member_uuid != current_user:
-                raise HTTPException(status_code=403, detail="Not authorized to remove this member")
-            
-            # Remove member from group
-            cursor.execute('''
-                DELETE FROM group_members WHERE group_id = ? AND user_uuid = ?
-            ''', (group_id, member_uuid))
-            
-            if cursor.rowcount == 0:
-                raise HTTPException(status_code=404, detail="Member not found in group")
-            
-            conn.commit()
-            
-            return {"message": "Member removed from group"}
-            
+        # Only the owner of the group, or members removing themselves
+        owner_uuid = await repository.get_group_owner(group_id)
+        if not owner_uuid:
+            raise HTTPException(status_code=404, detail="Group not found")
+
+        if owner_uuid != current_user and member_uuid != current_user:
+            raise HTTPException(status_code=403, detail="Not authorized to remove this member")
+
+        if not await repository.remove_group_member(group_id, member_uuid):
+            raise HTTPException(status_code=404, detail="Member not found in group")
+
+        return {"message": "Member removed from group"}
+
     except HTTPException:
         raise
     except Exception as e:
@@ -838,30 +964,14 @@ async def remove_group_member(group_id: str, member_uuid: str, current_user: str
 @app.get("/device_locations")
 async def get_device_locations(current_user: str = Depends(get_current_user)):
     """Get user's device locations."""
-    return get_all_device_locations(current_user)
+    return [location.to_dict() for location in await get_all_device_locations(current_user)]
 
 # Device management endpoints
 @app.get("/devices")
 async def get_devices(current_user: str = Depends(get_current_user)):
     """Get user's devices."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT imei, name, created_at, last_seen FROM devices WHERE owner_uuid = ?
-            ''', (current_user,))
-            
-            devices = []
-            for row in cursor.fetchall():
-                devices.append({
-                    'imei': row[0],
-                    'name': row[1],
-                    'created_at': row[2],
-                    'last_seen': row[3]
-                })
-            
-            return devices
-            
+        return await repository.get_devices(current_user)
     except Exception as e:
         logger.error(f"Get devices error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -870,24 +980,14 @@ async def get_devices(current_user: str = Depends(get_current_user)):
 async def add_device(request: AddDeviceRequest, current_user: str = Depends(get_current_user)):
     """Add a new device."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Check if device already exists
-            cursor.execute('SELECT owner_uuid FROM devices WHERE imei = ?', (request.imei,))
-            existing = cursor.fetchone()
-            if existing:
-                raise HTTPException(status_code=400, detail="Device already registered")
-            
-            cursor.execute('''
-                INSERT INTO devices (imei, owner_uuid, name)
-                VALUES (?, ?, ?)
-            ''', (request.imei, current_user, request.name))
-            
-            conn.commit()
-            
-            return {"message": "Device added successfully"}
-            
+        if await repository.device_exists(request.imei):
+            raise HTTPException(status_code=400, detail="Device already registered")
+
+        await repository.add_device(request.imei, current_user, request.name)
+        fleet_stats.add_device(request.imei)
+
+        return {"message": "Device added successfully"}
+
     except HTTPException:
         raise
     except Exception as e:
@@ -898,20 +998,11 @@ async def add_device(request: AddDeviceRequest, current_user: str = Depends(get_
 async def update_device(imei: str, request: UpdateDeviceRequest, current_user: str = Depends(get_current_user)):
     """Update device name."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE devices SET name = ? WHERE imei = ? AND owner_uuid = ?
-            ''', (request.name, imei, current_user))
-            
-            if cursor.rowcount == 0:
-                raise HTTPException(status_code=404, detail="Device not found")
-            
-            conn.commit()
-            
-            return {"message": "Device updated successfully"}
-            
+        if not await repository.rename_device(imei, current_user, request.name):
+            raise HTTPException(status_code=404, detail="Device not found")
+
+        return {"message": "Device updated successfully"}
+
     except HTTPException:
         raise
     except Exception as e:
@@ -922,25 +1013,17 @@ async def update_device(imei: str, request: UpdateDeviceRequest, current_user: s
 async def remove_device(imei: str, current_user: str = Depends(get_current_user)):
     """Remove a device."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Remove device shares first
-            cursor.execute('DELETE FROM device_shares WHERE device_imei = ?', (imei,))
-            
-            # Remove device locations
-            cursor.execute('DELETE FROM device_locations WHERE device_id = ?', (imei,))
-            
-            # Remove the device
-            cursor.execute('DELETE FROM devices WHERE imei = ? AND owner_uuid = ?', (imei, current_user))
-            
-            if cursor.rowcount == 0:
-                raise HTTPException(status_code=404, detail="Device not found")
-            
-            conn.commit()
-            
-            return {"message": "Device removed successfully"}
-            
+        # Shares and locations go with it
+        if not await repository.remove_device(imei, current_user):
+            raise HTTPException(status_code=404, detail="Device not found")
+
+        fleet_stats.remove_device(imei)
+        daily_rollups.forget_device(imei)
+        if location_archive:
+            location_archive.remove_device(imei)
+
+        return {"message": "Device removed successfully"}
+
     except HTTPException:
         raise
     except Exception as e:
@@ -951,42 +1034,28 @@ async def remove_device(imei: str, current_user: str = Depends(get_current_user)
 async def share_device(imei: str, request: ShareDeviceRequest, current_user: str = Depends(get_current_user)):
     """Share a device with another user."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
+        # Check if device belongs to current user
+        device_name = await repository.get_owned_device_name(imei, current_user)
+        if not device_name:
+            raise HTTPException(status_code=404, detail="Device not found")
 
-            # Check if device belongs to current user
-            cursor.execute('SELECT name FROM devices WHERE imei = ? AND owner_uuid = ?', (imei, current_user))
-            device = cursor.fetchone()
-            if not device:
-                raise HTTPException(status_code=404, detail="Device not found")
+        shared_with_uuid = await repository.get_user_uuid_by_email(request.email)
+        if not shared_with_uuid:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        if shared_with_uuid == current_user:
+            raise HTTPException(status_code=400, detail="Cannot share device with yourself")
+
+        await repository.share_device(imei, current_user, shared_with_uuid)
+
+        # Notify the user via WebSocket
+        await connection_manager.send_personal_message({
+            "type": "device_shared",
+            "data": {"device_imei": imei, "device_name": device_name, "by": current_user}
+        }, shared_with_uuid)
+
+        return {"message": "Device shared successfully"}
 
-            # Find user by email
-            cursor.execute('SELECT uuid FROM users WHERE email = ?', (request.email,))
-            user = cursor.fetchone()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
-            
-            shared_with_uuid = user[0]
-            
-            if shared_with_uuid == current_user:
-                raise HTTPException(status_code=400, detail="Cannot share device with yourself")
-            
-            # Add device share
-            cursor.execute('''
-                INSERT OR REPLACE INTO device_shares (device_imei, owner_uuid, shared_with_uuid)
-                VALUES (?, ?, ?)
-            ''', (imei, current_user, shared_with_uuid))
-            
-            conn.commit()
-            
-            # Notify the user via WebSocket
-            await connection_manager.send_personal_message({
-                "type": "device_shared",
-                "data": {"device_imei": imei, "device_name": device[0], "by": current_user}
-            }, shared_with_uuid)
-            
-            return {"message": "Device shared successfully"}
-            
     except HTTPException:
         raise
     except Exception as e:
@@ -997,72 +1066,317 @@ async def share_device(imei: str, request: ShareDeviceRequest, current_user: str
 async def unshare_device(imei: str, user_uuid: str, current_user: str = Depends(get_current_user)):
     """Stop sharing a device with a user."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                DELETE FROM device_shares 
-                WHERE device_imei = ? AND owner_uuid = ? AND shared_with_uuid = ?
-            ''', (imei, current_user, user_uuid))
-            
-            if cursor.rowcount == 0:
-                raise HTTPException(status_code=404, detail="Device share not found")
-            
-            conn.commit()
-            
-            return {"message": "Device unshared successfully"}
-            
+        if not await repository.unshare_device(imei, current_user, user_uuid):
+            raise HTTPException(status_code=404, detail="Device share not found")
+
+        return {"message": "Device unshared successfully"}
+
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Unshare device error: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+def create_log_line_filter(level: Optional[str], contains: Optional[str]) -> LineFilter:
+    try:
+        return LineFilter(level, contains)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/devices/{imei}/stats")
+async def get_device_stats(imei: str, days: int = 30, current_user: str = Depends(get_current_user)):
+    """Get daily statistics (distance, speed, barks, battery drain, uptime) of an owned or shared device."""
+    if not await repository.user_can_view_device(imei, current_user):
+        raise HTTPException(status_code=404, detail="Device not found")
+
+    # Fixes still queued for the rollups show up once the worker applies them, moments later
+    since_day = utc_day(time.time() - max(0, days - 1) * 24 * 60 * 60)
+    return daily_rollups.get_daily_stats(imei, since_day)
+
+def history_window(start: Optional[datetime], end: Optional[datetime]) -> Tuple[datetime, datetime]:
+    """The [start, end) of a history request in naive local time, like the archive's timestamps. Defaults to the last day."""
+    end = (end.astimezone().replace(tzinfo=None) if end and end.tzinfo else end) or datetime.now()
+    start = (start.astimezone().replace(tzinfo=None) if start and start.tzinfo else start) or \
+        end - timedelta(hours=LOCATION_HISTORY_DEFAULT_HOURS)
+    return start, end
+
+async def read_device_history(imei: str, start: datetime, end: datetime, limit: int) -> List[dict]:
+    """Fixes of a device in [start, end), oldest first, from the archive and SQLite."""
+    archived = []
+    if location_archive:
+        archived = await asyncio.to_thread(location_archive.read, imei, start, end, limit)
+
+    with DB_QUERY_SECONDS.labels('get_device_location_history').time():
+        recent = await repository.get_device_location_history(imei, start, end, limit)
+
+    # A fix can be in both places if archiving was interrupted before deleting it from SQLite
+    archived_ids = {location['id'] for location in archived}
+    locations = archived + [location for location in recent if location['id'] not in archived_ids]
+    locations.sort(key=lambda location: location['timestamp_ms'])
+    return [
+        {key: value for key, value in location.items() if key not in ('id', 'device_id')}
+        for location in locations[:limit]
+    ]
+
+def history_output(location: dict) -> dict:
+    """A history fix as the API gives it, timed only by its local time text."""
+    return {key: value for key, value in location.items() if key != 'timestamp_ms'}
+
+@app.get("/devices/{imei}/locations")
+async def get_device_location_history(imei: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                      limit: int = LOCATION_HISTORY_MAX_FIXES,
+                                      current_user: str = Depends(get_current_user)):
+    """
+    Get the location history of an owned or shared device between `start` and `end`, oldest first.
+    Defaults to the last day. History moved to the archive is included transparently.
+    """
+    if not await repository.user_can_view_device(imei, current_user):
+        raise HTTPException(status_code=404, detail="Device not found")
+
+    start, end = history_window(start, end)
+    locations = await read_device_history(imei, start, end, max(1, min(limit, LOCATION_HISTORY_MAX_FIXES)))
+    return [history_output(location) for location in locations]
+
+@app.get("/users/me/locations")
+async def get_user_location_history(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                    limit: int = LOCATION_HISTORY_MAX_FIXES,
+                                    current_user: str = Depends(get_current_user)):
+    """
+    Get the recorded track of the current user's phone between `start` and `end`, oldest first.
+    Defaults to the last day. Only recorded when USER_LOCATION_HISTORY is enabled.
+    """
+    if user_track_downsampler is None:
+        raise HTTPException(status_code=404, detail="User location history is not enabled")
+
+    start, end = history_window(start, end)
+    with DB_QUERY_SECONDS.labels('get_user_location_history').time():
+        locations = await repository.get_user_location_history(current_user, start, end,
+                                                               max(1, min(limit, LOCATION_HISTORY_MAX_FIXES)))
+    return [history_output(location) for location in locations]
+
 @app.get("/admin/logs", response_class=StreamingResponse)
-async def get_logs(_: str = Depends(get_current_user_if_admin)):
-    """Get server logs"""
-    def iterfile():
-        with open(LOG_FILE_PATH, mode="rb") as file_like:
-            yield from file_like
+async def get_logs(tail: Optional[int] = None, offset: Optional[int] = None, limit: int = LOG_READ_LIMIT_BYTES,
+                   level: Optional[str] = None, contains: Optional[str] = None,
+                   _: str = Depends(get_current_user_if_admin)):
+    """
+    Get server logs.
+    Without parameters the whole current log file is streamed. `tail` returns the last N matching
+    lines (reaching into rotated files), `offset` returns complete lines from that byte offset.
+    Both filter by minimum `level` and `contains`, and return the offset to continue from in X-Log-Offset.
+    Filtering without either returns the last LOG_TAIL_DEFAULT_LINES matching lines.
+    """
+    if tail is None and offset is None and level is None and contains is None:
+        if not os.path.exists(LOG_FILE_PATH):
+            raise HTTPException(status_code=404, detail="Log file not found")
+
+        def iterfile():
+            with open(LOG_FILE_PATH, mode="rb") as file_like:
+                yield from file_like
+
+        return StreamingResponse(iterfile())
+
+    line_filter = create_log_line_filter(level, contains)
+    limit = max(1, min(limit, LOG_READ_LIMIT_BYTES))
+
+    if offset is not None:
+        try:
+            lines, next_offset = await asyncio.to_thread(read_lines_from_offset, LOG_FILE_PATH, max(0, offset), limit)
+        except FileNotFoundError:
+            # Not written yet, or rotated away between two reads
+            lines, next_offset = [], max(0, offset)
+        lines = [line for line in lines if line_filter.matches(line)]
+    else:
+        next_offset = os.path.getsize(LOG_FILE_PATH) if os.path.exists(LOG_FILE_PATH) else 0
+        paths = rotated_log_paths(LOG_FILE_PATH, LOG_BACKUP_COUNT)
+        count = LOG_TAIL_DEFAULT_LINES if tail is None else max(0, tail)
+        lines = await asyncio.to_thread(tail_lines, paths, count, line_filter, next_offset)
+
+    content = "\n".join(lines) + "\n" if lines else ""
+    return PlainTextResponse(content, headers={"X-Log-Offset": str(next_offset)})
+
+@app.get("/admin/logs/follow", response_class=StreamingResponse)
+async def follow_logs(offset: Optional[int] = None, level: Optional[str] = None, contains: Optional[str] = None,
+                      _: str = Depends(get_current_user_if_admin)):
+    """Stream new log lines as server-sent events, starting at `offset` or the current end of the log."""
+    line_filter = create_log_line_filter(level, contains)
+    follower = LogFollower(LOG_FILE_PATH, offset)
+
+    async def events():
+        idle_seconds = 0.0
+        while True:
+            lines = await asyncio.to_thread(follower.read_new_lines)
+            matched = [line for line in lines if line_filter.matches(line)]
+            for line in matched:
+                yield f"data: {line}\n\n"
+            if matched:
+                yield f"id: {follower.offset}\n\n"
+                idle_seconds = 0.0
+            elif idle_seconds >= LOG_FOLLOW_KEEPALIVE_SECONDS:
+                yield ": keep-alive\n\n"
+                idle_seconds = 0.0
+
+            await asyncio.sleep(LOG_FOLLOW_POLL_SECONDS)
+            idle_seconds += LOG_FOLLOW_POLL_SECONDS
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# Sortable columns of the admin listings, each backed by an index ending in the primary key
+ADMIN_USER_SORT_COLUMNS = {'email': 'email', 'created_at': 'created_at'}
+ADMIN_DEVICE_SORT_COLUMNS = {'imei': 'imei', 'name': 'name', 'created_at': 'created_at'}
+
+def set_pagination_headers(response: Response, next_cursor: Optional[str], total: int, exact: bool):
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    response.headers["X-Total-Count"] = str(total)
+    response.headers["X-Total-Count-Exact"] = "true" if exact else "false"
+
+async def fetch_admin_page(table: str, select: str, sort_columns: Dict[str, str], key_column: str, search_column: str,
+                     sort: str, order: str, q: Optional[str], limit: int, cursor: Optional[str]):
+    """A keyset page of an admin listing, read with SQLiteRepository.run_read, which is not on the Repository interface."""
+    if sort not in sort_columns:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by {sort}")
+    if order not in ('asc', 'desc'):
+        raise HTTPException(status_code=400, detail="Order must be asc or desc")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    where, params = [], []
+    if q:
+        where.append(f'{search_column} >= ? AND {search_column} < ?')
+        params.extend(prefix_range(q))
+
+    sort_column = sort_columns[sort]
+
+    def read(conn: sqlite3.Connection):
+        db_cursor = conn.cursor()
+        rows, next_cursor = fetch_keyset_page(db_cursor, f'{select}, {sort_column}, {key_column} FROM {table}',
+                                              where, params, sort_column, key_column, order == 'desc', limit, cursor)
+        total, exact = estimate_count(db_cursor, table, where, params)
+        return rows, next_cursor, total, exact
 
-    return StreamingResponse(iterfile())
+    try:
+        return await repository.run_read(read)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/admin/users")
-async def get_users(_: str = Depends(get_current_user_if_admin)):
-    """Get all users"""
-    with db_manager.get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT uuid, email, created_at, last_seen, role FROM users')
-
-        users = []
-        for row in cursor.fetchall():
-            users.append({
-                'uuid': row[0],
-                'email': row[1],
-                'created_at': row[2],
-                'last_seen': row[3],
-                'role': row[4],
-            })
-        return users
+async def get_users(response: Response, limit: int = 100, cursor: Optional[str] = None, sort: str = 'email',
+                    order: str = 'asc', q: Optional[str] = None, _: str = Depends(get_current_user_if_admin)):
+    """
+    Get a page of users, optionally only those whose email starts with `q`.
+    The cursor for the next page and the (estimated) total are returned in headers.
+    """
+    rows, next_cursor, total, exact = await fetch_admin_page(
+        'users', 'SELECT uuid, email, created_at, last_seen, role', ADMIN_USER_SORT_COLUMNS, 'uuid', 'email',
+        sort, order, q, limit, cursor)
+    set_pagination_headers(response, next_cursor, total, exact)
+
+    users = []
+    for row in rows:
+        users.append({
+            'uuid': row[0],
+            'email': row[1],
+            'created_at': row[2],
+            'last_seen': row[3],
+            'role': row[4],
+        })
+    return users
 
 @app.get("/admin/devices")
-async def get_all_devices(_: str = Depends(get_current_user_if_admin)):
-    """Get all devices for all users."""
+async def get_all_devices(response: Response, limit: int = 100, cursor: Optional[str] = None, sort: str = 'imei',
+                          order: str = 'asc', q: Optional[str] = None, _: str = Depends(get_current_user_if_admin)):
+    """
+    Get a page of devices for all users, optionally only those whose IMEI starts with `q`.
+    The cursor for the next page and the (estimated) total are returned in headers.
+    """
+    rows, next_cursor, total, exact = await fetch_admin_page(
+        'devices', 'SELECT imei, owner_uuid, name', ADMIN_DEVICE_SORT_COLUMNS, 'imei', 'imei',
+        sort, order, q, limit, cursor)
+    set_pagination_headers(response, next_cursor, total, exact)
+
+    devices = []
+    for row in rows:
+        devices.append({
+            'device_id': row[0],
+            'owner_uuid': row[1],
+            'device_name': row[2],
+        })
+    return devices
+
+@app.get("/admin/fleet_stats")
+async def get_fleet_stats(limit: int = 100, _: str = Depends(get_current_user_if_admin)):
+    """Fleet health overview: counts by connection type, battery histogram, and low battery, weak signal and stale devices."""
+    return fleet_stats.summary(limit=max(0, min(limit, MAX_PAGE_SIZE)))
+
+# Sort keys of the query statistics
+DB_QUERY_STATS_SORT_KEYS = {'total_ms', 'mean_ms', 'max_ms', 'count', 'slow_count'}
+
+@app.get("/admin/db/queries")
+async def get_query_stats(sort: str = 'total_ms', limit: int = 50, _: str = Depends(get_current_user_if_admin)):
+    """Time spent per statement and calling function since startup or the last reset, with the plan of the last slow run."""
+    if sort not in DB_QUERY_STATS_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by {sort}")
+    return query_profiler.summary(sort, max(1, min(limit, MAX_PAGE_SIZE)))
+
+@app.delete("/admin/db/queries")
+async def reset_query_stats(_: str = Depends(get_current_user_if_admin)):
+    """Start collecting query statistics afresh, e.g. before a load test."""
+    query_profiler.reset()
+    return {"message": "Query statistics reset"}
+
+@app.post("/admin/profile", response_class=PlainTextResponse)
+async def run_sampling_profile(seconds: float = 10, interval_ms: float = 5, _: str = Depends(get_current_user_if_admin)):
+    """
+    Sample the stacks of every thread of this process for `seconds` while it keeps serving, and return them
+    collapsed, one "thread;outer;...;inner count" line per stack, ready for flamegraph.pl or speedscope.
+    """
+    global active_profile
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"Seconds must be above 0 and at most {PROFILE_MAX_SECONDS}")
+    if not PROFILE_MIN_INTERVAL_MS <= interval_ms <= PROFILE_MAX_INTERVAL_MS:
+        raise HTTPException(status_code=400,
+                            detail=f"Interval must be {PROFILE_MIN_INTERVAL_MS} to {PROFILE_MAX_INTERVAL_MS} ms")
+    if active_profile is not None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    active_profile = SamplingProfiler(interval_ms / 1000)
+    try:
+        logger.info(f"Sampling profile for {seconds}s every {interval_ms} ms")
+        await asyncio.to_thread(active_profile.run, seconds)
+        return PlainTextResponse(active_profile.collapsed(), headers={"X-Profile-Samples": str(active_profile.samples)})
+    finally:
+        active_profile = None
+
+@app.get("/admin/backups")
+async def get_backups(_: str = Depends(get_current_user_if_admin)):
+    """List database backups, newest first."""
+    return backup_manager.list_backups()
+
+@app.post("/admin/backups")
+async def create_backup(_: str = Depends(get_current_user_if_admin)):
+    """Back up the database while it stays online."""
+    try:
+        return await backup_manager.create_backup()
+    except BackupInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Backup error: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.put("/admin/users/{user_uuid}/role")
+async def update_user_role(user_uuid: str, request: UpdateUserRoleRequest, _: str = Depends(get_current_user_if_admin)):
+    """Change the role of a user."""
+    if request.role not in (ROLE_ADMIN, ROLE_USER):
+        raise HTTPException(status_code=400, detail="Invalid role")
+
     with db_manager.get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT d.imei, d.owner_uuid, d.name
-            FROM devices d
-        ''', )
-
-        devices = []
-        for row in cursor.fetchall():
-            devices.append({
-                'device_id': row[0],
-                'owner_uuid': row[1],
-                'device_name': row[2],
-            })
-        return devices
+        cursor.execute('UPDATE users SET role = ? WHERE uuid = ?', (request.role, user_uuid))
+        if cursor.rowcount == 0:
+            raise HTTPException(status_code=404, detail="User not found")
+        conn.commit()
+
+    role_cache.invalidate(user_uuid)
+    return {"message": "User role updated"}
 
 # WebSocket endpoint
 @app.websocket("/ws")
@@ -1081,26 +1395,32 @@ async def websocket_endpoint(websocket: WebSocket, token: str = None):
     
     try:
         # Send initial data
-        await send_initial_data(user_uuid)
+        with tracer.span("WS connect", root=True, user_uuid=user_uuid):
+            await send_initial_data(user_uuid)
         
         while True:
             # Receive data from client
             data = await websocket.receive_text()
-            message = json.loads(data)
-            
-            await handle_websocket_message(message, user_uuid)
+            with tracer.span("WS message", root=True, user_uuid=user_uuid) as span:
+                with tracer.span("deserialize"):
+                    message = json.loads(data)
+                if span and isinstance(message, dict):
+                    span.name = f"WS {message.get('type')}"
+                await handle_websocket_message(message, user_uuid)
             
     except WebSocketDisconnect:
         connection_manager.disconnect(user_uuid)
     except Exception as e:
         logger.error(f"WebSocket error for user {user_uuid}: {e}")
         connection_manager.disconnect(user_uuid)
+    finally:
+        stop_replay(user_uuid)
 
 async def send_initial_data(user_uuid: str):
     """Send initial data to a newly connected user."""
     try:
         # Send friend locations
-        friend_locations = get_friend_locations(user_uuid)
+        friend_locations = await get_friend_locations(user_uuid)
         if friend_locations:
             await connection_manager.send_personal_message({
                 "type": "user_locations",
@@ -1108,7 +1428,7 @@ async def send_initial_data(user_uuid: str):
             }, user_uuid)
         
         # Send device locations
-        device_locations = get_last_device_locations(user_uuid)
+        device_locations = await get_last_device_locations(user_uuid)
         if device_locations:
             await connection_manager.send_personal_message({
                 "type": "device_locations",
@@ -1116,7 +1436,7 @@ async def send_initial_data(user_uuid: str):
             }, user_uuid)
         
         # Send groups
-        groups = get_user_groups_ws(user_uuid)
+        groups = await get_user_groups_ws(user_uuid)
         if groups:
             await connection_manager.send_personal_message({
                 "type": "groups",
@@ -1131,11 +1451,16 @@ async def handle_websocket_message(message: dict, user_uuid: str):
     try:
         message_type = message.get('type')
         data = message.get('data', {})
+        WEBSOCKET_MESSAGES_RECEIVED.labels(message_type if message_type in WEBSOCKET_MESSAGE_TYPES else 'unknown').inc()
         
         if message_type == 'user_location':
             await handle_user_location_update(data, user_uuid)
         elif message_type == 'device_location':
             await handle_device_location_update(data, user_uuid)
+        elif message_type == 'replay':
+            await start_replay(data, user_uuid)
+        elif message_type == 'replay_stop':
+            stop_replay(user_uuid)
         else:
             logger.warning(f"Unknown message type: {message_type}")
             
@@ -1145,41 +1470,24 @@ async def handle_websocket_message(message: dict, user_uuid: str):
 async def handle_user_location_update(data: dict, user_uuid: str):
     """Handle user location update."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Update user location
-            cursor.execute('''
-                INSERT OR REPLACE INTO user_locations 
-                (uuid, latitude, longitude, altitude, speed, battery, accuracy, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                user_uuid,
-                data.get('latitude'),
-                data.get('longitude'),
-                data.get('altitude'),
-                data.get('speed'),
-                data.get('battery'),
-                data.get('accuracy'),
-                datetime.now()
-            ))
-            
-            # Update user last seen
-            cursor.execute('UPDATE users SET last_seen = ? WHERE uuid = ?', (datetime.now(), user_uuid))
-            
-            conn.commit()
+        now = datetime.now()
+        with DB_QUERY_SECONDS.labels('update_user_location').time():
+            await repository.upsert_user_location(user_uuid, data, now)
+        if user_track_downsampler and user_track_downsampler.keep(user_uuid, data.get('latitude'), data.get('longitude'), now):
+            with DB_QUERY_SECONDS.labels('insert_user_location_history').time():
+                await repository.insert_user_location_history(user_uuid, data, now)
         
         # Broadcast to friends
-        friend_locations = get_friend_locations(user_uuid, include_self=True)
-        user_location = next((loc for loc in friend_locations if loc['uuid'] == user_uuid), None)
+        friend_locations = await get_friend_locations(user_uuid, include_self=True)
+        user_location = next((loc for loc in friend_locations if loc.uuid == user_uuid), None)
         
         if user_location:
             await connection_manager.broadcast_to_friends({
                 "type": "user_locations",
                 "data": [user_location]
-            }, user_uuid, db_manager)
+            }, user_uuid, repository)
         
-        logger.info(f"Updated location for user {user_uuid}")
+        logger.info(f"Updated location for user {user_uuid}", extra={"user_uuid": user_uuid})
         
     except Exception as e:
         logger.error(f"Error handling user location update: {e}")
@@ -1191,401 +1499,180 @@ async def handle_device_location_update(data: dict, user_uuid: str):
         if not device_id:
             logger.warning("Device location update missing device_id/imei")
             return
-        
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Check if device belongs to user
-            cursor.execute('SELECT name FROM devices WHERE imei = ? AND owner_uuid = ?', (device_id, user_uuid))
-            device = cursor.fetchone()
-            if not device:
-                logger.warning(f"Device {device_id} not found for user {user_uuid}")
-                return
-            
-            # Update device location
-            cursor.execute('''
-                INSERT OR REPLACE INTO device_locations 
-                (device_id, latitude, longitude, altitude, speed, battery, battery_mv, 
-                 bark, satellites, lte_signal, lora_rssi, connection_type, time, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                device_id,
-                data.get('latitude') or data.get('lat'),
-                data.get('longitude') or data.get('lon'),
-                data.get('altitude'),
-                data.get('speed'),
-                data.get('battery'),
-                data.get('battery_mv'),
-                data.get('bark'),
-                data.get('satellites'),
-                data.get('lte_signal'),
-                data.get('lora_rssi'),
-                data.get('connection_type'),
-                data.get('time'),
-                datetime.now()
-            ))
-            
-            # Update device last seen
-            cursor.execute('UPDATE devices SET last_seen = ? WHERE imei = ?', (datetime.now(), device_id))
-            
-            conn.commit()
+
+        fix = {column: data.get(column) for column in DEVICE_FIX_COLUMNS}
+        fix['latitude'] = data.get('latitude') or data.get('lat')
+        fix['longitude'] = data.get('longitude') or data.get('lon')
+        fix['seq'] = sequence_number(data.get('seq'))
+
+        # A resent fix is neither stored nor broadcast again
+        key = fix_key(device_id, fix)
+        if key is not None and key in recent_fix_keys:
+            INGEST_DUPLICATE_FIXES.labels('memory').inc()
+            logger.debug(f"Dropped resent fix of device {device_id}")
+            return
+
+        with DB_QUERY_SECONDS.labels('insert_device_location').time():
+            result = await repository.insert_device_location(device_id, user_uuid, fix, datetime.now())
+        if result is IngestResult.UNKNOWN_DEVICE:
+            logger.warning(f"Device {device_id} not found for user {user_uuid}")
+            return
+        if key is not None:
+            recent_fix_keys.add(key)
+        if result is IngestResult.DUPLICATE:
+            INGEST_DUPLICATE_FIXES.labels('database').inc()
+            logger.debug(f"Dropped resent fix of device {device_id}")
+            return
+
+        fleet_stats.record_location(device_id, data.get('battery'), data.get('connection_type'),
+                                    data.get('lte_signal'), data.get('lora_rssi'))
+        rollup_worker.submit(Fix(
+            device_id=device_id,
+            latitude=fix['latitude'],
+            longitude=fix['longitude'],
+            speed=data.get('speed'),
+            battery=data.get('battery'),
+            bark=data.get('bark'),
+            connection_type=data.get('connection_type'),
+            fixed_at=time.time(),
+        ))
         
         # Broadcast to friends and shared users
-        device_location = get_device_location(device_id)
+        device_location = await get_device_location(device_id)
         if device_location is not None:
             # Send to users with whom device is shared
-            device_location['type'] = DeviceLocationType.SHARED.value
+            device_location.type = DeviceLocationType.SHARED.value
             await broadcast_to_shared_users(device_id, {
                 "type": "device_locations",
                 "data": [device_location]
             })
 
             # Send to friends
-            device_location['type'] = DeviceLocationType.FRIEND.value
+            device_location.type = DeviceLocationType.FRIEND.value
             await connection_manager.broadcast_to_friends({
                 "type": "device_locations",
                 "data": [device_location]
-            }, user_uuid, db_manager)
+            }, user_uuid, repository)
                 
             
-        logger.info(f"Updated location for device {device_id}")
+        logger.info(f"Updated location for device {device_id}", extra={"device_id": device_id})
         
     except Exception as e:
         logger.error(f"Error handling device location update: {e}")
 
-def get_friend_locations(user_uuid: str, include_self: bool = False) -> List[dict]:
+def parse_replay_request(data: dict) -> Tuple[str, datetime, datetime, float]:
+    """The device, window and speed of a replay message. Raises ValueError if they are invalid."""
+    imei = data.get('device_id') or data.get('imei')
+    if not imei:
+        raise ValueError("device_id is required")
+    start = datetime.fromisoformat(data['start']) if data.get('start') else None
+    end = datetime.fromisoformat(data['end']) if data.get('end') else None
+    speed = float(data.get('speed', REPLAY_DEFAULT_SPEED))
+    if not 0 < speed <= REPLAY_MAX_SPEED:
+        raise ValueError(f"speed must be above 0 and at most {REPLAY_MAX_SPEED}")
+    return (imei, *history_window(start, end), speed)
+
+async def start_replay(data: dict, user_uuid: str):
+    """
+    Replay the user's walk next to a device's track over the user's WebSocket, replacing a running replay.
+    Sends replay_start, a replay_location per fix of either track in time order, then replay_end.
+    """
+    try:
+        imei, start, end, speed = parse_replay_request(data)
+    except (TypeError, ValueError) as e:
+        await connection_manager.send_personal_message({"type": "replay_error", "data": {"detail": str(e)}}, user_uuid)
+        return
+    if not await repository.user_can_view_device(imei, user_uuid):
+        await connection_manager.send_personal_message({"type": "replay_error", "data": {"detail": "Device not found"}},
+                                                       user_uuid)
+        return
+
+    device_fixes = await read_device_history(imei, start, end, LOCATION_HISTORY_MAX_FIXES)
+    user_fixes = []
+    if user_track_downsampler:
+        user_fixes = await repository.get_user_location_history(user_uuid, start, end, LOCATION_HISTORY_MAX_FIXES)
+    timeline = merge_tracks({'user': user_fixes, 'device': device_fixes})
+
+    stop_replay(user_uuid)
+    replay_tasks[user_uuid] = asyncio.create_task(run_replay(user_uuid, imei, timeline, speed))
+
+async def run_replay(user_uuid: str, imei: str, timeline: list, speed: float):
+    async def send(track: str, fix: dict):
+        source = {"device_id": imei} if track == 'device' else {"uuid": user_uuid}
+        await connection_manager.send_personal_message({
+            "type": "replay_location",
+            "data": {"track": track, **source, **history_output(fix)}
+        }, user_uuid)
+
+    try:
+        await connection_manager.send_personal_message({
+            "type": "replay_start",
+            "data": {"device_id": imei, "fixes": len(timeline), "speed": speed}
+        }, user_uuid)
+        sent = await replay(timeline, speed, send)
+        await connection_manager.send_personal_message({"type": "replay_end", "data": {"fixes": sent}}, user_uuid)
+    except Exception as e:
+        logger.error(f"Error replaying device {imei} for user {user_uuid}: {e}")
+    finally:
+        if replay_tasks.get(user_uuid) is asyncio.current_task():
+            del replay_tasks[user_uuid]
+
+def stop_replay(user_uuid: str):
+    task = replay_tasks.pop(user_uuid, None)
+    if task:
+        task.cancel()
+
+@timed(DB_QUERY_SECONDS, 'get_friend_locations')
+async def get_friend_locations(user_uuid: str, include_self: bool = False) -> List[UserLocation]:
     """Get locations of user's friends."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            query = '''
-                SELECT u.uuid, u.email, u.nickname, ul.latitude, ul.longitude, 
-                       ul.altitude, ul.speed, ul.battery, ul.accuracy, ul.timestamp
-                FROM users u
-                JOIN user_locations ul ON u.uuid = ul.uuid
-                WHERE u.uuid IN (
-                    SELECT f.friend_uuid FROM friends f 
-                    WHERE f.user_uuid = ? AND f.status = 'accepted'
-                    UNION
-                    SELECT f.user_uuid FROM friends f 
-                    WHERE f.friend_uuid = ? AND f.status = 'accepted'
-                )
-            '''
-            
-            if include_self:
-                query += ' OR u.uuid = ?'
-                cursor.execute(query, (user_uuid, user_uuid, user_uuid))
-            else:
-                cursor.execute(query, (user_uuid, user_uuid))
-            
-            locations = []
-            for row in cursor.fetchall():
-                locations.append({
-                    'uuid': row[0],
-                    'email': row[1],
-                    'nickname': row[2],
-                    'latitude': row[3],
-                    'longitude': row[4],
-                    'altitude': row[5],
-                    'speed': row[6],
-                    'battery': row[7],
-                    'accuracy': row[8],
-                    'timestamp': row[9]
-                })
-            
-            return locations
-            
+        return await repository.get_friend_locations(user_uuid, include_self)
     except Exception as e:
         logger.error(f"Error getting friend locations: {e}")
         return []
 
-def get_owned_device_locations(user_uuid: str) -> List[dict]:
+@timed(DB_QUERY_SECONDS, 'get_owned_device_locations')
+async def get_owned_device_locations(user_uuid: str) -> List[DeviceLocation]:
     """Get last location of user's owned devices."""
-
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT d.imei, d.owner_uuid, u.email, u.nickname, d.name,
-                       dl.latitude, dl.longitude, dl.altitude, dl.speed, dl.battery,
-                       dl.battery_mv, dl.bark, dl.satellites, dl.lte_signal, dl.lora_rssi,
-                       dl.connection_type, dl.time, dl.timestamp, 'own' as type
-                FROM devices d
-                JOIN users u ON d.owner_uuid = u.uuid
-                LEFT JOIN device_locations dl ON d.imei = dl.device_id
-                WHERE d.owner_uuid = ?
-                    AND dl.timestamp IS NULL OR (d.imei, dl.timestamp) IN (
-                        SELECT device_id, MAX(timestamp)
-                        FROM device_locations
-                        GROUP BY device_id
-                    )
-            ''', (user_uuid,))
-            
-            locations = []
-            for row in cursor.fetchall():
-                locations.append({
-                    'device_id': row[0],
-                    'owner_uuid': row[1],
-                    'owner_email': row[2],
-                    'owner_nickname': row[3],
-                    'device_name': row[4],
-                    'latitude': row[5],
-                    'longitude': row[6],
-                    'altitude': row[7],
-                    'speed': row[8],
-                    'battery': row[9],
-                    'battery_mv': row[10],
-                    'bark': row[11],
-                    'satellites': row[12],
-                    'lte_signal': row[13],
-                    'lora_rssi': row[14],
-                    'connection_type': row[15],
-                    'time': row[16],
-                    'timestamp': row[17],
-                    'type': row[18]
-                })
-            return locations
+        return await repository.get_owned_device_locations(user_uuid)
     except Exception as e:
         logger.error(f"Error getting owned device locations: {e}")
         return []
 
-def get_device_location(imei: str) -> dict | None:
+@timed(DB_QUERY_SECONDS, 'get_device_location')
+async def get_device_location(imei: str) -> Optional[DeviceLocation]:
     """ Get last location of given device """
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT d.imei, d.owner_uuid, u.email, u.nickname, d.name,
-                       dl.latitude, dl.longitude, dl.altitude, dl.speed, dl.battery,
-                       dl.battery_mv, dl.bark, dl.satellites, dl.lte_signal, dl.lora_rssi,
-                       dl.connection_type, dl.time, dl.timestamp
-                FROM devices d
-                JOIN users u ON d.owner_uuid = u.uuid
-                LEFT JOIN device_locations dl ON d.imei = dl.device_id
-                WHERE d.imei = ?
-                    AND dl.timestamp IS NULL OR (d.imei, dl.timestamp) IN (
-                        SELECT device_id, MAX(timestamp)
-                        FROM device_locations
-                        GROUP BY device_id
-                    )
-            ''', (imei,))
-           
-            row = cursor.fetchone()
-            return {
-                    'device_id': row[0],
-                    'owner_uuid': row[1],
-                    'owner_email': row[2],
-                    'owner_nickname': row[3],
-                    'device_name': row[4],
-                    'latitude': row[5],
-                    'longitude': row[6],
-                    'altitude': row[7],
-                    'speed': row[8],
-                    'battery': row[9],
-                    'battery_mv': row[10],
-                    'bark': row[11],
-                    'satellites': row[12],
-                    'lte_signal': row[13],
-                    'lora_rssi': row[14],
-                    'connection_type': row[15],
-                    'time': row[16],
-                    'timestamp': row[17],
-                }
+        return await repository.get_device_location(imei)
     except Exception as e:
-        logger.error(f"Error getting owned device locations: {e}")
+        logger.error(f"Error getting device location: {e}")
         return None
 
-def get_all_device_locations(user_uuid: str) -> List[dict]:
+@timed(DB_QUERY_SECONDS, 'get_all_device_locations')
+async def get_all_device_locations(user_uuid: str) -> List[DeviceLocation]:
     """Get all device locations the user has access to."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            locations = []
-            cursor.execute('''
-                SELECT d.imei, d.owner_uuid, u.email, u.nickname, d.name,
-                       dl.latitude, dl.longitude, dl.altitude, dl.speed, dl.battery,
-                       dl.battery_mv, dl.bark, dl.satellites, dl.lte_signal, dl.lora_rssi,
-                       dl.connection_type, dl.time, dl.timestamp, 'own' as type
-                FROM devices d
-                JOIN users u ON d.owner_uuid = u.uuid
-                LEFT JOIN device_locations dl ON d.imei = dl.device_id
-                WHERE d.owner_uuid = ?
-                ORDER BY d.imei, dl.timestamp
-            ''', (user_uuid,))
-            
-            for row in cursor.fetchall():
-                locations.append({
-                    'device_id': row[0],
-                    'owner_uuid': row[1],
-                    'owner_email': row[2],
-                    'owner_nickname': row[3],
-                    'device_name': row[4],
-                    'latitude': row[5],
-                    'longitude': row[6],
-                    'altitude': row[7],
-                    'speed': row[8],
-                    'battery': row[9],
-                    'battery_mv': row[10],
-                    'bark': row[11],
-                    'satellites': row[12],
-                    'lte_signal': row[13],
-                    'lora_rssi': row[14],
-                    'connection_type': row[15],
-                    'time': row[16],
-                    'timestamp': row[17],
-                    'type': row[18]
-                })
-
-            cursor = conn.cursor()
-            cursor.execute('''
-              WITH sharedDevices AS (
-                  SELECT
-                      d.imei,
-                      d.owner_uuid as owner_uuid,
-                      u.email as email,
-                      u.nickname as nickname,
-                      d.name as name,
-                      'shared' as type
-                  FROM device_shares ds
-                  INNER JOIN devices d ON ds.device_imei = d.imei
-                  INNER JOIN users u ON d.owner_uuid = u.uuid
-                  WHERE ds.shared_with_uuid = ?
-              )
-              SELECT sd.imei, sd.owner_uuid, sd.email, sd.nickname, sd.name,
-                     dl.latitude, dl.longitude, dl.altitude, dl.speed, dl.battery,
-                     dl.battery_mv, dl.bark, dl.satellites, dl.lte_signal, dl.lora_rssi,
-                     dl.connection_type, dl.time, dl.timestamp, sd.type
-              FROM sharedDevices sd
-              LEFT JOIN device_locations dl ON sd.imei = dl.device_id
-              ORDER BY sd.imei, dl.timestamp
-              ''', (user_uuid,)) 
-        
-            for row in cursor.fetchall():
-                locations.append({
-                    'device_id': row[0],
-                    'owner_uuid': row[1],
-                    'owner_email': row[2],
-                    'owner_nickname': row[3],
-                    'device_name': row[4],
-                    'latitude': row[5],
-                    'longitude': row[6],
-                    'altitude': row[7],
-                    'speed': row[8],
-                    'battery': row[9],
-                    'battery_mv': row[10],
-                    'bark': row[11],
-                    'satellites': row[12],
-                    'lte_signal': row[13],
-                    'lora_rssi': row[14],
-                    'connection_type': row[15],
-                    'time': row[16],
-                    'timestamp': row[17],
-                    'type': row[18]
-                })
-            return locations
-        
+        return await repository.get_all_device_locations(user_uuid)
     except Exception as e:
         logger.error(f"Error getting device locations: {e}")
         return []
 
-def get_last_device_locations(user_uuid: str) -> List[dict]:
+@timed(DB_QUERY_SECONDS, 'get_last_device_locations')
+async def get_last_device_locations(user_uuid: str) -> List[DeviceLocation]:
     """Get last locations of user's own devices and devices shared with the user."""
     try:
-        locations = get_owned_device_locations(user_uuid)
-
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-              WITH sharedDevices AS (
-                  SELECT
-                      d.imei,
-                      d.owner_uuid as owner_uuid,
-                      u.email as email,
-                      u.nickname as nickname,
-                      d.name as name,
-                      'shared' as type
-                  FROM device_shares ds
-                  INNER JOIN devices d ON ds.device_imei = d.imei
-                  INNER JOIN users u ON d.owner_uuid = u.uuid
-                  WHERE ds.shared_with_uuid = ?
-              )
-              SELECT sd.imei, sd.owner_uuid, sd.email, sd.nickname, sd.name,
-                     dl.latitude, dl.longitude, dl.altitude, dl.speed, dl.battery,
-                     dl.battery_mv, dl.bark, dl.satellites, dl.lte_signal, dl.lora_rssi,
-                     dl.connection_type, dl.time, dl.timestamp, sd.type
-              FROM sharedDevices sd
-              LEFT JOIN device_locations dl ON sd.imei = dl.device_id
-              WHERE dl.timestamp IS NULL OR (sd.imei, dl.timestamp) IN (
-                  SELECT device_id, MAX(timestamp)
-                  FROM device_locations
-                  WHERE device_id IN (SELECT imei FROM sharedDevices)
-                  GROUP BY device_id
-              )
-              ''', (user_uuid,)) 
-        
-            for row in cursor.fetchall():
-                locations.append({
-                    'device_id': row[0],
-                    'owner_uuid': row[1],
-                    'owner_email': row[2],
-                    'owner_nickname': row[3],
-                    'device_name': row[4],
-                    'latitude': row[5],
-                    'longitude': row[6],
-                    'altitude': row[7],
-                    'speed': row[8],
-                    'battery': row[9],
-                    'battery_mv': row[10],
-                    'bark': row[11],
-                    'satellites': row[12],
-                    'lte_signal': row[13],
-                    'lora_rssi': row[14],
-                    'connection_type': row[15],
-                    'time': row[16],
-                    'timestamp': row[17],
-                    'type': row[18]
-                })
-            return locations
-            
+        locations = await get_owned_device_locations(user_uuid)
+        return locations + await repository.get_shared_device_locations(user_uuid)
     except Exception as e:
         logger.error(f"Error getting device locations: {e}")
         return []
 
-def get_user_groups_ws(user_uuid: str) -> List[dict]:
+@timed(DB_QUERY_SECONDS, 'get_user_groups_ws')
+async def get_user_groups_ws(user_uuid: str) -> List[Group]:
     """Get user's groups for WebSocket."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT g.id, g.name, g.description, g.owner_id, g.created_at
-                FROM groups g
-                LEFT JOIN group_members gm ON g.id = gm.group_id
-                WHERE g.owner_id = ? OR gm.user_uuid = ?
-                GROUP BY g.id
-            ''', (user_uuid, user_uuid))
-            
-            groups = []
-            for row in cursor.fetchall():
-                group_id = row[0]
-                
-                # Get member IDs
-                cursor.execute('SELECT user_uuid FROM group_members WHERE group_id = ?', (group_id,))
-                member_ids = [member[0] for member in cursor.fetchall()]
-                
-                groups.append({
-                    'id': group_id,
-                    'name': row[1],
-                    'description': row[2],
-                    'owner_id': row[3],
-                    'member_ids': member_ids,
-                    'created_at': row[4]
-                })
-            
-            return groups
-            
+        return await repository.get_user_groups(user_uuid)
     except Exception as e:
         logger.error(f"Error getting user groups: {e}")
         return []
@@ -1593,12 +1680,12 @@ def get_user_groups_ws(user_uuid: str) -> List[dict]:
 async def broadcast_to_shared_users(device_imei: str, message: dict):
     """Broadcast message to users with whom device is shared."""
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT shared_with_uuid FROM device_shares WHERE device_imei = ?', (device_imei,))
-            
-            for row in cursor.fetchall():
-                shared_with_uuid = row[0]
+        with DB_QUERY_SECONDS.labels('broadcast_to_shared_users').time():
+            shared_with_uuids = await repository.get_device_share_recipients(device_imei)
+
+        BROADCAST_FANOUT.labels('shared_users').observe(len(shared_with_uuids))
+        with tracer.span("fanout.shared_users", recipients=len(shared_with_uuids)):
+            for shared_with_uuid in shared_with_uuids:
                 await connection_manager.send_personal_message(message, shared_with_uuid)
                 
     except Exception as e:
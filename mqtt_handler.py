@@ -7,6 +7,8 @@ from dotenv import load_dotenv
 import paho.mqtt.client as mqtt
 from datetime import datetime
 
+from metrics import Counter
+
 # Load from custom env file
 load_dotenv(dotenv_path="mqtt.env")
 
@@ -16,12 +18,18 @@ MQTT_USERNAME = os.getenv("MQTT_USERNAME")
 MQTT_PASSWORD = os.getenv("MQTT_PASSWORD")
 MQTT_TOPIC_PREFIX = os.getenv("MQTT_TOPIC_PREFIX", "DogTracker/devices/")
 
+logger = logging.getLogger(__name__)
+
+MQTT_MESSAGES_RECEIVED = Counter('dogtracker_mqtt_messages_received_total', 'MQTT messages received')
+MQTT_UPDATES_ASSEMBLED = Counter('dogtracker_mqtt_updates_assembled_total', 'Complete location updates assembled from MQTT topics')
+MQTT_MESSAGES_DROPPED = Counter('dogtracker_mqtt_messages_dropped_total', 'MQTT messages dropped by reason', ['reason'])
+
 # Topic buffer for assembling packets
 device_buffers = {}  # key = device_id
 backend_callback = None  # set by main to receive parsed payloads
 
 def on_connect(client, userdata, flags, rc):
-    logging.info(f"[MQTT] Connected with result code {rc}")
+    logger.info(f"[MQTT] Connected with result code {rc}")
     client.subscribe(MQTT_TOPIC_PREFIX + "+/Position/latitude")
     client.subscribe(MQTT_TOPIC_PREFIX + "+/Position/longitude")
     client.subscribe(MQTT_TOPIC_PREFIX + "+/battery")
@@ -30,11 +38,13 @@ def on_connect(client, userdata, flags, rc):
 def on_message(client, userdata, msg):
     topic = msg.topic
     payload = msg.payload.decode("utf-8")
-    logging.info(f"[MQTT] {topic}: {payload}")
+    logger.debug(f"[MQTT] {topic}: {payload}")
+    MQTT_MESSAGES_RECEIVED.inc()
 
     try:
         parts = topic[len(MQTT_TOPIC_PREFIX):].split("/")
         if len(parts) < 2:
+            MQTT_MESSAGES_DROPPED.labels('bad_topic').inc()
             return
 
         device_id = parts[0]
@@ -58,6 +68,7 @@ def on_message(client, userdata, msg):
         elif subtopic == "bark":
             buf["bark"] = int(payload)
         else:
+            MQTT_MESSAGES_DROPPED.labels('unknown_subtopic').inc()
             return
 
         buf["last_update"] = datetime.utcnow().isoformat()
@@ -74,12 +85,14 @@ def on_message(client, userdata, msg):
                     "timestamp": buf["last_update"]
                 }
             }
-            logging.info(f"[MQTT] Dispatching full update for {device_id}")
+            logger.info(f"[MQTT] Dispatching full update for {device_id}")
+            MQTT_UPDATES_ASSEMBLED.inc()
             if backend_callback:
                 backend_callback(assembled)
 
     except Exception as e:
-        logging.warning(f"[MQTT] Failed to parse message: {e}")
+        MQTT_MESSAGES_DROPPED.labels('parse_error').inc()
+        logger.warning(f"[MQTT] Failed to parse message: {e}")
 
 
 def start_mqtt_thread(callback):
@@ -91,5 +104,5 @@ def start_mqtt_thread(callback):
     client.on_message = on_message
     client.connect(MQTT_BROKER, MQTT_PORT, 60)
     threading.Thread(target=client.loop_forever, daemon=True).start()
-    logging.info("[MQTT] MQTT listener started")
+    logger.info("[MQTT] MQTT listener started")
 
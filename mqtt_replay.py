@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Record, replay and synthesize tracker MQTT traffic, to load test the assembly and ingest path
+deterministically without real collars.
+
+    python -m mqtt_replay record --out traffic.jsonl.gz [--duration 3600]
+    python -m mqtt_replay replay traffic.jsonl.gz [--speed 10] [--target broker|handler]
+    python -m mqtt_replay synthesize --devices 500 --duration 3600 --out fleet.jsonl.gz
+    python -m mqtt_replay synthesize --devices 500 --duration 600 --speed 100 --target handler
+
+Recordings are gzipped JSON lines: a header, then one [milliseconds since start, topic, payload] per message,
+with topics relative to MQTT_TOPIC_PREFIX. The broker settings come from mqtt.env like for mqtt_handler.
+Replaying into the handler calls mqtt_handler.on_message directly, in this process.
+"""
+import argparse
+import gzip
+import json
+import logging
+import math
+import random
+import sys
+import time
+from types import SimpleNamespace
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Sequence
+
+import mqtt_handler
+
+RECORDING_VERSION = 1
+# The subtopics mqtt_handler assembles into one update, in the order trackers publish them
+UPDATE_SUBTOPICS = ['Position/latitude', 'Position/longitude', 'battery', 'bark']
+SYNTHETIC_DEVICE_PREFIX = '359'
+RANDOM_SEED = 42
+
+logger = logging.getLogger(__name__)
+
+
+class MqttRecord(NamedTuple):
+    offset: float  # seconds since the start of the recording
+    topic: str  # relative to the topic prefix
+    payload: str
+
+
+# Recordings
+def write_recording(path: str, records: Iterable[MqttRecord], prefix: str = mqtt_handler.MQTT_TOPIC_PREFIX) -> int:
+    """Write records to a recording file, returning how many were written."""
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as file:
+        file.write(json.dumps({'version': RECORDING_VERSION, 'prefix': prefix}) + '\n')
+        for record in records:
+            file.write(json.dumps([round(record.offset * 1000), record.topic, record.payload], separators=(',', ':')) + '\n')
+            count += 1
+    return count
+
+def read_recording(path: str) -> Iterator[MqttRecord]:
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        header = json.loads(file.readline())
+        if header.get('version') != RECORDING_VERSION:
+            raise ValueError(f"Unsupported recording version {header.get('version')}")
+        for line in file:
+            offset_ms, topic, payload = json.loads(line)
+            yield MqttRecord(offset_ms / 1000, topic, payload)
+
+
+# Synthetic fleet
+def synthesize_fleet(devices: int, duration: float, interval: float = 10.0, seed: int = RANDOM_SEED,
+                     device_prefix: str = SYNTHETIC_DEVICE_PREFIX) -> Iterator[MqttRecord]:
+    """
+    Trackers walking random-walk tracks, each publishing a full update every `interval` seconds.
+    Devices are spread over the interval, so the traffic is steady rather than bursty. Deterministic for a seed.
+    """
+    rng = random.Random(seed)
+    device_ids = [f'{device_prefix}{index:012d}' for index in range(devices)]
+    positions = [[59.9 + rng.uniform(-0.5, 0.5), 10.7 + rng.uniform(-0.5, 0.5)] for _ in device_ids]
+    headings = [rng.uniform(0, 2 * math.pi) for _ in device_ids]
+    batteries = [rng.randint(60, 100) for _ in device_ids]
+    phases = [index * interval / max(1, devices) for index in range(devices)]
+
+    step = 0
+    while step * interval < duration:
+        for index, device_id in enumerate(device_ids):
+            offset = step * interval + phases[index]
+            if offset >= duration:
+                continue
+            # Wander at walking to running speed, turning a little every fix
+            headings[index] += rng.gauss(0, 0.4)
+            meters = rng.uniform(0, 4) * interval
+            position = positions[index]
+            position[0] += meters * math.cos(headings[index]) / 111320
+            position[1] += meters * math.sin(headings[index]) / (111320 * math.cos(math.radians(position[0])))
+            if rng.random() < 0.002:
+                batteries[index] = max(0, batteries[index] - 1)
+
+            payloads = [f'{position[0]:.6f}', f'{position[1]:.6f}', str(batteries[index]),
+                        '1' if rng.random() < 0.05 else '0']
+            for subtopic, payload in zip(UPDATE_SUBTOPICS, payloads):
+                yield MqttRecord(offset, f'{device_id}/{subtopic}', payload)
+        step += 1
+
+
+# Replay
+def replay(records: Iterable[MqttRecord], publish: Callable[[str, str], None], speed: float = 1.0,
+           clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep) -> int:
+    """
+    Publish records to `publish(relative topic, payload)` at `speed` times the recorded pace.
+    Records must be in offset order. Returns how many were published.
+    """
+    if speed <= 0:
+        raise ValueError("Speed must be positive")
+    started = clock()
+    count = 0
+    for record in records:
+        delay = started + record.offset / speed - clock()
+        if delay > 0:
+            sleep(delay)
+        publish(record.topic, record.payload)
+        count += 1
+    return count
+
+def handler_publisher(prefix: str = mqtt_handler.MQTT_TOPIC_PREFIX) -> Callable[[str, str], None]:
+    """Publish straight into mqtt_handler.on_message, as if the broker delivered the message."""
+    def publish(topic: str, payload: str):
+        mqtt_handler.on_message(None, None, SimpleNamespace(topic=prefix + topic, payload=payload.encode('utf-8')))
+    return publish
+
+def create_client():
+    import paho.mqtt.client as mqtt
+    # paho-mqtt 2 asks for the callback API version explicitly
+    if hasattr(mqtt, 'CallbackAPIVersion'):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    else:
+        client = mqtt.Client()
+    client.username_pw_set(mqtt_handler.MQTT_USERNAME, mqtt_handler.MQTT_PASSWORD)
+    return client
+
+
+# Recording from a broker
+def record(path: str, duration: Optional[float] = None, prefix: str = mqtt_handler.MQTT_TOPIC_PREFIX) -> int:
+    """Record the trackers' traffic on the broker until `duration` seconds passed or interrupted."""
+    records = []
+    started = time.monotonic()
+
+    def on_connect(client, *_):
+        client.subscribe(prefix + '#')
+
+    def on_message(client, userdata, msg):
+        if msg.topic.startswith(prefix):
+            records.append(MqttRecord(time.monotonic() - started, msg.topic[len(prefix):], msg.payload.decode('utf-8')))
+
+    client = create_client()
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(mqtt_handler.MQTT_BROKER, mqtt_handler.MQTT_PORT, 60)
+    client.loop_start()
+    try:
+        while duration is None or time.monotonic() - started < duration:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+    return write_recording(path, list(records), prefix)
+
+
+def replay_to_target(records: Iterable[MqttRecord], target: str, speed: float) -> int:
+    if target == 'handler':
+        # It logs every dispatched update, which would swamp the console at replay speeds
+        logging.getLogger(mqtt_handler.__name__).setLevel(logging.WARNING)
+        assembled = []
+        mqtt_handler.backend_callback = assembled.append
+        count = replay(records, handler_publisher(), speed)
+        logger.info(f"mqtt_handler assembled {len(assembled)} updates")
+        return count
+
+    client = create_client()
+    client.connect(mqtt_handler.MQTT_BROKER, mqtt_handler.MQTT_PORT, 60)
+    client.loop_start()
+    try:
+        return replay(records, lambda topic, payload: client.publish(mqtt_handler.MQTT_TOPIC_PREFIX + topic, payload), speed)
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help='Record traffic from the broker')
+    record_parser.add_argument('--out', required=True)
+    record_parser.add_argument('--duration', type=float, help='Seconds to record, until interrupted by default')
+
+    replay_parser = subparsers.add_parser('replay', help='Replay a recording')
+    replay_parser.add_argument('path')
+
+    synthesize_parser = subparsers.add_parser('synthesize', help='Generate traffic of a simulated fleet')
+    synthesize_parser.add_argument('--devices', type=int, required=True)
+    synthesize_parser.add_argument('--duration', type=float, required=True, help='Seconds of traffic')
+    synthesize_parser.add_argument('--interval', type=float, default=10.0, help='Seconds between updates of a device')
+    synthesize_parser.add_argument('--seed', type=int, default=RANDOM_SEED)
+    synthesize_parser.add_argument('--out', help='Write a recording instead of replaying')
+
+    for subparser in (replay_parser, synthesize_parser):
+        subparser.add_argument('--speed', type=float, default=1.0, help='Replay at this multiple of real time, e.g. 100')
+        subparser.add_argument('--target', choices=['broker', 'handler'], default='broker')
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s: %(name)s (%(levelname)s) %(message)s')
+
+    try:
+        started = time.perf_counter()
+        if args.command == 'record':
+            count = record(args.out, args.duration)
+            logger.info(f"Recorded {count} messages to {args.out}")
+            return 0
+
+        records = (read_recording(args.path) if args.command == 'replay'
+                   else synthesize_fleet(args.devices, args.duration, args.interval, args.seed))
+        if args.command == 'synthesize' and args.out:
+            count = write_recording(args.out, records)
+            logger.info(f"Wrote {count} messages to {args.out}")
+            return 0
+
+        count = replay_to_target(records, args.target, args.speed)
+        seconds = time.perf_counter() - started
+        logger.info(f"Replayed {count} messages in {seconds:.1f}s ({count / seconds:.0f}/s) to the {args.target}")
+    except (ValueError, OSError) as e:
+        logger.error(f"{args.command.capitalize()} failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
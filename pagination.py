@@ -0,0 +1,81 @@
+import base64
+import json
+import sqlite3
+from typing import Any, List, Optional, Sequence, Tuple
+
+MAX_PAGE_SIZE = 1000
+COUNT_CAP = 10000
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort key of the last row of a page as an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode()
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError("Invalid cursor")
+    return values
+
+def prefix_range(prefix: str) -> Tuple[str, str]:
+    """Bounds so that `column >= low AND column < high` matches the prefix and can use an index, unlike LIKE."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def fetch_keyset_page(cursor: sqlite3.Cursor, select: str, where: List[str], params: List[Any],
+                      sort_column: str, key_column: str, descending: bool,
+                      limit: int, after: Optional[str]) -> Tuple[List[tuple], Optional[str]]:
+    """
+    Fetch one page ordered by (sort_column, key_column), starting after the cursor.
+    The sort and key values must be the last two columns of `select`. Column names are
+    interpolated and must never come from user input.
+    """
+    where = list(where)
+    params = list(params)
+    if after:
+        sort_value, key_value = decode_cursor(after)
+        comparison = '<' if descending else '>'
+        where.append(f'({sort_column}, {key_column}) {comparison} (?, ?)')
+        params.extend([sort_value, key_value])
+
+    direction = 'DESC' if descending else 'ASC'
+    query = select
+    if where:
+        query += ' WHERE ' + ' AND '.join(where)
+    if sort_column == key_column:
+        query += f' ORDER BY {key_column} {direction} LIMIT ?'
+    else:
+        query += f' ORDER BY {sort_column} {direction}, {key_column} {direction} LIMIT ?'
+    params.append(limit + 1)
+
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1][-2:])
+
+
+def estimate_count(cursor: sqlite3.Cursor, table: str, where: List[str], params: List[Any]) -> Tuple[int, bool]:
+    """
+    Count matching rows, stopping at COUNT_CAP. Past the cap an unfiltered table is
+    estimated from its largest rowid. Returns the count and whether it is exact.
+    """
+    query = f'SELECT COUNT(*) FROM (SELECT 1 FROM {table}'
+    if where:
+        query += ' WHERE ' + ' AND '.join(where)
+    query += ' LIMIT ?)'
+    cursor.execute(query, list(params) + [COUNT_CAP])
+    count = cursor.fetchone()[0]
+    if count < COUNT_CAP:
+        return count, True
+
+    if not where:
+        cursor.execute(f'SELECT MAX(rowid) FROM {table}')
+        return max(count, cursor.fetchone()[0] or 0), False
+
+    return count, False
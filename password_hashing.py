@@ -0,0 +1,83 @@
+import asyncio
+import hashlib
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+import bcrypt
+
+BCRYPT_MAX_PASSWORD_BYTES = 72
+LEGACY_SHA256_HASH_LENGTH = 64
+
+
+class PasswordHasherBusyError(Exception):
+    """Raised when too many hashing jobs are already queued."""
+
+
+def _password_bytes(password: str) -> bytes:
+    # bcrypt only looks at the first 72 bytes, newer versions refuse longer input
+    return password.encode()[:BCRYPT_MAX_PASSWORD_BYTES]
+
+def is_legacy_hash(password_hash: str) -> bool:
+    """Check if a hash is an unsalted SHA-256 hex digest from before bcrypt."""
+    return len(password_hash) == LEGACY_SHA256_HASH_LENGTH and not password_hash.startswith('$')
+
+def hash_password(password: str, rounds: int) -> str:
+    """Hash a password using bcrypt. This is CPU heavy, prefer PasswordHasher.hash."""
+    return bcrypt.hashpw(_password_bytes(password), bcrypt.gensalt(rounds)).decode()
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """Verify a password against a bcrypt or legacy SHA-256 hash."""
+    if is_legacy_hash(password_hash):
+        legacy_hash = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy_hash, password_hash)
+
+    try:
+        return bcrypt.checkpw(_password_bytes(password), password_hash.encode())
+    except ValueError:
+        return False
+
+
+# Password Hasher
+class PasswordHasher:
+    """Runs password hashing on a dedicated thread pool so it never blocks the event loop."""
+
+    def __init__(self, rounds: int = 12, max_workers: int = 2, max_pending: int = 64):
+        self.rounds = rounds
+        self.max_pending = max_pending
+        self._pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hasher")
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def _run(self, func, *args):
+        if self._pending >= self.max_pending:
+            raise PasswordHasherBusyError(f"{self._pending} password hashing jobs already pending")
+
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """Hash a password on the worker pool."""
+        return await self._run(hash_password, password, self.rounds)
+
+    async def verify(self, password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verify a password on the worker pool.
+        Returns whether it matched and, for matching legacy hashes, a bcrypt hash to store instead.
+        """
+        if not await self._run(verify_password, password, password_hash):
+            return False, None
+
+        if is_legacy_hash(password_hash):
+            return True, await self.hash(password)
+
+        return True, None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
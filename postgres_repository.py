@@ -0,0 +1,521 @@
+"""
+PostgreSQL implementation of the Repository surface on an asyncpg connection pool.
+Requires asyncpg (`pip install asyncpg`).
+
+Library only: main.py always serves from SQLiteRepository. Authentication, the admin listings, rollups, archiving
+and backups still use the SQLite connection directly and have no PostgreSQL counterpart, so this backend cannot
+be selected until they move behind the Repository interface. The contract tests run it against POSTGRES_TEST_DSN.
+"""
+from datetime import datetime
+from typing import List, Optional
+
+from ingest_dedup import device_time_ms
+from models import DeviceLocation, Friend, Group, IngestResult, UserLocation, format_epoch_ms, to_epoch_ms
+from repository import (Repository, DEVICE_FIX_COLUMNS, DEVICE_LOCATION_FIELDS, FRIEND_FIELDS, GROUP_FIELDS,
+                        DEVICE_FIELDS, HISTORY_FIELDS, USER_FIX_COLUMNS, USER_HISTORY_FIELDS, USER_LOCATION_FIELDS,
+                        device_location_from_row)
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+EPOCH_MS_NOW = '(EXTRACT(EPOCH FROM CURRENT_TIMESTAMP) * 1000)::BIGINT'
+
+# Same tables as DatabaseManager creates in SQLite
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id BIGINT GENERATED ALWAYS AS IDENTITY UNIQUE,
+        uuid TEXT PRIMARY KEY,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        nickname TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_seen TIMESTAMP,
+        role TEXT CHECK(role IN ('U', 'A')) NOT NULL DEFAULT 'U'
+    )
+    ''',
+    f'''
+    CREATE TABLE IF NOT EXISTS user_locations (
+        user_id BIGINT PRIMARY KEY REFERENCES users (id),
+        latitude DOUBLE PRECISION,
+        longitude DOUBLE PRECISION,
+        altitude DOUBLE PRECISION,
+        speed DOUBLE PRECISION,
+        battery INTEGER,
+        accuracy DOUBLE PRECISION,
+        timestamp BIGINT NOT NULL DEFAULT {EPOCH_MS_NOW}
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_location_history (
+        user_id BIGINT NOT NULL REFERENCES users (id),
+        timestamp BIGINT NOT NULL,
+        latitude DOUBLE PRECISION NOT NULL,
+        longitude DOUBLE PRECISION NOT NULL,
+        altitude DOUBLE PRECISION,
+        speed DOUBLE PRECISION,
+        battery INTEGER,
+        accuracy DOUBLE PRECISION,
+        PRIMARY KEY (user_id, timestamp)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS devices (
+        id BIGINT GENERATED ALWAYS AS IDENTITY UNIQUE,
+        imei TEXT PRIMARY KEY,
+        owner_uuid TEXT NOT NULL REFERENCES users (uuid),
+        name TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_seen TIMESTAMP
+    )
+    ''',
+    f'''
+    CREATE TABLE IF NOT EXISTS device_locations (
+        id BIGSERIAL PRIMARY KEY,
+        device_id BIGINT NOT NULL REFERENCES devices (id),
+        latitude DOUBLE PRECISION,
+        longitude DOUBLE PRECISION,
+        altitude DOUBLE PRECISION,
+        speed DOUBLE PRECISION,
+        battery INTEGER,
+        battery_mv INTEGER,
+        bark INTEGER,
+        satellites INTEGER,
+        lte_signal INTEGER,
+        lora_rssi INTEGER,
+        connection_type TEXT,
+        time TEXT,
+        timestamp BIGINT NOT NULL DEFAULT {EPOCH_MS_NOW},
+        seq BIGINT,
+        device_time BIGINT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_device_locations_device_timestamp ON device_locations (device_id, timestamp)',
+    # Keyed fixes by sequence number alone, which starts over when a tracker reboots
+    'DROP INDEX IF EXISTS idx_device_locations_device_seq',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_device_locations_device_seq_time ON device_locations (device_id, seq, device_time) '
+    'WHERE seq IS NOT NULL AND device_time IS NOT NULL',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_device_locations_device_time ON device_locations (device_id, device_time) '
+    'WHERE seq IS NULL AND device_time IS NOT NULL',
+    '''
+    CREATE TABLE IF NOT EXISTS friends (
+        user_uuid TEXT REFERENCES users (uuid),
+        friend_uuid TEXT REFERENCES users (uuid),
+        status TEXT DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_uuid, friend_uuid)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS groups (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        description TEXT,
+        owner_id TEXT NOT NULL REFERENCES users (uuid),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS group_members (
+        group_id TEXT REFERENCES groups (id),
+        user_uuid TEXT REFERENCES users (uuid),
+        joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (group_id, user_uuid)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS device_shares (
+        device_imei TEXT REFERENCES devices (imei),
+        owner_uuid TEXT REFERENCES users (uuid),
+        shared_with_uuid TEXT REFERENCES users (uuid),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (device_imei, shared_with_uuid)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_devices_owner ON devices (owner_uuid)',
+    'CREATE INDEX IF NOT EXISTS idx_friends_friend ON friends (friend_uuid, status)',
+    'CREATE INDEX IF NOT EXISTS idx_device_shares_shared_with ON device_shares (shared_with_uuid)',
+    'CREATE INDEX IF NOT EXISTS idx_group_members_user ON group_members (user_uuid)',
+]
+
+# From the first schema, where the location tables were keyed by IMEI and UUID text with TIMESTAMP columns.
+# Run before SCHEMA when device_locations.device_id is still text.
+MIGRATION_TO_INTEGER_KEYS = [
+    'ALTER TABLE users ADD COLUMN id BIGINT GENERATED ALWAYS AS IDENTITY UNIQUE',
+    'ALTER TABLE devices ADD COLUMN id BIGINT GENERATED ALWAYS AS IDENTITY UNIQUE',
+    'ALTER TABLE user_locations ADD COLUMN user_id BIGINT',
+    'UPDATE user_locations ul SET user_id = u.id FROM users u WHERE u.uuid = ul.uuid',
+    'ALTER TABLE user_locations DROP COLUMN uuid',
+    'ALTER TABLE user_locations ADD PRIMARY KEY (user_id), ADD FOREIGN KEY (user_id) REFERENCES users (id)',
+    'ALTER TABLE device_locations ADD COLUMN device_key BIGINT',
+    'UPDATE device_locations dl SET device_key = d.id FROM devices d WHERE d.imei = dl.device_id',
+    # Fixes of devices that no longer exist have nothing to be keyed by
+    'DELETE FROM device_locations WHERE device_key IS NULL',
+    'ALTER TABLE device_locations DROP COLUMN device_id',
+    'ALTER TABLE device_locations RENAME COLUMN device_key TO device_id',
+    'ALTER TABLE device_locations ALTER COLUMN device_id SET NOT NULL, ADD FOREIGN KEY (device_id) REFERENCES devices (id)',
+] + [
+    f'''
+    ALTER TABLE {table} ALTER COLUMN timestamp DROP DEFAULT,
+        ALTER COLUMN timestamp TYPE BIGINT
+            USING (EXTRACT(EPOCH FROM COALESCE(timestamp::timestamptz, CURRENT_TIMESTAMP)) * 1000)::BIGINT,
+        ALTER COLUMN timestamp SET DEFAULT {EPOCH_MS_NOW},
+        ALTER COLUMN timestamp SET NOT NULL
+    ''' for table in ('user_locations', 'device_locations')
+]
+
+# From the schema that stored every resend of a fix, once device times are parsed into device_time
+DELETE_RESENT_FIXES = '''
+    DELETE FROM device_locations
+    WHERE device_time IS NOT NULL AND id NOT IN (
+        SELECT MIN(id) FROM device_locations WHERE device_time IS NOT NULL GROUP BY device_id, device_time
+    )
+'''
+
+TIMESTAMP_FIELDS = {'created_at', 'last_seen'}
+
+EPOCH_MS_FIELDS = {'timestamp'}
+
+DEVICE_LOCATION_SELECT = '''
+    SELECT d.imei, d.owner_uuid, u.email, u.nickname, d.name,
+           dl.latitude, dl.longitude, dl.altitude, dl.speed, dl.battery,
+           dl.battery_mv, dl.bark, dl.satellites, dl.lte_signal, dl.lora_rssi,
+           dl.connection_type, dl.time, dl.timestamp
+'''
+LATEST_LOCATION_JOIN = '''
+    LEFT JOIN LATERAL (
+        SELECT * FROM device_locations WHERE device_id = d.id ORDER BY timestamp DESC LIMIT 1
+    ) dl ON TRUE
+'''
+
+
+def to_text(fields: List[str], record) -> tuple:
+    """Timestamps as the same text SQLite returns, so both backends give identical results."""
+    return tuple(value.isoformat(sep=' ') if field in TIMESTAMP_FIELDS and isinstance(value, datetime) else
+                 format_epoch_ms(value) if field in EPOCH_MS_FIELDS else value
+                 for field, value in zip(fields, record))
+
+def rowcount(status: str) -> int:
+    """Rows affected, from a command status like 'DELETE 2'."""
+    return int(status.rsplit(' ', 1)[-1])
+
+
+# Postgres Repository
+class PostgresRepository(Repository):
+
+    def __init__(self, pool: 'asyncpg.Pool'):
+        self.pool = pool
+
+    @classmethod
+    async def connect(cls, dsn: str, min_size: int = 2, max_size: int = 10) -> 'PostgresRepository':
+        if asyncpg is None:
+            raise RuntimeError("asyncpg is required for the PostgreSQL backend")
+        repository = cls(await asyncpg.create_pool(dsn, min_size=min_size, max_size=max_size))
+        await repository.init_schema()
+        return repository
+
+    async def init_schema(self):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                device_key_type = await conn.fetchval('''
+                    SELECT data_type FROM information_schema.columns
+                    WHERE table_name = 'device_locations' AND column_name = 'device_id'
+                ''')
+                if device_key_type == 'text':
+                    for statement in MIGRATION_TO_INTEGER_KEYS:
+                        await conn.execute(statement)
+                has_seq = await conn.fetchval('''
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'device_locations' AND column_name = 'seq'
+                ''')
+                if device_key_type is not None and not has_seq:
+                    await self._migrate_to_unique_fixes(conn)
+                for statement in SCHEMA:
+                    await conn.execute(statement)
+
+    async def _migrate_to_unique_fixes(self, conn: 'asyncpg.Connection'):
+        """Add the dedup key columns, parsing stored device times as ingest does, and keep the first copy of each resent fix."""
+        await conn.execute('ALTER TABLE device_locations ADD COLUMN seq BIGINT, ADD COLUMN device_time BIGINT')
+        records = await conn.fetch('SELECT id, time FROM device_locations WHERE time IS NOT NULL')
+        await conn.executemany('UPDATE device_locations SET device_time = $2 WHERE id = $1', [
+            (record['id'], at_ms) for record in records if (at_ms := device_time_ms(record['time'])) is not None])
+        await conn.execute(DELETE_RESENT_FIXES)
+
+    async def close(self):
+        await self.pool.close()
+
+    # Users
+    async def get_user_uuid_by_email(self, email: str) -> Optional[str]:
+        return await self.pool.fetchval('SELECT uuid FROM users WHERE email = $1', email)
+
+    # Friends
+    async def get_friends(self, user_uuid: str) -> List[Friend]:
+        records = await self.pool.fetch('''
+            SELECT u.uuid, u.email, u.nickname, f.status, f.created_at, f.user_uuid
+            FROM friends f
+            JOIN users u ON f.friend_uuid = u.uuid
+            WHERE f.user_uuid = $1
+            UNION
+            SELECT u.uuid, u.email, u.nickname, f.status, f.created_at, f.user_uuid
+            FROM friends f
+            JOIN users u ON f.user_uuid = u.uuid
+            WHERE f.friend_uuid = $1 AND (f.status = 'accepted' OR f.status = 'pending')
+        ''', user_uuid)
+        return [Friend(*to_text(FRIEND_FIELDS, record)) for record in records]
+
+    async def friendship_exists(self, user_uuid: str, other_uuid: str) -> bool:
+        return await self.pool.fetchval('''
+            SELECT EXISTS (SELECT 1 FROM friends
+                           WHERE (user_uuid = $1 AND friend_uuid = $2) OR (user_uuid = $2 AND friend_uuid = $1))
+        ''', user_uuid, other_uuid)
+
+    async def add_friend_request(self, user_uuid: str, friend_uuid: str):
+        await self.pool.execute("INSERT INTO friends (user_uuid, friend_uuid, status) VALUES ($1, $2, 'pending')",
+                                user_uuid, friend_uuid)
+
+    async def accept_friend_request(self, requester_uuid: str, user_uuid: str) -> bool:
+        status = await self.pool.execute('''
+            UPDATE friends SET status = 'accepted'
+            WHERE user_uuid = $1 AND friend_uuid = $2 AND status = 'pending'
+        ''', requester_uuid, user_uuid)
+        return rowcount(status) > 0
+
+    async def remove_friend(self, user_uuid: str, friend_uuid: str) -> bool:
+        status = await self.pool.execute('''
+            DELETE FROM friends
+            WHERE (user_uuid = $1 AND friend_uuid = $2) OR (user_uuid = $2 AND friend_uuid = $1)
+        ''', user_uuid, friend_uuid)
+        return rowcount(status) > 0
+
+    async def get_friend_locations(self, user_uuid: str, include_self: bool = False) -> List[UserLocation]:
+        records = await self.pool.fetch('''
+            SELECT u.uuid, u.email, u.nickname, ul.latitude, ul.longitude,
+                   ul.altitude, ul.speed, ul.battery, ul.accuracy, ul.timestamp
+            FROM users u
+            JOIN user_locations ul ON ul.user_id = u.id
+            WHERE u.uuid IN (
+                SELECT f.friend_uuid FROM friends f WHERE f.user_uuid = $1 AND f.status = 'accepted'
+                UNION
+                SELECT f.user_uuid FROM friends f WHERE f.friend_uuid = $1 AND f.status = 'accepted'
+            ) OR ($2 AND u.uuid = $1)
+        ''', user_uuid, include_self)
+        return [UserLocation(*to_text(USER_LOCATION_FIELDS, record)) for record in records]
+
+    # Groups
+    async def get_user_groups(self, user_uuid: str) -> List[Group]:
+        records = await self.pool.fetch('''
+            SELECT g.id, g.name, g.description, g.owner_id, g.created_at,
+                   ARRAY(SELECT user_uuid FROM group_members WHERE group_id = g.id) AS member_ids
+            FROM groups g
+            WHERE g.owner_id = $1 OR EXISTS (SELECT 1 FROM group_members WHERE group_id = g.id AND user_uuid = $1)
+        ''', user_uuid)
+        return [Group(*to_text(GROUP_FIELDS, record), member_ids=list(record['member_ids'])) for record in records]
+
+    async def create_group(self, group_id: str, name: str, description: Optional[str], owner_uuid: str):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute('INSERT INTO groups (id, name, description, owner_id) VALUES ($1, $2, $3, $4)',
+                                   group_id, name, description, owner_uuid)
+                await conn.execute('INSERT INTO group_members (group_id, user_uuid) VALUES ($1, $2)', group_id, owner_uuid)
+
+    async def get_group_owner(self, group_id: str) -> Optional[str]:
+        return await self.pool.fetchval('SELECT owner_id FROM groups WHERE id = $1', group_id)
+
+    async def delete_group(self, group_id: str):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute('DELETE FROM group_members WHERE group_id = $1', group_id)
+                await conn.execute('DELETE FROM groups WHERE id = $1', group_id)
+
+    async def is_group_owner_or_member(self, group_id: str, user_uuid: str) -> bool:
+        return await self.pool.fetchval('''
+            SELECT EXISTS (
+                SELECT 1 FROM groups g
+                LEFT JOIN group_members gm ON g.id = gm.group_id
+                WHERE g.id = $1 AND (g.owner_id = $2 OR gm.user_uuid = $2)
+            )
+        ''', group_id, user_uuid)
+
+    async def add_group_member(self, group_id: str, user_uuid: str):
+        await self.pool.execute('INSERT INTO group_members (group_id, user_uuid) VALUES ($1, $2) ON CONFLICT DO NOTHING',
+                                group_id, user_uuid)
+
+    async def remove_group_member(self, group_id: str, user_uuid: str) -> bool:
+        status = await self.pool.execute('DELETE FROM group_members WHERE group_id = $1 AND user_uuid = $2',
+                                         group_id, user_uuid)
+        return rowcount(status) > 0
+
+    async def get_group_members(self, group_id: str) -> List[str]:
+        return [record[0] for record in await self.pool.fetch('SELECT user_uuid FROM group_members WHERE group_id = $1', group_id)]
+
+    # Devices
+    async def get_devices(self, owner_uuid: str) -> List[dict]:
+        records = await self.pool.fetch('SELECT imei, name, created_at, last_seen FROM devices WHERE owner_uuid = $1', owner_uuid)
+        return [dict(zip(DEVICE_FIELDS, to_text(DEVICE_FIELDS, record))) for record in records]
+
+    async def device_exists(self, imei: str) -> bool:
+        return await self.pool.fetchval('SELECT EXISTS (SELECT 1 FROM devices WHERE imei = $1)', imei)
+
+    async def add_device(self, imei: str, owner_uuid: str, name: str):
+        await self.pool.execute('INSERT INTO devices (imei, owner_uuid, name) VALUES ($1, $2, $3)', imei, owner_uuid, name)
+
+    async def rename_device(self, imei: str, owner_uuid: str, name: str) -> bool:
+        status = await self.pool.execute('UPDATE devices SET name = $1 WHERE imei = $2 AND owner_uuid = $3',
+                                         name, imei, owner_uuid)
+        return rowcount(status) > 0
+
+    async def remove_device(self, imei: str, owner_uuid: str) -> bool:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                owned = await conn.fetchval('SELECT EXISTS (SELECT 1 FROM devices WHERE imei = $1 AND owner_uuid = $2)',
+                                            imei, owner_uuid)
+                if not owned:
+                    return False
+                await conn.execute('DELETE FROM device_shares WHERE device_imei = $1', imei)
+                await conn.execute('DELETE FROM device_locations WHERE device_id = (SELECT id FROM devices WHERE imei = $1)',
+                                   imei)
+                await conn.execute('DELETE FROM devices WHERE imei = $1', imei)
+                return True
+
+    async def get_owned_device_name(self, imei: str, owner_uuid: str) -> Optional[str]:
+        return await self.pool.fetchval('SELECT name FROM devices WHERE imei = $1 AND owner_uuid = $2', imei, owner_uuid)
+
+    async def user_can_view_device(self, imei: str, user_uuid: str) -> bool:
+        return await self.pool.fetchval('''
+            SELECT EXISTS (SELECT 1 FROM devices WHERE imei = $1 AND owner_uuid = $2)
+                OR EXISTS (SELECT 1 FROM device_shares WHERE device_imei = $1 AND shared_with_uuid = $2)
+        ''', imei, user_uuid)
+
+    # Shares
+    async def share_device(self, imei: str, owner_uuid: str, shared_with_uuid: str):
+        await self.pool.execute('''
+            INSERT INTO device_shares (device_imei, owner_uuid, shared_with_uuid) VALUES ($1, $2, $3)
+            ON CONFLICT (device_imei, shared_with_uuid) DO UPDATE
+            SET owner_uuid = excluded.owner_uuid, created_at = CURRENT_TIMESTAMP
+        ''', imei, owner_uuid, shared_with_uuid)
+
+    async def unshare_device(self, imei: str, owner_uuid: str, shared_with_uuid: str) -> bool:
+        status = await self.pool.execute('''
+            DELETE FROM device_shares WHERE device_imei = $1 AND owner_uuid = $2 AND shared_with_uuid = $3
+        ''', imei, owner_uuid, shared_with_uuid)
+        return rowcount(status) > 0
+
+    async def get_device_share_recipients(self, imei: str) -> List[str]:
+        return [record[0] for record in await self.pool.fetch('SELECT shared_with_uuid FROM device_shares WHERE device_imei = $1', imei)]
+
+    # Locations
+    async def upsert_user_location(self, user_uuid: str, location: dict, at: datetime):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute('''
+                    INSERT INTO user_locations (user_id, latitude, longitude, altitude, speed, battery, accuracy, timestamp)
+                    SELECT id, $2, $3, $4, $5, $6, $7, $8 FROM users WHERE uuid = $1
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        latitude = excluded.latitude, longitude = excluded.longitude, altitude = excluded.altitude,
+                        speed = excluded.speed, battery = excluded.battery, accuracy = excluded.accuracy,
+                        timestamp = excluded.timestamp
+                ''', user_uuid, location.get('latitude'), location.get('longitude'), location.get('altitude'),
+                     location.get('speed'), location.get('battery'), location.get('accuracy'), to_epoch_ms(at))
+                await conn.execute('UPDATE users SET last_seen = $1 WHERE uuid = $2', at, user_uuid)
+
+    async def insert_device_location(self, device_id: str, owner_uuid: str, fix: dict, at: datetime) -> IngestResult:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                device_key = await conn.fetchval('SELECT id FROM devices WHERE imei = $1 AND owner_uuid = $2',
+                                                 device_id, owner_uuid)
+                if device_key is None:
+                    return IngestResult.UNKNOWN_DEVICE
+                placeholders = ', '.join(f'${index}' for index in range(2, len(DEVICE_FIX_COLUMNS) + 2))
+                status = await conn.execute(f'''
+                    INSERT INTO device_locations (device_id, {', '.join(DEVICE_FIX_COLUMNS)}, timestamp, device_time)
+                    VALUES ($1, {placeholders}, ${len(DEVICE_FIX_COLUMNS) + 2}, ${len(DEVICE_FIX_COLUMNS) + 3})
+                    ON CONFLICT DO NOTHING
+                ''', device_key, *(fix.get(column) for column in DEVICE_FIX_COLUMNS), to_epoch_ms(at),
+                    device_time_ms(fix.get('time')))
+                if rowcount(status) == 0:
+                    return IngestResult.DUPLICATE
+                await conn.execute('UPDATE devices SET last_seen = $1 WHERE id = $2', at, device_key)
+                return IngestResult.STORED
+
+    async def get_device_location(self, imei: str) -> Optional[DeviceLocation]:
+        record = await self.pool.fetchrow(f'''
+            {DEVICE_LOCATION_SELECT}
+            FROM devices d
+            JOIN users u ON d.owner_uuid = u.uuid
+            {LATEST_LOCATION_JOIN}
+            WHERE d.imei = $1
+        ''', imei)
+        return device_location_from_row(to_text(DEVICE_LOCATION_FIELDS, record)) if record else None
+
+    async def get_owned_device_locations(self, user_uuid: str) -> List[DeviceLocation]:
+        records = await self.pool.fetch(f'''
+            {DEVICE_LOCATION_SELECT}
+            FROM devices d
+            JOIN users u ON d.owner_uuid = u.uuid
+            {LATEST_LOCATION_JOIN}
+            WHERE d.owner_uuid = $1
+        ''', user_uuid)
+        return [device_location_from_row(to_text(DEVICE_LOCATION_FIELDS, record), 'own') for record in records]
+
+    async def get_shared_device_locations(self, user_uuid: str) -> List[DeviceLocation]:
+        records = await self.pool.fetch(f'''
+            {DEVICE_LOCATION_SELECT}
+            FROM device_shares ds
+            JOIN devices d ON ds.device_imei = d.imei
+            JOIN users u ON d.owner_uuid = u.uuid
+            {LATEST_LOCATION_JOIN}
+            WHERE ds.shared_with_uuid = $1
+        ''', user_uuid)
+        return [device_location_from_row(to_text(DEVICE_LOCATION_FIELDS, record), 'shared') for record in records]
+
+    async def get_all_device_locations(self, user_uuid: str) -> List[DeviceLocation]:
+        owned = await self.pool.fetch(f'''
+            {DEVICE_LOCATION_SELECT}
+            FROM devices d
+            JOIN users u ON d.owner_uuid = u.uuid
+            LEFT JOIN device_locations dl ON dl.device_id = d.id
+            WHERE d.owner_uuid = $1
+            ORDER BY d.imei, dl.timestamp
+        ''', user_uuid)
+        shared = await self.pool.fetch(f'''
+            {DEVICE_LOCATION_SELECT}
+            FROM device_shares ds
+            JOIN devices d ON ds.device_imei = d.imei
+            JOIN users u ON d.owner_uuid = u.uuid
+            LEFT JOIN device_locations dl ON dl.device_id = d.id
+            WHERE ds.shared_with_uuid = $1
+            ORDER BY d.imei, dl.timestamp
+        ''', user_uuid)
+        return ([device_location_from_row(to_text(DEVICE_LOCATION_FIELDS, record), 'own') for record in owned] +
+                [device_location_from_row(to_text(DEVICE_LOCATION_FIELDS, record), 'shared') for record in shared])
+
+    async def get_device_location_history(self, imei: str, start: datetime, end: datetime, limit: int) -> List[dict]:
+        records = await self.pool.fetch('''
+            SELECT id, latitude, longitude, altitude, speed, battery, battery_mv, bark, satellites,
+                   lte_signal, lora_rssi, connection_type, time, timestamp, timestamp
+            FROM device_locations
+            WHERE device_id = (SELECT id FROM devices WHERE imei = $1) AND timestamp >= $2 AND timestamp < $3
+            ORDER BY timestamp
+            LIMIT $4
+        ''', imei, to_epoch_ms(start), to_epoch_ms(end), limit)
+        return [dict(zip(HISTORY_FIELDS, to_text(HISTORY_FIELDS, record))) for record in records]
+
+    async def insert_user_location_history(self, user_uuid: str, location: dict, at: datetime):
+        placeholders = ', '.join(f'${index}' for index in range(3, len(USER_FIX_COLUMNS) + 3))
+        await self.pool.execute(f'''
+            INSERT INTO user_location_history (user_id, timestamp, {', '.join(USER_FIX_COLUMNS)})
+            SELECT id, $2, {placeholders} FROM users WHERE uuid = $1
+            ON CONFLICT DO NOTHING
+        ''', user_uuid, to_epoch_ms(at), *(location.get(column) for column in USER_FIX_COLUMNS))
+
+    async def get_user_location_history(self, user_uuid: str, start: datetime, end: datetime, limit: int) -> List[dict]:
+        records = await self.pool.fetch(f'''
+            SELECT {', '.join(USER_FIX_COLUMNS)}, timestamp, timestamp
+            FROM user_location_history
+            WHERE user_id = (SELECT id FROM users WHERE uuid = $1) AND timestamp >= $2 AND timestamp < $3
+            ORDER BY timestamp
+            LIMIT $4
+        ''', user_uuid, to_epoch_ms(start), to_epoch_ms(end), limit)
+        return [dict(zip(USER_HISTORY_FIELDS, to_text(USER_HISTORY_FIELDS, record))) for record in records]
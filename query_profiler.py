@@ -0,0 +1,206 @@
+"""
+Per statement profiling of SQLite connections.
+Connections opened with `factory=ProfiledConnection` time every statement, including fetching its rows,
+and file it under the function that ran it and the statement's SQL. Statements slower than a threshold
+are logged with their EXPLAIN QUERY PLAN.
+"""
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_SLOW_QUERY_MS = 100.0
+
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Plumbing between the code that wants a query run and the connection, never the caller worth naming
+_PLUMBING_FILES = {os.path.join(_PROJECT_DIR, name) for name in ('query_profiler.py', 'read_pool.py', 'metrics.py')}
+_PLUMBING_FUNCTIONS = {'run_read'}
+_WHITESPACE = re.compile(r'\s+')
+
+# Set around work handed to other threads, where the stack no longer shows who asked for it
+query_caller: ContextVar[Optional[str]] = ContextVar('query_caller', default=None)
+
+
+def caller_name() -> str:
+    """The innermost function of this project on the stack that is not database plumbing or a helper."""
+    tagged = query_caller.get()
+    if tagged:
+        return tagged
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if (code.co_filename.startswith(_PROJECT_DIR) and code.co_filename not in _PLUMBING_FILES
+                and not code.co_name.startswith(('_', '<')) and code.co_name not in _PLUMBING_FUNCTIONS
+                and '<locals>' not in code.co_qualname):
+            return code.co_qualname
+        frame = frame.f_back
+    return 'unknown'
+
+def normalize_sql(sql: str) -> str:
+    return _WHITESPACE.sub(' ', sql).strip()
+
+def format_plan(rows: List[tuple]) -> str:
+    """EXPLAIN QUERY PLAN rows (id, parent, notused, detail) as an indented tree."""
+    depths = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depths[node_id] = depths.get(parent, -1) + 1
+        lines.append('  ' * depths[node_id] + detail)
+    return '\n'.join(lines)
+
+
+@dataclass
+class QueryStats:
+    caller: str
+    sql: str
+    count: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    slow_count: int = 0
+    last_plan: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            'caller': self.caller,
+            'sql': self.sql,
+            'count': self.count,
+            'total_ms': self.total_seconds * 1000,
+            'mean_ms': self.total_seconds * 1000 / self.count if self.count else 0.0,
+            'max_ms': self.max_seconds * 1000,
+            'slow_count': self.slow_count,
+            'last_plan': self.last_plan,
+        }
+
+
+# Query Profiler
+class QueryProfiler:
+    """Collects statement timings from any number of connections and threads."""
+
+    def __init__(self, logger: logging.Logger, slow_query_ms: float = DEFAULT_SLOW_QUERY_MS):
+        self.logger = logger
+        self.slow_query_seconds = slow_query_ms / 1000
+        self._stats: Dict[Tuple[str, str], QueryStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, caller: str, sql: str, seconds: float, executed: bool) -> QueryStats:
+        """Add `seconds` to a statement; `executed` counts a new execution rather than more fetching."""
+        key = (caller, sql)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = QueryStats(caller, sql)
+            if executed:
+                stats.count += 1
+            stats.total_seconds += seconds
+            return stats
+
+    def observe(self, stats: QueryStats, seconds: float, slow: bool, plan: Optional[str] = None):
+        """Note that one execution of a statement has taken `seconds` so far; `slow` once it crossed the threshold."""
+        with self._lock:
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            if slow:
+                stats.slow_count += 1
+                stats.last_plan = plan
+        if slow:
+            self.logger.warning(f"Slow query in {stats.caller} took {seconds * 1000:.1f} ms: {stats.sql}\n"
+                                f"Query plan:\n{plan or '(not available)'}")
+
+    def summary(self, sort: str = 'total_ms', limit: int = 50) -> List[dict]:
+        with self._lock:
+            stats = [entry.to_dict() for entry in self._stats.values()]
+        return sorted(stats, key=lambda entry: entry[sort], reverse=True)[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """
+    Times execute and the fetches that follow it as one execution of the statement.
+    Rows read by iterating over the cursor are not timed.
+    """
+
+    _stats: Optional[QueryStats] = None
+    _elapsed = 0.0
+    _reported_slow = False
+    _sql = ''
+    _params = None
+
+    def _plan(self) -> Optional[str]:
+        if self._params is None:
+            return None
+        try:
+            rows = sqlite3.Cursor(self.connection).execute(f'EXPLAIN QUERY PLAN {self._sql}', self._params).fetchall()
+            return format_plan(rows)
+        except sqlite3.Error:
+            return None
+
+    def _observe(self, seconds: float, executed: bool):
+        profiler = self.connection.profiler
+        self._elapsed += seconds
+        profiler.record(self._stats.caller, self._stats.sql, seconds, executed)
+        slow = not self._reported_slow and self._elapsed >= profiler.slow_query_seconds
+        if slow:
+            self._reported_slow = True
+        profiler.observe(self._stats, self._elapsed, slow, self._plan() if slow else None)
+
+    def _timed(self, method, sql: str, params, explain_params):
+        profiler = getattr(self.connection, 'profiler', None)
+        if profiler is None:
+            return method(sql, params)
+        self._stats = profiler.record(caller_name(), normalize_sql(sql), 0.0, False)
+        self._sql, self._params = sql, explain_params
+        self._elapsed, self._reported_slow = 0.0, False
+        started = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            self._observe(time.perf_counter() - started, True)
+
+    def execute(self, sql: str, parameters=()):
+        return self._timed(super().execute, sql, parameters, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        # No single set of parameters to explain it with
+        return self._timed(super().executemany, sql, seq_of_parameters, None)
+
+    def _fetched(self, method, *args):
+        if self._stats is None:
+            return method(*args)
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._observe(time.perf_counter() - started, False)
+
+    def fetchone(self):
+        return self._fetched(super().fetchone)
+
+    def fetchmany(self, size: Optional[int] = None):
+        return self._fetched(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._fetched(super().fetchall)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """A connection whose cursors report to `profiler`, when one is set."""
+
+    profiler: Optional[QueryProfiler] = None
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    # The built in shortcuts would run the statement without going through the cursor's methods
+    def execute(self, sql: str, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,124 @@
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+# Requests run take on the event loop, so waiting for another worker's lock is kept short
+SQLITE_BUSY_TIMEOUT_SECONDS = 0.05
+PRUNE_INTERVAL_SECONDS = 60
+
+
+# Rate Limiter Backends
+class RateLimiterBackend(ABC):
+    """Storage for token buckets. Implementations must update a bucket atomically."""
+
+    @abstractmethod
+    def take(self, key: str, capacity: float, refill_per_second: float, now: float) -> float:
+        """Take one token from the bucket for key. Returns 0 if allowed, otherwise seconds until a token is available."""
+
+
+def _take_from_bucket(tokens: float, updated_at: float, capacity: float, refill_per_second: float, now: float) -> Tuple[float, float]:
+    """Refill a bucket and try to take a token. Returns (tokens left, retry after)."""
+    tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / refill_per_second
+
+
+class InMemoryRateLimiterBackend(RateLimiterBackend):
+    """Buckets kept in process memory, for single worker deployments."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: float, refill_per_second: float, now: float) -> float:
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens, retry_after = _take_from_bucket(tokens, updated_at, capacity, refill_per_second, now)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._evict_full_buckets(capacity, refill_per_second, now)
+            return retry_after
+
+    def _evict_full_buckets(self, capacity: float, refill_per_second: float, now: float):
+        # A bucket that has refilled completely is the same as no bucket at all
+        full = [key for key, (tokens, updated_at) in self._buckets.items()
+                if tokens + (now - updated_at) * refill_per_second >= capacity]
+        for key in full:
+            del self._buckets[key]
+
+
+class SQLiteRateLimiterBackend(RateLimiterBackend):
+    """
+    Buckets kept in a SQLite file shared by all workers on the same host. Buckets that have refilled
+    completely are pruned every PRUNE_INTERVAL_SECONDS. When the file stays locked by another worker
+    the request is let through rather than holding up the event loop.
+    """
+
+    def __init__(self, db_path: str, logger: Optional[logging.Logger] = None):
+        self.db_path = db_path
+        self.logger = logger or logging.getLogger(__name__)
+        self._connection = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT_SECONDS, isolation_level=None,
+                                           check_same_thread=False)
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        # full_at is when the bucket holds its capacity again, after which it is the same as no bucket at all
+        self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                full_at REAL NOT NULL
+            )
+        ''')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_full_at ON rate_limit_buckets (full_at)')
+
+    def take(self, key: str, capacity: float, refill_per_second: float, now: float) -> float:
+        with self._lock:
+            try:
+                return self._take(key, capacity, refill_per_second, now)
+            except sqlite3.OperationalError as e:
+                self.logger.warning(f"Rate limit bucket {key} not checked: {e}")
+                return 0.0
+
+    def __len__(self) -> int:
+        return self._connection.execute('SELECT COUNT(*) FROM rate_limit_buckets').fetchone()[0]
+
+    def _take(self, key: str, capacity: float, refill_per_second: float, now: float) -> float:
+        cursor = self._connection.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute('SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?', (key,))
+            row = cursor.fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            tokens, retry_after = _take_from_bucket(tokens, updated_at, capacity, refill_per_second, now)
+            cursor.execute('INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)',
+                           (key, tokens, now, now + (capacity - tokens) / refill_per_second))
+            if now - self._pruned_at >= PRUNE_INTERVAL_SECONDS:
+                cursor.execute('DELETE FROM rate_limit_buckets WHERE full_at <= ?', (now,))
+                self._pruned_at = now
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        return retry_after
+
+
+# Rate Limiter
+class RateLimiter:
+    """Token bucket rate limiter, allowing bursts of `capacity` and `per_minute` requests on average."""
+
+    def __init__(self, name: str, capacity: float, per_minute: float, backend: RateLimiterBackend):
+        self.name = name
+        self.capacity = capacity
+        self.refill_per_second = per_minute / 60
+        self.backend = backend
+
+    def check(self, key: str) -> float:
+        """Count a request for key. Returns 0 if allowed, otherwise seconds the caller should wait."""
+        return self.backend.take(f"{self.name}:{key}", self.capacity, self.refill_per_second, time.time())
@@ -0,0 +1,137 @@
+"""
+Read-only connections for query-heavy endpoints, so read bursts such as reconnect storms do not queue
+behind, or block the event loop for, location writes on the primary connection.
+Each worker thread has its own connection to the database file; in WAL mode they read alongside the writer.
+Reads may instead go to a replica file kept up to date by an external tool (e.g. Litestream or LiteFS),
+as long as its replication lag, measured through a heartbeat row the primary keeps updating,
+is within the configured staleness tolerance. Otherwise they fall back to the primary file.
+"""
+import asyncio
+import contextvars
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from database_manager import DatabaseManager
+from query_profiler import ProfiledConnection, QueryProfiler, caller_name, query_caller
+from queries import STATEMENT_CACHE_SIZE
+
+DEFAULT_READ_CONNECTIONS = 4
+DEFAULT_MAX_STALENESS_SECONDS = 5.0
+HEARTBEAT_INTERVAL_SECONDS = 1.0
+
+
+def write_heartbeat(conn: sqlite3.Connection, at: Optional[float] = None):
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO replication_heartbeat (id, at) VALUES (1, ?)',
+                     (time.time() if at is None else at,))
+
+def open_read_only(path: str, profiler: Optional[QueryProfiler] = None) -> sqlite3.Connection:
+    # Only ever used by the thread that opened it, but closed from the one stopping the pool
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False, factory=ProfiledConnection,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.profiler = profiler
+    conn.execute('PRAGMA query_only = ON')
+    return conn
+
+
+# Read Pool
+class ReadPool:
+    """Runs read-only queries on a pool of worker threads, each with its own connection."""
+
+    def __init__(self, db_path: str, logger: logging.Logger, size: int = DEFAULT_READ_CONNECTIONS,
+                 replica_path: Optional[str] = None, max_staleness_seconds: float = DEFAULT_MAX_STALENESS_SECONDS,
+                 lag_check_seconds: float = HEARTBEAT_INTERVAL_SECONDS, profiler: Optional[QueryProfiler] = None):
+        if db_path == ':memory:':
+            raise ValueError("An in-memory database cannot be read from other connections")
+        self.db_path = db_path
+        self.logger = logger
+        self.replica_path = replica_path
+        self.max_staleness_seconds = max_staleness_seconds
+        self.lag_check_seconds = lag_check_seconds
+        self.profiler = profiler
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='db-read')
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # (checked at, replica usable), shared by the workers so the lag is not queried on every read
+        self._replica_state = (0.0, False)
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    def _connection(self, path: str) -> sqlite3.Connection:
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        if path not in connections:
+            connections[path] = open_read_only(path, self.profiler)
+            with self._connections_lock:
+                self._connections.append(connections[path])
+        return connections[path]
+
+    def replica_lag_seconds(self) -> Optional[float]:
+        """Seconds since the last heartbeat the replica has seen, None if it has none."""
+        row = self._connection(self.replica_path).execute('SELECT at FROM replication_heartbeat WHERE id = 1').fetchone()
+        return None if row is None else max(0.0, time.time() - row[0])
+
+    def _replica_usable(self) -> bool:
+        checked_at, usable = self._replica_state
+        now = time.monotonic()
+        if now - checked_at < self.lag_check_seconds:
+            return usable
+        try:
+            lag = self.replica_lag_seconds()
+            usable = lag is not None and lag <= self.max_staleness_seconds
+            if not usable:
+                self.logger.warning(f"Read replica {self.replica_path} lags {lag}s, reading from the primary")
+        except sqlite3.Error as e:
+            self.logger.warning(f"Read replica {self.replica_path} unavailable, reading from the primary: {e}")
+            usable = False
+        self._replica_state = (now, usable)
+        return usable
+
+    def _call(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        path = self.replica_path if self.replica_path and self._replica_usable() else self.db_path
+        return func(self._connection(path))
+
+    async def run(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run func(connection) on a read connection in a worker thread."""
+        # The worker thread's stack does not show who asked for the query, tell the profiler
+        context = contextvars.copy_context()
+        context.run(query_caller.set, caller_name())
+        return await asyncio.get_running_loop().run_in_executor(self._executor, context.run, self._call, func)
+
+    async def fetchall(self, query: str, params: tuple = ()) -> list:
+        return await self.run(lambda conn: conn.execute(query, params).fetchall())
+
+    async def fetchone(self, query: str, params: tuple = ()):
+        return await self.run(lambda conn: conn.execute(query, params).fetchone())
+
+    async def _beat(self, db_manager: DatabaseManager):
+        while True:
+            try:
+                write_heartbeat(db_manager.get_connection())
+            except sqlite3.Error as e:
+                self.logger.error(f"Error writing replication heartbeat: {e}")
+            await asyncio.sleep(HEARTBEAT_INTERVAL_SECONDS)
+
+    def start(self, db_manager: DatabaseManager):
+        """Keep the heartbeat current on the primary, which replicas copy and measure their lag against."""
+        if self.replica_path:
+            self._heartbeat_task = asyncio.get_running_loop().create_task(self._beat(db_manager))
+
+    async def stop(self):
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+        self._executor.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
@@ -0,0 +1,549 @@
+"""
+Storage backends behind one async method surface for friends, groups, devices, shares and locations.
+SQLiteRepository runs on the shared DatabaseManager connection, PostgresRepository (postgres_repository.py)
+on an asyncpg pool. Both return models (models.py) for locations, friends and groups, plain dicts for the rest,
+and leave HTTP errors to the caller.
+"""
+import sqlite3
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Callable, List, Optional
+
+from database_manager import DatabaseManager
+from models import DeviceLocation, Friend, Group, IngestResult, UserLocation, to_epoch_ms
+from queries import Statement, register
+from read_pool import ReadPool
+from ingest_dedup import device_time_ms
+
+DEVICE_LOCATION_FIELDS = ['device_id', 'owner_uuid', 'owner_email', 'owner_nickname', 'device_name',
+                          'latitude', 'longitude', 'altitude', 'speed', 'battery',
+                          'battery_mv', 'bark', 'satellites', 'lte_signal', 'lora_rssi',
+                          'connection_type', 'time', 'timestamp']
+# Columns of device_locations written on ingest, besides device_id, timestamp and device_time, parsed from time
+DEVICE_FIX_COLUMNS = ['latitude', 'longitude', 'altitude', 'speed', 'battery', 'battery_mv',
+                      'bark', 'satellites', 'lte_signal', 'lora_rssi', 'connection_type', 'time', 'seq']
+# Columns of user_location_history written on ingest, besides user_id and timestamp
+USER_FIX_COLUMNS = ['latitude', 'longitude', 'altitude', 'speed', 'battery', 'accuracy']
+# History fixes carry the stored epoch milliseconds besides the local time text, to be ordered and timed by
+USER_HISTORY_FIELDS = USER_FIX_COLUMNS + ['timestamp', 'timestamp_ms']
+HISTORY_FIELDS = ['id', 'latitude', 'longitude', 'altitude', 'speed', 'battery', 'battery_mv', 'bark',
+                  'satellites', 'lte_signal', 'lora_rssi', 'connection_type', 'time', 'timestamp', 'timestamp_ms']
+FRIEND_FIELDS = ['uuid', 'email', 'nickname', 'status', 'created_at', 'request_sent_by']
+USER_LOCATION_FIELDS = ['uuid', 'email', 'nickname', 'latitude', 'longitude',
+                        'altitude', 'speed', 'battery', 'accuracy', 'timestamp']
+GROUP_FIELDS = ['id', 'name', 'description', 'owner_id', 'created_at']
+DEVICE_FIELDS = ['imei', 'name', 'created_at', 'last_seen']
+
+def device_location_from_row(row, location_type: Optional[str] = None) -> DeviceLocation:
+    return DeviceLocation(*row, type=location_type)
+
+def timestamp_text(column: str) -> str:
+    """SQL formatting epoch milliseconds like models.format_epoch_ms, so rows need no conversion in Python."""
+    return f"strftime('%Y-%m-%d %H:%M:%f', {column} / 1000.0, 'unixepoch', 'localtime')"
+
+
+# SQLite statements of the listings. Location tables are keyed by users.id and devices.id, the API by uuid and imei.
+DEVICE_LOCATION_COLUMNS = f'''
+    d.imei, d.owner_uuid, u.email, u.nickname, d.name,
+    dl.latitude, dl.longitude, dl.altitude, dl.speed, dl.battery,
+    dl.battery_mv, dl.bark, dl.satellites, dl.lte_signal, dl.lora_rssi,
+    dl.connection_type, dl.time, {timestamp_text('dl.timestamp')}
+'''
+# The newest fix of device d, a seek on idx_device_locations_device_timestamp rather than grouping every device's history
+LATEST_LOCATION_JOIN = '''
+    LEFT JOIN device_locations dl ON dl.id = (
+        SELECT id FROM device_locations WHERE device_id = d.id ORDER BY timestamp DESC LIMIT 1
+    )
+'''
+FRIEND_LOCATIONS_QUERY = f'''
+    SELECT u.uuid, u.email, u.nickname, ul.latitude, ul.longitude,
+           ul.altitude, ul.speed, ul.battery, ul.accuracy, {timestamp_text('ul.timestamp')}
+    FROM users u
+    JOIN user_locations ul ON ul.user_id = u.id
+    WHERE u.uuid IN (
+        SELECT f.friend_uuid FROM friends f
+        WHERE f.user_uuid = ? AND f.status = 'accepted'
+        UNION
+        SELECT f.user_uuid FROM friends f
+        WHERE f.friend_uuid = ? AND f.status = 'accepted'
+    )
+'''
+
+GET_FRIENDS = register('get_friends', '''
+    SELECT u.uuid, u.email, u.nickname, f.status, f.created_at, f.user_uuid
+    FROM friends f
+    JOIN users u ON f.friend_uuid = u.uuid
+    WHERE f.user_uuid = ?
+    UNION
+    SELECT u.uuid, u.email, u.nickname, f.status, f.created_at, f.user_uuid
+    FROM friends f
+    JOIN users u ON f.user_uuid = u.uuid
+    WHERE f.friend_uuid = ? AND (f.status = 'accepted' OR f.status = 'pending')
+''', FRIEND_FIELDS, Friend)
+GET_FRIEND_LOCATIONS = register('get_friend_locations', FRIEND_LOCATIONS_QUERY, USER_LOCATION_FIELDS, UserLocation)
+GET_FRIEND_AND_OWN_LOCATIONS = register('get_friend_and_own_locations', FRIEND_LOCATIONS_QUERY + '    OR u.uuid = ?\n',
+                                        USER_LOCATION_FIELDS, UserLocation)
+GET_USER_GROUPS = register('get_user_groups', '''
+    SELECT g.id, g.name, g.description, g.owner_id, g.created_at
+    FROM groups g
+    LEFT JOIN group_members gm ON g.id = gm.group_id
+    WHERE g.owner_id = ? OR gm.user_uuid = ?
+    GROUP BY g.id
+''', GROUP_FIELDS, Group)
+GET_GROUP_MEMBER_IDS = register('get_group_member_ids', 'SELECT user_uuid FROM group_members WHERE group_id = ?')
+GET_DEVICES = register('get_devices', 'SELECT imei, name, created_at, last_seen FROM devices WHERE owner_uuid = ?',
+                       DEVICE_FIELDS)
+GET_DEVICE_LOCATION = register('get_device_location', f'''
+    SELECT {DEVICE_LOCATION_COLUMNS}
+    FROM devices d
+    JOIN users u ON d.owner_uuid = u.uuid
+    {LATEST_LOCATION_JOIN}
+    WHERE d.imei = ?
+''', DEVICE_LOCATION_FIELDS, DeviceLocation)
+GET_OWNED_DEVICE_LOCATIONS = register('get_owned_device_locations', f'''
+    SELECT {DEVICE_LOCATION_COLUMNS}
+    FROM devices d
+    JOIN users u ON d.owner_uuid = u.uuid
+    {LATEST_LOCATION_JOIN}
+    WHERE d.owner_uuid = ?
+''', DEVICE_LOCATION_FIELDS, DeviceLocation, type='own')
+GET_SHARED_DEVICE_LOCATIONS = register('get_shared_device_locations', f'''
+    SELECT {DEVICE_LOCATION_COLUMNS}
+    FROM device_shares ds
+    INNER JOIN devices d ON ds.device_imei = d.imei
+    INNER JOIN users u ON d.owner_uuid = u.uuid
+    {LATEST_LOCATION_JOIN}
+    WHERE ds.shared_with_uuid = ?
+''', DEVICE_LOCATION_FIELDS, DeviceLocation, type='shared')
+GET_ALL_OWNED_DEVICE_LOCATIONS = register('get_all_owned_device_locations', f'''
+    SELECT {DEVICE_LOCATION_COLUMNS}
+    FROM devices d
+    JOIN users u ON d.owner_uuid = u.uuid
+    LEFT JOIN device_locations dl ON dl.device_id = d.id
+    WHERE d.owner_uuid = ?
+    ORDER BY d.imei, dl.timestamp
+''', DEVICE_LOCATION_FIELDS, DeviceLocation, type='own')
+GET_ALL_SHARED_DEVICE_LOCATIONS = register('get_all_shared_device_locations', f'''
+    SELECT {DEVICE_LOCATION_COLUMNS}
+    FROM device_shares ds
+    INNER JOIN devices d ON ds.device_imei = d.imei
+    INNER JOIN users u ON d.owner_uuid = u.uuid
+    LEFT JOIN device_locations dl ON dl.device_id = d.id
+    WHERE ds.shared_with_uuid = ?
+    ORDER BY d.imei, dl.timestamp
+''', DEVICE_LOCATION_FIELDS, DeviceLocation, type='shared')
+GET_DEVICE_LOCATION_HISTORY = register('get_device_location_history', f'''
+    SELECT id, latitude, longitude, altitude, speed, battery, battery_mv, bark, satellites,
+           lte_signal, lora_rssi, connection_type, time, {timestamp_text('timestamp')}, timestamp
+    FROM device_locations
+    WHERE device_id = (SELECT id FROM devices WHERE imei = ?) AND timestamp >= ? AND timestamp < ?
+    ORDER BY timestamp
+    LIMIT ?
+''', HISTORY_FIELDS)
+GET_USER_LOCATION_HISTORY = register('get_user_location_history', f'''
+    SELECT {', '.join(USER_FIX_COLUMNS)}, {timestamp_text('timestamp')}, timestamp
+    FROM user_location_history
+    WHERE user_id = (SELECT id FROM users WHERE uuid = ?) AND timestamp >= ? AND timestamp < ?
+    ORDER BY timestamp
+    LIMIT ?
+''', USER_HISTORY_FIELDS)
+
+
+# Repository
+class Repository(ABC):
+    """The storage operations the API needs. Every method is a coroutine so backends may do I/O."""
+
+    # Users
+    @abstractmethod
+    async def get_user_uuid_by_email(self, email: str) -> Optional[str]:
+        ...
+
+    # Friends
+    @abstractmethod
+    async def get_friends(self, user_uuid: str) -> List[Friend]:
+        """Accepted and pending friends of a user, and pending requests to the user."""
+
+    @abstractmethod
+    async def friendship_exists(self, user_uuid: str, other_uuid: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def add_friend_request(self, user_uuid: str, friend_uuid: str):
+        ...
+
+    @abstractmethod
+    async def accept_friend_request(self, requester_uuid: str, user_uuid: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def remove_friend(self, user_uuid: str, friend_uuid: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def get_friend_locations(self, user_uuid: str, include_self: bool = False) -> List[UserLocation]:
+        ...
+
+    # Groups
+    @abstractmethod
+    async def get_user_groups(self, user_uuid: str) -> List[Group]:
+        """Groups the user owns or is a member of, with their member ids."""
+
+    @abstractmethod
+    async def create_group(self, group_id: str, name: str, description: Optional[str], owner_uuid: str):
+        """Create a group with the owner as its first member."""
+
+    @abstractmethod
+    async def get_group_owner(self, group_id: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def delete_group(self, group_id: str):
+        ...
+
+    @abstractmethod
+    async def is_group_owner_or_member(self, group_id: str, user_uuid: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def add_group_member(self, group_id: str, user_uuid: str):
+        ...
+
+    @abstractmethod
+    async def remove_group_member(self, group_id: str, user_uuid: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def get_group_members(self, group_id: str) -> List[str]:
+        ...
+
+    # Devices
+    @abstractmethod
+    async def get_devices(self, owner_uuid: str) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def device_exists(self, imei: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def add_device(self, imei: str, owner_uuid: str, name: str):
+        ...
+
+    @abstractmethod
+    async def rename_device(self, imei: str, owner_uuid: str, name: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def remove_device(self, imei: str, owner_uuid: str) -> bool:
+        """Remove an owned device with its shares and locations, all or nothing."""
+
+    @abstractmethod
+    async def get_owned_device_name(self, imei: str, owner_uuid: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def user_can_view_device(self, imei: str, user_uuid: str) -> bool:
+        """Check if a device is owned by or shared with a user."""
+
+    # Shares
+    @abstractmethod
+    async def share_device(self, imei: str, owner_uuid: str, shared_with_uuid: str):
+        ...
+
+    @abstractmethod
+    async def unshare_device(self, imei: str, owner_uuid: str, shared_with_uuid: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def get_device_share_recipients(self, imei: str) -> List[str]:
+        ...
+
+    # Locations
+    @abstractmethod
+    async def upsert_user_location(self, user_uuid: str, location: dict, at: datetime):
+        """Replace the last location of a user and mark the user as seen."""
+
+    @abstractmethod
+    async def insert_device_location(self, device_id: str, owner_uuid: str, fix: dict, at: datetime) -> IngestResult:
+        """Store a fix (DEVICE_FIX_COLUMNS) of an owned device, unless the same fix of the device is already stored."""
+
+    @abstractmethod
+    async def get_device_location(self, imei: str) -> Optional[DeviceLocation]:
+        ...
+
+    @abstractmethod
+    async def get_owned_device_locations(self, user_uuid: str) -> List[DeviceLocation]:
+        """Last location of every device the user owns."""
+
+    @abstractmethod
+    async def get_shared_device_locations(self, user_uuid: str) -> List[DeviceLocation]:
+        """Last location of every device shared with the user."""
+
+    @abstractmethod
+    async def get_all_device_locations(self, user_uuid: str) -> List[DeviceLocation]:
+        """Every stored location of the devices the user owns or has been shared."""
+
+    @abstractmethod
+    async def get_device_location_history(self, imei: str, start: datetime, end: datetime, limit: int) -> List[dict]:
+        """Fixes of a device in [start, end), oldest first."""
+
+    @abstractmethod
+    async def insert_user_location_history(self, user_uuid: str, location: dict, at: datetime):
+        """Add a fix (USER_FIX_COLUMNS) to the track of a user. A second fix at the same millisecond is ignored."""
+
+    @abstractmethod
+    async def get_user_location_history(self, user_uuid: str, start: datetime, end: datetime, limit: int) -> List[dict]:
+        """Fixes of a user's track in [start, end), oldest first."""
+
+
+# SQLite Repository
+class SQLiteRepository(Repository):
+    """
+    Repository on the single shared SQLite connection. Each method runs without yielding to the event loop,
+    except the read-heavy listings, which go to the read pool when there is one.
+    Authorization checks and reads right after a write stay on the primary connection.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, read_pool: Optional[ReadPool] = None):
+        self.db_manager = db_manager
+        self.read_pool = read_pool
+
+    async def run_read(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run func(connection) on a read connection, or on the primary one without a read pool."""
+        if self.read_pool is not None:
+            return await self.read_pool.run(func)
+        with self.db_manager.get_connection() as conn:
+            return func(conn)
+
+    async def _read_projected(self, statement: Statement, params: tuple = ()) -> list:
+        """Rows of a registered statement as its models or dicts, projected on the read connection's thread."""
+        return await self.run_read(lambda conn: statement.project_rows(conn.execute(statement.sql, params).fetchall()))
+
+    def _fetchall(self, query: str, params: tuple = ()) -> list:
+        with self.db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    def _fetchone(self, query: str, params: tuple = ()):
+        with self.db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return cursor.fetchone()
+
+    def _execute(self, query: str, params: tuple = ()) -> int:
+        """Run one write statement in its own transaction, returning the number of changed rows."""
+        with self.db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            conn.commit()
+            return cursor.rowcount
+
+    # Users
+    async def get_user_uuid_by_email(self, email: str) -> Optional[str]:
+        row = self._fetchone('SELECT uuid FROM users WHERE email = ?', (email,))
+        return row[0] if row else None
+
+    # Friends
+    async def get_friends(self, user_uuid: str) -> List[Friend]:
+        return await self._read_projected(GET_FRIENDS, (user_uuid, user_uuid))
+
+    async def friendship_exists(self, user_uuid: str, other_uuid: str) -> bool:
+        return self._fetchone('''
+            SELECT status FROM friends
+            WHERE (user_uuid = ? AND friend_uuid = ?) OR (user_uuid = ? AND friend_uuid = ?)
+        ''', (user_uuid, other_uuid, other_uuid, user_uuid)) is not None
+
+    async def add_friend_request(self, user_uuid: str, friend_uuid: str):
+        self._execute('''
+            INSERT INTO friends (user_uuid, friend_uuid, status)
+            VALUES (?, ?, 'pending')
+        ''', (user_uuid, friend_uuid))
+
+    async def accept_friend_request(self, requester_uuid: str, user_uuid: str) -> bool:
+        return self._execute('''
+            UPDATE friends SET status = 'accepted'
+            WHERE user_uuid = ? AND friend_uuid = ? AND status = 'pending'
+        ''', (requester_uuid, user_uuid)) > 0
+
+    async def remove_friend(self, user_uuid: str, friend_uuid: str) -> bool:
+        # Both directions
+        return self._execute('''
+            DELETE FROM friends
+            WHERE (user_uuid = ? AND friend_uuid = ?) OR (user_uuid = ? AND friend_uuid = ?)
+        ''', (user_uuid, friend_uuid, friend_uuid, user_uuid)) > 0
+
+    async def get_friend_locations(self, user_uuid: str, include_self: bool = False) -> List[UserLocation]:
+        if include_self:
+            return await self._read_projected(GET_FRIEND_AND_OWN_LOCATIONS, (user_uuid, user_uuid, user_uuid))
+        return await self._read_projected(GET_FRIEND_LOCATIONS, (user_uuid, user_uuid))
+
+    # Groups
+    async def get_user_groups(self, user_uuid: str) -> List[Group]:
+        def read(conn: sqlite3.Connection) -> List[Group]:
+            cursor = conn.cursor()
+            cursor.execute(GET_USER_GROUPS.sql, (user_uuid, user_uuid))
+            groups = GET_USER_GROUPS.project_rows(cursor.fetchall())
+            for group in groups:
+                cursor.execute(GET_GROUP_MEMBER_IDS.sql, (group.id,))
+                group.member_ids = [member[0] for member in cursor.fetchall()]
+            return groups
+        return await self.run_read(read)
+
+    async def create_group(self, group_id: str, name: str, description: Optional[str], owner_uuid: str):
+        with self.db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO groups (id, name, description, owner_id)
+                VALUES (?, ?, ?, ?)
+            ''', (group_id, name, description, owner_uuid))
+            cursor.execute('''
+                INSERT INTO group_members (group_id, user_uuid)
+                VALUES (?, ?)
+            ''', (group_id, owner_uuid))
+            conn.commit()
+
+    async def get_group_owner(self, group_id: str) -> Optional[str]:
+        row = self._fetchone('SELECT owner_id FROM groups WHERE id = ?', (group_id,))
+        return row[0] if row else None
+
+    async def delete_group(self, group_id: str):
+        with self.db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM group_members WHERE group_id = ?', (group_id,))
+            cursor.execute('DELETE FROM groups WHERE id = ?', (group_id,))
+            conn.commit()
+
+    async def is_group_owner_or_member(self, group_id: str, user_uuid: str) -> bool:
+        return self._fetchone('''
+            SELECT g.owner_id FROM groups g
+            LEFT JOIN group_members gm ON g.id = gm.group_id
+            WHERE g.id = ? AND (g.owner_id = ? OR gm.user_uuid = ?)
+        ''', (group_id, user_uuid, user_uuid)) is not None
+
+    async def add_group_member(self, group_id: str, user_uuid: str):
+        self._execute('''
+            INSERT OR IGNORE INTO group_members (group_id, user_uuid)
+            VALUES (?, ?)
+        ''', (group_id, user_uuid))
+
+    async def remove_group_member(self, group_id: str, user_uuid: str) -> bool:
+        return self._execute('DELETE FROM group_members WHERE group_id = ? AND user_uuid = ?',
+                             (group_id, user_uuid)) > 0
+
+    async def get_group_members(self, group_id: str) -> List[str]:
+        return [row[0] for row in self._fetchall(GET_GROUP_MEMBER_IDS.sql, (group_id,))]
+
+    # Devices
+    async def get_devices(self, owner_uuid: str) -> List[dict]:
+        return await self._read_projected(GET_DEVICES, (owner_uuid,))
+
+    async def device_exists(self, imei: str) -> bool:
+        return self._fetchone('SELECT owner_uuid FROM devices WHERE imei = ?', (imei,)) is not None
+
+    async def add_device(self, imei: str, owner_uuid: str, name: str):
+        self._execute('INSERT INTO devices (imei, owner_uuid, name) VALUES (?, ?, ?)', (imei, owner_uuid, name))
+
+    async def rename_device(self, imei: str, owner_uuid: str, name: str) -> bool:
+        return self._execute('UPDATE devices SET name = ? WHERE imei = ? AND owner_uuid = ?',
+                             (name, imei, owner_uuid)) > 0
+
+    async def remove_device(self, imei: str, owner_uuid: str) -> bool:
+        with self.db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM device_shares WHERE device_imei = ?', (imei,))
+            cursor.execute('DELETE FROM device_locations WHERE device_id = (SELECT id FROM devices WHERE imei = ?)',
+                           (imei,))
+            cursor.execute('DELETE FROM devices WHERE imei = ? AND owner_uuid = ?', (imei, owner_uuid))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return False
+            conn.commit()
+            return True
+
+    async def get_owned_device_name(self, imei: str, owner_uuid: str) -> Optional[str]:
+        row = self._fetchone('SELECT name FROM devices WHERE imei = ? AND owner_uuid = ?', (imei, owner_uuid))
+        return row[0] if row else None
+
+    async def user_can_view_device(self, imei: str, user_uuid: str) -> bool:
+        return self._fetchone('''
+            SELECT 1 FROM devices WHERE imei = ? AND owner_uuid = ?
+            UNION ALL
+            SELECT 1 FROM device_shares WHERE device_imei = ? AND shared_with_uuid = ?
+        ''', (imei, user_uuid, imei, user_uuid)) is not None
+
+    # Shares
+    async def share_device(self, imei: str, owner_uuid: str, shared_with_uuid: str):
+        self._execute('''
+            INSERT OR REPLACE INTO device_shares (device_imei, owner_uuid, shared_with_uuid)
+            VALUES (?, ?, ?)
+        ''', (imei, owner_uuid, shared_with_uuid))
+
+    async def unshare_device(self, imei: str, owner_uuid: str, shared_with_uuid: str) -> bool:
+        return self._execute('''
+            DELETE FROM device_shares
+            WHERE device_imei = ? AND owner_uuid = ? AND shared_with_uuid = ?
+        ''', (imei, owner_uuid, shared_with_uuid)) > 0
+
+    async def get_device_share_recipients(self, imei: str) -> List[str]:
+        return [row[0] for row in self._fetchall('SELECT shared_with_uuid FROM device_shares WHERE device_imei = ?', (imei,))]
+
+    # Locations
+    async def upsert_user_location(self, user_uuid: str, location: dict, at: datetime):
+        with self.db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO user_locations
+                (user_id, latitude, longitude, altitude, speed, battery, accuracy, timestamp)
+                SELECT id, ?, ?, ?, ?, ?, ?, ? FROM users WHERE uuid = ?
+            ''', (location.get('latitude'), location.get('longitude'), location.get('altitude'),
+                  location.get('speed'), location.get('battery'), location.get('accuracy'), to_epoch_ms(at), user_uuid))
+            cursor.execute('UPDATE users SET last_seen = ? WHERE uuid = ?', (at, user_uuid))
+            conn.commit()
+
+    async def insert_device_location(self, device_id: str, owner_uuid: str, fix: dict, at: datetime) -> IngestResult:
+        with self.db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id FROM devices WHERE imei = ? AND owner_uuid = ?', (device_id, owner_uuid))
+            row = cursor.fetchone()
+            if not row:
+                return IngestResult.UNKNOWN_DEVICE
+
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO device_locations
+                (device_id, {', '.join(DEVICE_FIX_COLUMNS)}, timestamp, device_time)
+                VALUES (?, {', '.join('?' for _ in DEVICE_FIX_COLUMNS)}, ?, ?)
+            ''', (row[0], *(fix.get(column) for column in DEVICE_FIX_COLUMNS), to_epoch_ms(at), device_time_ms(fix.get('time'))))
+            if cursor.rowcount == 0:
+                return IngestResult.DUPLICATE
+            cursor.execute('UPDATE devices SET last_seen = ? WHERE id = ?', (at, row[0]))
+            conn.commit()
+            return IngestResult.STORED
+
+    async def get_device_location(self, imei: str) -> Optional[DeviceLocation]:
+        row = self._fetchone(GET_DEVICE_LOCATION.sql, (imei,))
+        return GET_DEVICE_LOCATION.project(row) if row else None
+
+    async def get_owned_device_locations(self, user_uuid: str) -> List[DeviceLocation]:
+        return await self._read_projected(GET_OWNED_DEVICE_LOCATIONS, (user_uuid,))
+
+    async def get_shared_device_locations(self, user_uuid: str) -> List[DeviceLocation]:
+        return await self._read_projected(GET_SHARED_DEVICE_LOCATIONS, (user_uuid,))
+
+    async def get_all_device_locations(self, user_uuid: str) -> List[DeviceLocation]:
+        return (await self._read_projected(GET_ALL_OWNED_DEVICE_LOCATIONS, (user_uuid,)) +
+                await self._read_projected(GET_ALL_SHARED_DEVICE_LOCATIONS, (user_uuid,)))
+
+    async def get_device_location_history(self, imei: str, start: datetime, end: datetime, limit: int) -> List[dict]:
+        return await self._read_projected(GET_DEVICE_LOCATION_HISTORY,
+                                          (imei, to_epoch_ms(start), to_epoch_ms(end), limit))
+
+    async def insert_user_location_history(self, user_uuid: str, location: dict, at: datetime):
+        self._execute(f'''
+            INSERT OR IGNORE INTO user_location_history (user_id, timestamp, {', '.join(USER_FIX_COLUMNS)})
+            SELECT id, ?, {', '.join('?' for _ in USER_FIX_COLUMNS)} FROM users WHERE uuid = ?
+        ''', (to_epoch_ms(at), *(location.get(column) for column in USER_FIX_COLUMNS), user_uuid))
+
+    async def get_user_location_history(self, user_uuid: str, start: datetime, end: datetime, limit: int) -> List[dict]:
+        return await self._read_projected(GET_USER_LOCATION_HISTORY,
+                                          (user_uuid, to_epoch_ms(start), to_epoch_ms(end), limit))
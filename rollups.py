@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from database_manager import DatabaseManager
+from geo import haversine_distance_m
+
+# A longer gap between fixes counts as the device being offline
+MAX_UPTIME_GAP_SECONDS = 10 * 60
+
+ROLLUP_COLUMNS = ['fix_count', 'distance_m', 'max_speed', 'speed_sum', 'speed_count', 'bark_count',
+                  'first_battery', 'first_battery_at', 'last_battery', 'last_battery_at',
+                  'last_latitude', 'last_longitude', 'last_fix_at', 'last_connection_type']
+
+
+@dataclass(slots=True)
+class Fix:
+    device_id: str
+    latitude: Optional[float]
+    longitude: Optional[float]
+    speed: Optional[float]
+    battery: Optional[int]
+    bark: Optional[int]
+    connection_type: Optional[str]
+    fixed_at: float  # epoch seconds
+
+
+@dataclass(slots=True)
+class PreviousFix:
+    latitude: Optional[float]
+    longitude: Optional[float]
+    fixed_at: float
+    connection_type: Optional[str]
+
+
+def utc_day(epoch_seconds: float) -> str:
+    return datetime.fromtimestamp(epoch_seconds, timezone.utc).date().isoformat()
+
+
+# Daily Rollups
+class DailyRollups:
+    """
+    Maintains device_daily_stats and device_daily_uptime from batches of fixes.
+    Batches are written on a connection of their own, so they can be applied from a worker thread,
+    except for an in-memory database, which is only reachable through the shared connection.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, logger: logging.Logger):
+        self.db_manager = db_manager
+        self.logger = logger
+        self._previous_fixes: Dict[str, PreviousFix] = {}
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def in_memory(self) -> bool:
+        return self.db_manager.db_path == ':memory:'
+
+    def _writer_connection(self) -> sqlite3.Connection:
+        if self.in_memory:
+            return self.db_manager.get_connection()
+        if self._connection is None:
+            # Used by one worker thread at a time, under the lock
+            self._connection = sqlite3.connect(self.db_manager.db_path, check_same_thread=False)
+        return self._connection
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _load_row(self, cursor, device_id: str, day: str) -> dict:
+        cursor.execute(f'SELECT {", ".join(ROLLUP_COLUMNS)} FROM device_daily_stats WHERE device_id = ? AND day = ?',
+                       (device_id, day))
+        row = cursor.fetchone()
+        if row:
+            return dict(zip(ROLLUP_COLUMNS, row))
+        return {column: None for column in ROLLUP_COLUMNS} | {
+            'fix_count': 0, 'distance_m': 0.0, 'speed_sum': 0.0, 'speed_count': 0, 'bark_count': 0}
+
+    def _load_previous_fix(self, cursor, device_id: str) -> Optional[PreviousFix]:
+        previous = self._previous_fixes.get(device_id)
+        if previous:
+            return previous
+
+        # After a restart, continue from the last fix recorded in the rollups
+        cursor.execute('''
+            SELECT last_latitude, last_longitude, last_fix_at, last_connection_type
+            FROM device_daily_stats WHERE device_id = ? ORDER BY day DESC LIMIT 1
+        ''', (device_id,))
+        row = cursor.fetchone()
+        if row and row[2] is not None:
+            return PreviousFix(row[0], row[1], row[2], row[3])
+        return None
+
+    def apply(self, fixes: List[Fix]):
+        """Fold a batch of fixes into the rollups in one transaction."""
+        if not fixes:
+            return
+
+        with self._lock, self._writer_connection() as conn:
+            cursor = conn.cursor()
+            rows: Dict[Tuple[str, str], dict] = {}
+            uptime: Dict[Tuple[str, str, str], float] = defaultdict(float)
+
+            for fix in sorted(fixes, key=lambda fix: fix.fixed_at):
+                day = utc_day(fix.fixed_at)
+                key = (fix.device_id, day)
+                if key not in rows:
+                    rows[key] = self._load_row(cursor, fix.device_id, day)
+                row = rows[key]
+
+                previous = self._load_previous_fix(cursor, fix.device_id)
+                has_position = fix.latitude is not None and fix.longitude is not None
+                if previous and fix.fixed_at >= previous.fixed_at:
+                    if has_position and previous.latitude is not None and previous.longitude is not None:
+                        row['distance_m'] += haversine_distance_m(previous.latitude, previous.longitude,
+                                                                  fix.latitude, fix.longitude)
+                    gap = fix.fixed_at - previous.fixed_at
+                    if gap <= MAX_UPTIME_GAP_SECONDS:
+                        uptime[(fix.device_id, day, previous.connection_type or 'unknown')] += gap
+
+                row['fix_count'] += 1
+                if fix.speed is not None:
+                    row['max_speed'] = fix.speed if row['max_speed'] is None else max(row['max_speed'], fix.speed)
+                    row['speed_sum'] += fix.speed
+                    row['speed_count'] += 1
+                if fix.bark:
+                    row['bark_count'] += fix.bark
+                if fix.battery is not None:
+                    if row['first_battery'] is None:
+                        row['first_battery'] = fix.battery
+                        row['first_battery_at'] = fix.fixed_at
+                    row['last_battery'] = fix.battery
+                    row['last_battery_at'] = fix.fixed_at
+                if has_position:
+                    row['last_latitude'] = fix.latitude
+                    row['last_longitude'] = fix.longitude
+                row['last_fix_at'] = fix.fixed_at
+                row['last_connection_type'] = fix.connection_type
+
+                self._previous_fixes[fix.device_id] = PreviousFix(
+                    fix.latitude if has_position else (previous.latitude if previous else None),
+                    fix.longitude if has_position else (previous.longitude if previous else None),
+                    fix.fixed_at,
+                    fix.connection_type,
+                )
+
+            placeholders = ', '.join('?' for _ in range(len(ROLLUP_COLUMNS) + 2))
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO device_daily_stats (device_id, day, {", ".join(ROLLUP_COLUMNS)}) VALUES ({placeholders})',
+                [(device_id, day, *(row[column] for column in ROLLUP_COLUMNS)) for (device_id, day), row in rows.items()])
+            cursor.executemany('''
+                INSERT INTO device_daily_uptime (device_id, day, connection_type, seconds) VALUES (?, ?, ?, ?)
+                ON CONFLICT (device_id, day, connection_type) DO UPDATE SET seconds = seconds + excluded.seconds
+            ''', [(*key, seconds) for key, seconds in uptime.items()])
+            conn.commit()
+
+    def forget_device(self, device_id: str):
+        """Drop all rollups of a removed device."""
+        with self._lock:
+            self._previous_fixes.pop(device_id, None)
+        with self.db_manager.get_connection() as conn:
+            conn.execute('DELETE FROM device_daily_stats WHERE device_id = ?', (device_id,))
+            conn.execute('DELETE FROM device_daily_uptime WHERE device_id = ?', (device_id,))
+
+    def get_daily_stats(self, device_id: str, since_day: str) -> List[dict]:
+        """Daily statistics of a device from since_day (inclusive), oldest first."""
+        with self.db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT day, fix_count, distance_m, max_speed, speed_sum, speed_count, bark_count,
+                       first_battery, first_battery_at, last_battery, last_battery_at
+                FROM device_daily_stats
+                WHERE device_id = ? AND day >= ?
+                ORDER BY day
+            ''', (device_id, since_day))
+            rows = cursor.fetchall()
+
+            cursor.execute('''
+                SELECT day, connection_type, seconds FROM device_daily_uptime
+                WHERE device_id = ? AND day >= ?
+            ''', (device_id, since_day))
+            uptime: Dict[str, Dict[str, float]] = defaultdict(dict)
+            for day, connection_type, seconds in cursor.fetchall():
+                uptime[day][connection_type] = seconds
+
+        stats = []
+        for (day, fix_count, distance_m, max_speed, speed_sum, speed_count, bark_count,
+             first_battery, first_battery_at, last_battery, last_battery_at) in rows:
+            battery_drain_per_hour = None
+            if first_battery_at is not None and last_battery_at is not None and last_battery_at > first_battery_at:
+                battery_drain_per_hour = (first_battery - last_battery) / ((last_battery_at - first_battery_at) / 3600)
+            stats.append({
+                'day': day,
+                'fix_count': fix_count,
+                'distance_m': distance_m,
+                'max_speed': max_speed,
+                'avg_speed': speed_sum / speed_count if speed_count else None,
+                'bark_count': bark_count,
+                'battery_drain_per_hour': battery_drain_per_hour,
+                'uptime_seconds': uptime.get(day, {}),
+            })
+        return stats
+
+
+# Rollup Worker
+class RollupWorker:
+    """
+    Feeds ingested fixes to DailyRollups in batches from a background task, off the ingest path.
+    The batches are applied in a worker thread, so their queries do not hold up the event loop;
+    the stats endpoint reads what has been applied so far.
+    """
+
+    def __init__(self, rollups: DailyRollups, logger: logging.Logger, max_queue: int = 10000, batch_size: int = 500):
+        self.rollups = rollups
+        self.logger = logger
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, fix: Fix):
+        try:
+            self._queue.put_nowait(fix)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            self.logger.warning(f"Rollup queue full, dropped fix for device {fix.device_id}")
+
+    def _take_batch(self, first: Optional[Fix] = None) -> List[Fix]:
+        batch = [first] if first else []
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def flush(self):
+        """Apply everything queued so far."""
+        while not self._queue.empty():
+            await self._apply(self._take_batch())
+
+    async def _apply(self, batch: List[Fix]):
+        try:
+            if self.rollups.in_memory:
+                self.rollups.apply(batch)
+            else:
+                await asyncio.to_thread(self.rollups.apply, batch)
+        except Exception as e:
+            self.logger.error(f"Error applying {len(batch)} fixes to rollups: {e}")
+
+    async def _run(self):
+        while True:
+            first = await self._queue.get()
+            await self._apply(self._take_batch(first))
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        self.rollups.close()
@@ -8,7 +8,10 @@ from fastapi.testclient import TestClient
 from tests.utils.fixtures import TestDataFixtures
 from typing import Dict, Any
 
-from main import app, DB_PATH_ENV_VAR, BOOTSTRAP_ADMIN_EMAIL_ENV_VAR, BOOTSTRAP_ADMIN_PASSWORD_ENV_VAR
+from main import app, DB_PATH_ENV_VAR, BOOTSTRAP_ADMIN_EMAIL_ENV_VAR, BOOTSTRAP_ADMIN_PASSWORD_ENV_VAR, PASSWORD_HASH_ROUNDS_ENV_VAR
+
+# Keep bcrypt cheap in tests, production uses the default cost
+os.environ.setdefault(PASSWORD_HASH_ROUNDS_ENV_VAR, "4")
 
 @pytest.fixture(scope="function")
 def temp_db() -> Generator[str, None, None]:
@@ -0,0 +1,60 @@
+"""
+End-to-end tests for the paginated admin listings.
+"""
+from fastapi.testclient import TestClient
+from tests.utils.fixtures import TestDataFixtures
+
+
+def fetch_all_pages(test_client: TestClient, url: str, headers: dict) -> list:
+    rows = []
+    while True:
+        response = test_client.get(url, headers=headers)
+        assert response.status_code == 200
+        rows.extend(response.json())
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if not next_cursor:
+            return rows
+        url = url.split("&cursor=")[0] + f"&cursor={next_cursor}"
+
+
+class TestAdminListings:
+    """Test admin listing functionality."""
+
+    def test_users_are_paginated_and_searchable(self, test_client: TestClient, admin_token: str):
+        """Test walking all pages returns every user once, in order, and prefix search narrows it."""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        for index in range(5):
+            user_data = TestDataFixtures.user_signup_data(email=f"page{index}@example.com")
+            assert test_client.post("/signup", json=user_data).status_code == 200
+
+        response = test_client.get("/admin/users?limit=2", headers=headers)
+        assert len(response.json()) == 2
+        assert response.headers["X-Total-Count"] == "6"
+        assert response.headers["X-Total-Count-Exact"] == "true"
+
+        emails = [user["email"] for user in fetch_all_pages(test_client, "/admin/users?limit=2", headers)]
+        assert len(emails) == 6
+        assert emails == sorted(emails)
+
+        emails = [user["email"] for user in fetch_all_pages(test_client, "/admin/users?limit=2&q=page&order=desc", headers)]
+        assert emails == [f"page{index}@example.com" for index in reversed(range(5))]
+
+    def test_devices_are_paginated_by_name(self, test_client: TestClient, admin_token: str, test_user_token: str):
+        """Test devices can be paged through sorted by name."""
+        headers = {"Authorization": f"Bearer {test_user_token}"}
+        for index, name in enumerate(["Charlie", "Alpha", "Bravo"]):
+            device_data = TestDataFixtures.device_data(imei=f"35000000000000{index}", name=name)
+            assert test_client.post("/devices", json=device_data, headers=headers).status_code == 200
+
+        admin_headers = {"Authorization": f"Bearer {admin_token}"}
+        devices = fetch_all_pages(test_client, "/admin/devices?limit=1&sort=name", admin_headers)
+        assert [device["device_name"] for device in devices] == ["Alpha", "Bravo", "Charlie"]
+
+        response = test_client.get("/admin/devices?q=350000000000001", headers=admin_headers)
+        assert [device["device_name"] for device in response.json()] == ["Alpha"]
+
+    def test_invalid_sort_and_cursor_are_rejected(self, test_client: TestClient, admin_token: str):
+        """Test unknown sort columns and malformed cursors give 400."""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        assert test_client.get("/admin/users?sort=password_hash", headers=headers).status_code == 400
+        assert test_client.get("/admin/users?cursor=bogus", headers=headers).status_code == 400
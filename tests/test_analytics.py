@@ -0,0 +1,127 @@
+"""
+Tests for the vectorized location history analytics.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import analytics
+from analytics import Track
+from database_manager import DatabaseManager
+from geo import haversine_distance_m
+from repository import SQLiteRepository
+
+START = 1735689600.0  # 2025-01-01T00:00:00Z
+
+
+def make_track(points, interval_s: float = 60, speeds=None) -> Track:
+    latitude, longitude = zip(*points)
+    return Track(
+        np.array(latitude, dtype=float),
+        np.array(longitude, dtype=float),
+        np.array(speeds if speeds is not None else [np.nan] * len(points), dtype=float),
+        START + np.arange(len(points)) * float(interval_s),
+    )
+
+
+class TestAnalytics:
+    """Test vectorized analytics functionality."""
+
+    def test_distance_matches_per_row_haversine(self):
+        """Test the vectorized distance equals summing haversine over consecutive fixes."""
+        points = [(60.0, 10.0), (60.001, 10.002), (60.003, 10.001), (59.999, 9.998)]
+        expected = sum(haversine_distance_m(*a, *b) for a, b in zip(points, points[1:]))
+
+        assert analytics.total_distance_m(make_track(points)) == pytest.approx(expected, rel=1e-9)
+        assert analytics.total_distance_m(make_track(points[:1])) == 0.0
+
+    def test_detect_stops(self):
+        """Test only slow runs lasting long enough are reported as stops, including one at the end."""
+        moving = [(60.0 + index * 0.001, 10.0) for index in range(5)]
+        short_stop = [moving[-1]] * 3
+        moving_again = [(60.01 + index * 0.001, 10.0) for index in range(5)]
+        long_stop = [moving_again[-1]] * 8
+        track = make_track(moving + short_stop + moving_again + long_stop, interval_s=60)
+
+        [stop] = analytics.detect_stops(track, max_speed_mps=0.5, min_duration_s=300)
+        assert stop.start_index == 12
+        assert stop.end_index == 20
+        assert stop.duration == 8 * 60
+        assert stop.latitude == pytest.approx(moving_again[-1][0])
+
+    def test_dwell_points_rank_cells_by_time(self):
+        """Test the cell where most time was spent comes first."""
+        home = [(60.0, 10.0)] * 10
+        park = [(60.1, 10.1)] * 4
+        track = make_track(home + park + [(60.2, 10.2)], interval_s=30)
+
+        dwell = analytics.dwell_points(track, cell_size_m=50, top=2)
+        assert [round(point.latitude, 3) for point in dwell] == [60.0, 60.1]
+        assert dwell[0].seconds == 10 * 30
+        assert dwell[1].seconds == 4 * 30
+
+    def test_speed_profile_ignores_missing_speeds(self):
+        """Test the histogram and percentiles skip fixes without a speed."""
+        track = make_track([(60.0, 10.0)] * 5, speeds=[0.2, 1.5, np.nan, 4.0, 25.0])
+
+        profile = analytics.speed_profile(track)
+        assert profile["count"] == 4
+        assert sum(profile["histogram"]) == 4
+        assert profile["max"] == 25.0
+        assert profile["p50"] == pytest.approx(2.75)
+
+    def test_load_track_from_sqlite_and_npz(self, tmp_path):
+        """Test a track loads from device_locations within bounds and round trips through the columnar export."""
+        conn = DatabaseManager(logging.getLogger(__name__), ":memory:").get_connection()
+        conn.executemany("INSERT INTO devices (id, imei, owner_uuid, name) VALUES (?, ?, 'owner', 'Rex')",
+                         [(1, "device"), (2, "other")])
+        rows = [
+            (1, 60.0, 10.0, 1.0, START * 1000),
+            (1, 60.001, 10.0, None, (START + 60) * 1000),
+            (1, None, None, 2.0, (START + 90) * 1000),
+            (1, 60.002, 10.0, 3.0, (START + 120) * 1000),
+            (2, 50.0, 5.0, 1.0, (START + 30) * 1000),
+        ]
+        conn.executemany("INSERT INTO device_locations (device_id, latitude, longitude, speed, timestamp) VALUES (?, ?, ?, ?, ?)", rows)
+
+        track = analytics.load_track(conn, "device", start=START + 30)
+        assert track.timestamp.tolist() == [START + 60, START + 120]
+        assert np.isnan(track.speed[0])
+
+        full = analytics.load_track(conn, "device")
+        assert len(full) == 3
+        path = str(tmp_path / "track.npz")
+        analytics.save_track_npz(path, full)
+        loaded = analytics.load_track_npz(path)
+        for field in Track._fields:
+            np.testing.assert_array_equal(getattr(loaded, field), getattr(full, field))
+
+        assert len(analytics.load_track(conn, "missing")) == 0
+
+    def test_load_track_is_not_shifted_by_the_local_zone(self, monkeypatch):
+        """Test fixes stored from local times load at their epoch seconds, with windows bounded the same way."""
+        monkeypatch.setenv("TZ", "America/New_York")
+        time.tzset()
+        try:
+            db_manager = DatabaseManager(logging.getLogger(__name__), ":memory:")
+            conn = db_manager.get_connection()
+            conn.execute("INSERT INTO users (uuid, email, password_hash, nickname) VALUES ('owner', 'o@example.com', 'hash', 'O')")
+            repository = SQLiteRepository(db_manager)
+
+            async def store():
+                await repository.add_device("device", "owner", "Rex")
+                for minute in range(3):
+                    # 2024-12-31 19:00 in New York is START
+                    await repository.insert_device_location("device", "owner", {"latitude": 60.0, "longitude": 10.0},
+                                                            datetime(2024, 12, 31, 19, minute))
+            asyncio.run(store())
+
+            track = analytics.load_track(conn, "device", start=START + 60, end=START + 120)
+            assert track.timestamp.tolist() == [START + 60]
+        finally:
+            monkeypatch.undo()
+            time.tzset()
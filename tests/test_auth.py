@@ -2,6 +2,7 @@
 End-to-end tests for authentication endpoints.
 """
 from fastapi.testclient import TestClient
+import main
 from tests.utils.fixtures import TestDataFixtures, TestAssertions
 
 
@@ -91,3 +92,49 @@ class TestAuthentication:
         headers = {"Authorization": "Bearer invalid_token"}
         response = test_client.get("/friends", headers=headers)
         assert response.status_code == 401  # API returns 401 for invalid token
+
+    def test_signout_revokes_token(self, test_client: TestClient, test_user_token: str):
+        """Test a signed out token is rejected afterwards."""
+        headers = {"Authorization": f"Bearer {test_user_token}"}
+        assert test_client.get("/friends", headers=headers).status_code == 200
+
+        response = test_client.post("/signout", headers=headers)
+        assert response.status_code == 200
+
+        response = test_client.get("/friends", headers=headers)
+        assert response.status_code == 401
+
+    def test_signout_outlives_the_token_cache(self, test_client: TestClient, test_user_token: str):
+        """Test a revocation is kept in the database, for other workers and after a restart."""
+        headers = {"Authorization": f"Bearer {test_user_token}"}
+        assert test_client.post("/signout", headers=headers).status_code == 200
+
+        # As a worker that did not see the sign out, or this one after a restart
+        main.token_cache.clear()
+        assert test_client.get("/friends", headers=headers).status_code == 401
+
+    def test_admin_endpoint_rejects_non_admin(self, test_client: TestClient, test_user_token: str):
+        """Test a regular user cannot access admin endpoints."""
+        headers = {"Authorization": f"Bearer {test_user_token}"}
+        response = test_client.get("/admin/users", headers=headers)
+        assert response.status_code == 403
+
+    def test_admin_endpoint_accepts_admin(self, test_client: TestClient, admin_token: str):
+        """Test an admin can access admin endpoints."""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = test_client.get("/admin/users", headers=headers)
+        assert response.status_code == 200
+
+    def test_role_change_takes_effect_immediately(self, test_client: TestClient, admin_token: str, signed_in_user):
+        """Test granting and removing admin rights invalidates the cached role."""
+        admin_headers = {"Authorization": f"Bearer {admin_token}"}
+        user_headers = {"Authorization": f"Bearer {signed_in_user['token']}"}
+        assert test_client.get("/admin/users", headers=user_headers).status_code == 403
+
+        response = test_client.put(f"/admin/users/{signed_in_user['uuid']}/role", headers=admin_headers, json={"role": "A"})
+        assert response.status_code == 200
+        assert test_client.get("/admin/users", headers=user_headers).status_code == 200
+
+        response = test_client.put(f"/admin/users/{signed_in_user['uuid']}/role", headers=admin_headers, json={"role": "U"})
+        assert response.status_code == 200
+        assert test_client.get("/admin/users", headers=user_headers).status_code == 403
@@ -0,0 +1,73 @@
+"""
+Tests for online database backups.
+"""
+import asyncio
+import logging
+import sqlite3
+import pytest
+from fastapi.testclient import TestClient
+from backup import BackupManager, BackupInProgressError
+from database_manager import DatabaseManager
+from main import BACKUP_DIR_ENV_VAR
+
+
+@pytest.fixture(autouse=True)
+def backup_dir(tmp_path, monkeypatch) -> str:
+    path = str(tmp_path / "backups")
+    monkeypatch.setenv(BACKUP_DIR_ENV_VAR, path)
+    return path
+
+
+class TestBackup:
+    """Test database backup functionality."""
+
+    def test_backup_of_file_database_in_small_steps(self, tmp_path, backup_dir: str):
+        """Test a file database is copied page by page into a consistent backup, and old backups are pruned."""
+        db_manager = DatabaseManager(logging.getLogger(__name__), str(tmp_path / "live.db"))
+        conn = db_manager.get_connection()
+        conn.executemany("INSERT INTO device_locations (device_id, latitude) VALUES (?, ?)",
+                         [("device", float(index)) for index in range(5000)])
+        conn.commit()
+        manager = BackupManager(db_manager, backup_dir, logging.getLogger(__name__), keep=2, pages_per_step=5)
+
+        async def run_backups():
+            results = []
+            for _ in range(3):
+                results.append(await manager.create_backup())
+                await asyncio.sleep(1.1)  # backups are named by the second
+            return results
+
+        results = asyncio.run(run_backups())
+        assert results[0]["pages"] > 5
+
+        backups = manager.list_backups()
+        assert [backup["name"] for backup in backups] == [results[2]["name"], results[1]["name"]]
+        copy = sqlite3.connect(f"{backup_dir}/{backups[0]['name']}")
+        assert copy.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        assert copy.execute("SELECT COUNT(*) FROM device_locations").fetchone()[0] == 5000
+        copy.close()
+
+    def test_concurrent_backups_are_rejected(self, backup_dir: str):
+        """Test a second backup while one is running fails fast."""
+        manager = BackupManager(DatabaseManager(logging.getLogger(__name__), ":memory:"), backup_dir, logging.getLogger(__name__))
+
+        async def overlap():
+            async with manager._lock:
+                with pytest.raises(BackupInProgressError):
+                    await manager.create_backup()
+
+        asyncio.run(overlap())
+
+    def test_backup_endpoints(self, test_client: TestClient, admin_token: str, test_user_token: str):
+        """Test admins can create and list backups, other users cannot."""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = test_client.post("/admin/backups", headers=headers)
+        assert response.status_code == 200
+        name = response.json()["name"]
+
+        response = test_client.get("/admin/backups", headers=headers)
+        assert response.status_code == 200
+        assert [backup["name"] for backup in response.json()] == [name]
+
+        user_headers = {"Authorization": f"Bearer {test_user_token}"}
+        assert test_client.post("/admin/backups", headers=user_headers).status_code == 403
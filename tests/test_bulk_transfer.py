@@ -0,0 +1,103 @@
+"""
+Tests for the bulk export and import tooling.
+"""
+import logging
+import sqlite3
+import pytest
+import bulk_transfer
+from database_manager import DatabaseManager
+
+
+def create_source_db(path: str):
+    conn = DatabaseManager(logging.getLogger(__name__), path).get_connection()
+    conn.executemany("INSERT INTO users (uuid, email, password_hash, nickname, created_at) VALUES (?, ?, ?, ?, ?)", [
+        ("user-1", "one@example.com", "$2b$hash", "One, \"quoted\"", "2025-01-01 00:00:00"),
+        ("user-2", "two@example.com", "$2b$hash", "Two", "2025-01-02 00:00:00"),
+    ])
+    conn.execute("INSERT INTO devices (imei, owner_uuid, name) VALUES (?, ?, ?)", ("123", "user-1", "Rex"))
+    conn.execute("INSERT INTO device_shares (device_imei, owner_uuid, shared_with_uuid) VALUES (?, ?, ?)", ("123", "user-1", "user-2"))
+    conn.executemany("INSERT INTO device_locations (device_id, latitude, longitude, speed, battery, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                     [(1, 60.0 + index * 0.001, 10.0, None if index % 2 else 1.5, 80, 1735689600000 + index * 1000)
+                      for index in range(25)])
+    conn.commit()
+    conn.close()
+
+def table_rows(path: str, table: str) -> list:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT * FROM {table} ORDER BY rowid").fetchall()
+    finally:
+        conn.close()
+
+
+class TestBulkTransfer:
+    """Test bulk export and import functionality."""
+
+    @pytest.mark.parametrize("format_name", ["ndjson", "csv"])
+    def test_round_trip(self, tmp_path, format_name: str):
+        """Test every exported table imports into a new database unchanged, in small chunks."""
+        source, target, directory = str(tmp_path / "source.db"), str(tmp_path / "target.db"), str(tmp_path / "export")
+        create_source_db(source)
+
+        counts = bulk_transfer.export_database(source, directory, format_name)
+        assert counts["device_locations"] == 25
+        assert bulk_transfer.import_database(target, directory, chunk_size=7) == counts
+
+        for table in ("users", "devices", "device_shares", "device_locations"):
+            assert table_rows(target, table) == table_rows(source, table)
+
+    def test_indexes_are_rebuilt(self, tmp_path):
+        """Test indexes dropped for the import exist again afterwards."""
+        source, target, directory = str(tmp_path / "source.db"), str(tmp_path / "target.db"), str(tmp_path / "export")
+        create_source_db(source)
+        bulk_transfer.export_database(source, directory, tables=["users"])
+        bulk_transfer.import_database(target, directory, tables=["users"])
+
+        conn = sqlite3.connect(target)
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'users'")}
+        conn.close()
+        assert "idx_users_created_at" in indexes
+
+    def test_failed_import_rolls_back(self, tmp_path):
+        """Test a conflicting import leaves neither rows nor dropped indexes behind, and can be rerun to ignore conflicts."""
+        source, directory = str(tmp_path / "source.db"), str(tmp_path / "export")
+        create_source_db(source)
+        bulk_transfer.export_database(source, directory, tables=["users"])
+
+        assert bulk_transfer.main(["import", "--db", source, "--dir", directory, "--tables", "users"]) == 1
+        conn = sqlite3.connect(source)
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'idx_users_created_at'").fetchone()[0] == 1
+        conn.close()
+
+        # Both users are already there
+        assert bulk_transfer.import_database(source, directory, tables=["users"], on_conflict="ignore") == {"users": 0}
+        assert len(table_rows(source, "users")) == 2
+
+    def test_resent_fixes_are_ignored_in_populated_database(self, tmp_path):
+        """Test unique indexes stay in place on import, so fixes already stored under another id are skipped."""
+        source, directory = str(tmp_path / "source.db"), str(tmp_path / "export")
+        create_source_db(source)
+        conn = sqlite3.connect(source)
+        conn.execute("INSERT INTO device_locations (id, device_id, latitude, time, device_time, timestamp) "
+                     "VALUES (100, 1, 60.0, '2025-01-01T12:00:00Z', 1735732800000, 1735732800000)")
+        conn.commit()
+        conn.close()
+        directory_path = tmp_path / "export"
+        directory_path.mkdir()
+        (directory_path / "device_locations.ndjson").write_text(
+            '{"id": 200, "device_id": 1, "latitude": 60.5, "time": "2025-01-01T12:00:00Z", "device_time": 1735732800000, "timestamp": 1735732805000}\n'
+            '{"id": 201, "device_id": 1, "latitude": 61.0, "time": "2025-01-01T12:01:00Z", "device_time": 1735732860000, "timestamp": 1735732860000}\n')
+
+        assert bulk_transfer.import_database(source, directory, tables=["device_locations"], on_conflict="ignore") == {"device_locations": 1}
+        conn = sqlite3.connect(source)
+        assert conn.execute("SELECT id FROM device_locations WHERE id >= 100 ORDER BY id").fetchall() == [(100,), (201,)]
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'idx_device_locations_device_timestamp'").fetchone()[0] == 1
+        conn.close()
+
+    def test_unknown_columns_are_rejected(self, tmp_path):
+        """Test column names from the file must exist in the table."""
+        path = tmp_path / "users.ndjson"
+        path.write_text('{"uuid": "x", "email\\" TEXT); DROP TABLE users; --": "y"}\n')
+        conn = DatabaseManager(logging.getLogger(__name__), ":memory:").get_connection()
+        with pytest.raises(ValueError):
+            bulk_transfer.import_table(conn, "users", str(path))
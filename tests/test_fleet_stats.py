@@ -0,0 +1,73 @@
+"""
+Tests for the incrementally maintained fleet aggregates.
+"""
+import time
+import pytest
+from fastapi.testclient import TestClient
+from fleet_stats import FleetStats, DeviceSnapshot, STALE_AFTER_SECONDS
+from tests.utils.fixtures import TestDataFixtures
+
+
+class TestFleetStats:
+    """Test fleet stats functionality."""
+
+    def test_aggregates_follow_updates(self):
+        """Test replacing a device's location moves it between aggregates."""
+        stats = FleetStats()
+        stats.record_location("a", battery=15, connection_type="lte", lte_signal=-110, lora_rssi=None)
+        stats.record_location("b", battery=80, connection_type="lora", lte_signal=None, lora_rssi=-90)
+
+        summary = stats.summary()
+        assert summary["device_count"] == 2
+        assert summary["by_connection_type"] == {"lte": 1, "lora": 1}
+        assert summary["battery_histogram"] == {"10-20": 1, "80-90": 1}
+        assert summary["low_battery"] == ["a"]
+        assert summary["weak_signal"] == ["a"]
+
+        stats.record_location("a", battery=100, connection_type="lora", lte_signal=None, lora_rssi=-80)
+        summary = stats.summary()
+        assert summary["by_connection_type"] == {"lora": 2}
+        assert summary["battery_histogram"] == {"80-90": 1, "90-100": 1}
+        assert summary["low_battery"] == []
+        assert summary["weak_signal"] == []
+
+    def test_stale_devices(self):
+        """Test devices not seen within the stale period, or never, are listed first."""
+        now = time.time()
+        stats = FleetStats()
+        stats.load({
+            "old": DeviceSnapshot(last_seen=now - STALE_AFTER_SECONDS - 60),
+            "fresh": DeviceSnapshot(last_seen=now - 60),
+        })
+        stats.add_device("never")
+
+        assert stats.stale_devices(now) == ["never", "old"]
+
+        stats.record_location("old", battery=50, connection_type="lte", lte_signal=None, lora_rssi=None)
+        assert stats.stale_devices(now) == ["never"]
+
+        stats.remove_device("never")
+        assert stats.stale_devices(now) == []
+
+    @pytest.mark.timeout(5)
+    def test_fleet_stats_endpoint(self, test_client: TestClient, admin_token: str, test_user_token: str):
+        """Test ingested locations show up in the admin fleet overview."""
+        headers = {"Authorization": f"Bearer {test_user_token}"}
+        device_data = TestDataFixtures.device_data(imei="222333444555666")
+        assert test_client.post("/devices", json=device_data, headers=headers).status_code == 200
+
+        admin_headers = {"Authorization": f"Bearer {admin_token}"}
+        summary = test_client.get("/admin/fleet_stats", headers=admin_headers).json()
+        assert summary["stale"] == [device_data["imei"]]
+
+        with test_client.websocket_connect(f'/ws?token={test_user_token}') as ws:
+            ws.receive_json()
+            location_data = TestDataFixtures.location_update_data(battery=5, imei=device_data["imei"])
+            location_data["connection_type"] = "lte"
+            ws.send_json({"type": "device_location", "data": location_data})
+
+        summary = test_client.get("/admin/fleet_stats", headers=admin_headers).json()
+        assert summary["device_count"] == 1
+        assert summary["by_connection_type"] == {"lte": 1}
+        assert summary["low_battery"] == [device_data["imei"]]
+        assert summary["stale"] == []
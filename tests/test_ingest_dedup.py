@@ -0,0 +1,72 @@
+"""
+Tests for dropping resent device fixes on ingest.
+"""
+import pytest
+from fastapi.testclient import TestClient
+import main
+from ingest_dedup import RecentKeys, fix_key, sequence_number
+from tests.utils.fixtures import TestDataFixtures
+
+IMEI = "999888777666555"
+
+
+class TestRecentKeys:
+    """Test fix keys and the bounded set of recent ones."""
+
+    def test_fix_key_prefers_the_sequence_number(self):
+        """Test fixes are told apart by sequence number with the device time, else a full device time, else not at all."""
+        assert fix_key(IMEI, {"seq": 7, "time": "12:00:00"}) == (IMEI, "seq", 7, None)
+        assert fix_key(IMEI, {"seq": 7, "time": "2025-01-01T12:00:00Z"}) == (IMEI, "seq", 7, 1735732800000)
+        assert fix_key(IMEI, {"seq": None, "time": "2025-01-01T12:00:00Z"}) == (IMEI, "time", 1735732800000)
+        assert fix_key(IMEI, {"time": "2025-01-01 13:00:00+01:00"}) == (IMEI, "time", 1735732800000)
+        assert fix_key(IMEI, {"time": "12:00:00"}) is None
+        assert fix_key(IMEI, {"time": "2025-01-01"}) is None
+        assert fix_key(IMEI, {"time": "2025-01-01 12:00"}) is None
+        assert fix_key(IMEI, {"latitude": 60.0}) is None
+        assert [sequence_number(value) for value in (7, "7", True, 1.5, None)] == [7, None, None, None, None]
+
+    def test_oldest_keys_are_forgotten(self):
+        """Test the set holds at most its size, forgetting the least recently added key first."""
+        keys = RecentKeys(max_size=2)
+        keys.add("a")
+        keys.add("b")
+        keys.add("a")
+        keys.add("c")
+        assert "a" in keys and "c" in keys and "b" not in keys
+        assert len(keys) == 2
+
+
+class TestIngestDedup:
+    """Test resent fixes are neither stored nor broadcast."""
+
+    @pytest.mark.timeout(5)
+    @pytest.mark.parametrize("remembered", [True, False], ids=["memory", "database"])
+    def test_resent_fix_is_dropped(self, test_client: TestClient, test_user_token: str, monkeypatch, remembered: bool):
+        """Test a resend of a fix reaches neither the history nor the users the device is shared with."""
+        if not remembered:
+            # Resends caught by the unique index, as after a restart
+            monkeypatch.setattr(main, "recent_fix_keys", RecentKeys(max_size=0))
+        headers = {"Authorization": f"Bearer {test_user_token}"}
+        assert test_client.post("/devices", json=TestDataFixtures.device_data(imei=IMEI), headers=headers).status_code == 200
+        friend_data = TestDataFixtures.user_signup_data(email="dedupfriend@example.com", nickname="DedupFriend")
+        test_client.post("/signup", json=friend_data)
+        friend_token = test_client.post("/signin", json=TestDataFixtures.user_signin_data(
+            email=friend_data["email"], password=friend_data["password"])).json()["token"]
+        assert test_client.post(f"/devices/{IMEI}/share", json={"email": friend_data["email"]}, headers=headers).status_code == 200
+
+        def fix(latitude: float, seq: int) -> dict:
+            return {"type": "device_location", "data": {**TestDataFixtures.location_update_data(latitude=latitude, imei=IMEI),
+                                                        "seq": seq, "time": f"2025-01-01T12:00:0{seq}Z"}}
+
+        with test_client.websocket_connect(f"/ws?token={friend_token}") as ws_friend, \
+                test_client.websocket_connect(f"/ws?token={test_user_token}") as ws:
+            assert ws_friend.receive_json()["type"] == "device_locations"
+            ws.send_json(fix(60.0, 1))
+            assert ws_friend.receive_json()["data"][0]["latitude"] == 60.0
+            ws.send_json(fix(60.5, 1))
+            ws.send_json(fix(61.0, 2))
+            assert ws_friend.receive_json()["data"][0]["latitude"] == 61.0
+
+        history = test_client.get(f"/devices/{IMEI}/locations", headers=headers)
+        assert history.status_code == 200
+        assert [location["latitude"] for location in history.json()] == [60.0, 61.0]
@@ -0,0 +1,36 @@
+"""
+Smoke tests for the load benchmark harness, at a tiny scale.
+"""
+import asyncio
+import pytest
+from benchmarks import load_benchmark
+from main import DB_PATH_ENV_VAR
+
+TINY_CONFIG = {'users': 20, 'devices': 40, 'fixes': 200, 'friends_per_user': 4, 'clients': 10,
+               'updates_per_client': 2, 'trackers': 5, 'tracker_updates': 2, 'requests': 50, 'concurrency': 5}
+
+
+class TestLoadBenchmark:
+    """Test the load benchmark harness."""
+
+    @pytest.mark.timeout(60)
+    def test_every_scenario_runs_without_errors(self, tmp_path, monkeypatch):
+        """Test a tiny run seeds the database, drives every scenario and measures deliveries."""
+        db_path = str(tmp_path / "load.db")
+        monkeypatch.setenv(DB_PATH_ENV_VAR, db_path)
+        load_benchmark.ensure_seeded(db_path, TINY_CONFIG)
+        results = asyncio.run(load_benchmark.run_benchmark(db_path, TINY_CONFIG))
+
+        assert results["reconnect storm"]["count"] == TINY_CONFIG["clients"]
+        assert results["ingest -> broadcast"]["updates"] == TINY_CONFIG["clients"] * TINY_CONFIG["updates_per_client"]
+        assert results["ingest -> broadcast"]["count"] > 0
+        assert results["mqtt ingest"]["updates"] >= TINY_CONFIG["trackers"] * TINY_CONFIG["tracker_updates"]
+        assert sum(summary["count"] for name, summary in results.items() if name.startswith("rest ")) == TINY_CONFIG["requests"]
+        assert all(summary["errors"] == 0 for summary in results.values())
+
+    def test_compare_flags_regressions(self):
+        """Test slower p95, lower throughput and new errors are reported against the baseline."""
+        baseline = {"rest GET /friends": {"p95_ms": 10.0, "throughput_per_s": 100.0, "errors": 0}}
+        assert load_benchmark.compare(baseline, {"rest GET /friends": {"p95_ms": 11.0, "throughput_per_s": 90.0, "errors": 0}}, 0.2) == []
+        regressions = load_benchmark.compare(baseline, {"rest GET /friends": {"p95_ms": 13.0, "throughput_per_s": 70.0, "errors": 1}}, 0.2)
+        assert len(regressions) == 3
@@ -0,0 +1,150 @@
+"""
+Tests for the columnar archive of cold location history.
+"""
+import asyncio
+import logging
+import os
+import pytest
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from tests.utils.fixtures import TestDataFixtures
+
+pytest.importorskip("pyarrow")
+
+import main
+import location_archive
+from database_manager import DatabaseManager
+from location_archive import LocationArchive, LocationArchiver, LOCATION_COLUMNS, months_between
+from main import LOCATION_ARCHIVE_DIR_ENV_VAR
+from models import to_epoch_ms
+
+IMEI = "555666777888999"
+DEVICE_KEY = "(SELECT id FROM devices WHERE imei = ?)"
+
+
+@pytest.fixture
+def test_client(temp_db, tmp_path, monkeypatch):
+    """Override of the shared client with location archiving enabled."""
+    monkeypatch.setenv(LOCATION_ARCHIVE_DIR_ENV_VAR, str(tmp_path / "archive"))
+    with TestClient(main.app) as client:
+        yield client
+
+
+def make_row(location_id: int, timestamp: datetime, latitude: float = 60.0) -> tuple:
+    values = {column: None for column in LOCATION_COLUMNS}
+    values.update(id=location_id, device_id=IMEI, latitude=latitude, longitude=10.0, battery=80,
+                  connection_type="lte", timestamp=str(timestamp))
+    return tuple(values[column] for column in LOCATION_COLUMNS)
+
+
+class TestLocationArchive:
+    """Test location archive functionality."""
+
+    def test_months_between(self):
+        """Test partitions overlapping a window are listed across a year boundary."""
+        assert months_between(datetime(2024, 11, 15), datetime(2025, 2, 1)) == ["2024-11", "2024-12", "2025-01"]
+
+    def test_write_partition_merges_without_duplicates(self, tmp_path):
+        """Test rewriting a partition keeps earlier rows and skips ones already archived."""
+        archive = LocationArchive(str(tmp_path))
+        base = datetime(2025, 1, 10, 12, 0, 0)
+        archive.write_partition(IMEI, "2025-01", [make_row(2, base + timedelta(minutes=1)), make_row(1, base)])
+        archive.write_partition(IMEI, "2025-01", [make_row(2, base + timedelta(minutes=1)), make_row(3, base + timedelta(minutes=2))])
+
+        locations = archive.read(IMEI, datetime(2025, 1, 1), datetime(2025, 2, 1))
+        assert [location["id"] for location in locations] == [1, 2, 3]
+        assert locations[0]["timestamp"] == "2025-01-10 12:00:00.000"
+        assert locations[0]["battery"] == 80
+
+        assert archive.read(IMEI, base + timedelta(seconds=30), base + timedelta(minutes=2))[0]["id"] == 2
+        archive.remove_device(IMEI)
+        assert archive.read(IMEI, datetime(2025, 1, 1), datetime(2025, 2, 1)) == []
+
+    def test_read_stops_at_limit_and_window(self, tmp_path, monkeypatch):
+        """Test reads go batch by batch through a partition and return the oldest fixes up to the limit."""
+        monkeypatch.setattr(location_archive, "ARCHIVE_BATCH_ROWS", 2)
+        archive = LocationArchive(str(tmp_path))
+        base = datetime(2025, 1, 10, 12, 0, 0)
+        archive.write_partition(IMEI, "2025-01", [make_row(index, base + timedelta(minutes=index)) for index in range(7)])
+
+        assert [location["id"] for location in archive.read(IMEI, base, base + timedelta(days=1), limit=3)] == [0, 1, 2]
+        assert [location["id"] for location in archive.read(IMEI, base + timedelta(minutes=3), base + timedelta(minutes=5))] == [3, 4]
+
+    def test_archiver_moves_file_database_fixes(self, tmp_path):
+        """Test the archiver queries a database file on its own connection, off the event loop."""
+        db_manager = DatabaseManager(logging.getLogger(__name__), str(tmp_path / "archive.db"))
+        conn = db_manager.get_connection()
+        conn.execute("INSERT INTO users (uuid, email, password_hash, nickname) VALUES ('user-1', 'one@example.com', 'hash', 'One')")
+        conn.execute("INSERT INTO devices (imei, owner_uuid, name) VALUES (?, 'user-1', 'Rex')", (IMEI,))
+        old = datetime(2025, 1, 10, 12, 0, 0)
+        conn.executemany("INSERT INTO device_locations (device_id, latitude, longitude, timestamp) VALUES (1, ?, 10.0, ?)",
+                         [(59.0 + index * 0.001, to_epoch_ms(old + timedelta(minutes=index))) for index in range(3)])
+        conn.commit()
+        archiver = LocationArchiver(LocationArchive(str(tmp_path / "archive")), db_manager, logging.getLogger(__name__),
+                                    timedelta(days=30))
+
+        async def run():
+            try:
+                return await archiver.run_once(old + timedelta(days=60))
+            finally:
+                await archiver.stop()
+        # The latest fix stays behind as the device's current location
+        assert asyncio.run(run()) == 2
+        assert conn.execute("SELECT COUNT(*) FROM device_locations").fetchone()[0] == 1
+        assert [location["latitude"] for location in archiver.archive.read(IMEI, old, old + timedelta(days=1))] == [59.0, 59.001]
+
+    @pytest.mark.timeout(10)
+    def test_history_reads_archived_and_recent_fixes(self, test_client: TestClient, test_user_token: str):
+        """Test archiving moves old fixes out of SQLite while the history endpoint still returns them."""
+        headers = {"Authorization": f"Bearer {test_user_token}"}
+        assert test_client.post("/devices", json=TestDataFixtures.device_data(imei=IMEI), headers=headers).status_code == 200
+
+        old = datetime.now() - timedelta(days=200)
+
+        async def insert_old_fixes():
+            with main.db_manager.get_connection() as conn:
+                conn.executemany(f"INSERT INTO device_locations (device_id, latitude, longitude, timestamp) VALUES ({DEVICE_KEY}, ?, ?, ?)",
+                                 [(IMEI, 59.0 + index * 0.001, 10.0, to_epoch_ms(old + timedelta(minutes=index))) for index in range(3)])
+                conn.commit()
+
+        async def count_rows():
+            with main.db_manager.get_connection() as conn:
+                return conn.execute(f"SELECT COUNT(*) FROM device_locations WHERE device_id = {DEVICE_KEY}", (IMEI,)).fetchone()[0]
+
+        test_client.portal.call(insert_old_fixes)
+        with test_client.websocket_connect(f"/ws?token={test_user_token}") as ws:
+            ws.send_json({"type": "device_location", "data": TestDataFixtures.location_update_data(imei=IMEI)})
+        assert test_client.portal.call(count_rows) == 4
+
+        assert test_client.portal.call(main.location_archiver.run_once) == 3
+        assert test_client.portal.call(count_rows) == 1
+        assert os.listdir(main.location_archive.device_path(IMEI))
+
+        response = test_client.get(f"/devices/{IMEI}/locations", headers=headers,
+                                      params={"start": (old - timedelta(days=1)).isoformat()})
+        assert response.status_code == 200
+        history = response.json()
+        assert [location["latitude"] for location in history] == [59.0, 59.001, 59.002, 59.9139]
+        assert "id" not in history[0]
+
+        recent = test_client.get(f"/devices/{IMEI}/locations", headers=headers).json()
+        assert [location["latitude"] for location in recent] == [59.9139]
+
+    def test_latest_fix_is_never_archived(self, test_client: TestClient, test_user_token: str):
+        """Test a device that stopped reporting long ago keeps its last location in SQLite."""
+        headers = {"Authorization": f"Bearer {test_user_token}"}
+        assert test_client.post("/devices", json=TestDataFixtures.device_data(imei=IMEI), headers=headers).status_code == 200
+
+        async def insert_old_fix():
+            with main.db_manager.get_connection() as conn:
+                conn.execute(f"INSERT INTO device_locations (device_id, latitude, longitude, timestamp) VALUES ({DEVICE_KEY}, ?, ?, ?)",
+                             (IMEI, 59.0, 10.0, to_epoch_ms(datetime.now() - timedelta(days=400))))
+                conn.commit()
+
+        test_client.portal.call(insert_old_fix)
+        assert test_client.portal.call(main.location_archiver.run_once) == 0
+
+    def test_history_requires_access(self, test_client: TestClient, test_user_token: str):
+        """Test history of devices the user cannot see is not found."""
+        headers = {"Authorization": f"Bearer {test_user_token}"}
+        assert test_client.get("/devices/000000000000000/locations", headers=headers).status_code == 404
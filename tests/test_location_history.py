@@ -0,0 +1,130 @@
+"""
+Tests for the user track history, its downsampling and replays of a walk.
+"""
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+import main
+from location_history import TrackDownsampler, merge_tracks, replay
+from main import USER_LOCATION_HISTORY_ENV_VAR
+from tests.utils.fixtures import TestDataFixtures
+
+IMEI = "555666777888999"
+START = datetime(2025, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def test_client(temp_db, monkeypatch):
+    """Override of the shared client with user location history enabled."""
+    monkeypatch.setenv(USER_LOCATION_HISTORY_ENV_VAR, "1")
+    with TestClient(main.app) as client:
+        yield client
+
+
+def fix(timestamp_ms: int, timestamp: str, latitude: float = 60.0) -> dict:
+    return {"latitude": latitude, "longitude": 10.0, "timestamp": timestamp, "timestamp_ms": timestamp_ms}
+
+def receive_until(websocket, message_type: str) -> dict:
+    while True:
+        message = websocket.receive_json()
+        if message["type"] == message_type:
+            return message
+
+
+class TestTrackDownsampler:
+    """Test which fixes of a track are kept."""
+
+    def test_keeps_fixes_far_enough_in_time_or_distance(self):
+        """Test a fix is kept after the minimum interval or distance, and dropped otherwise."""
+        downsampler = TrackDownsampler(min_interval_seconds=15, min_distance_m=20)
+        assert downsampler.keep("user-1", 60.0, 10.0, START)
+        assert not downsampler.keep("user-1", 60.0001, 10.0, START + timedelta(seconds=5))
+        assert downsampler.keep("user-1", 60.0001, 10.0, START + timedelta(seconds=15))
+        # About 22 m north
+        assert downsampler.keep("user-1", 60.0003, 10.0, START + timedelta(seconds=16))
+        assert downsampler.keep("user-2", 60.0003, 10.0, START + timedelta(seconds=16))
+
+    def test_drops_fixes_without_position_or_out_of_order(self):
+        """Test fixes that cannot extend the track are never kept."""
+        downsampler = TrackDownsampler()
+        assert not downsampler.keep("user-1", None, 10.0, START)
+        assert downsampler.keep("user-1", 60.0, 10.0, START)
+        assert not downsampler.keep("user-1", 61.0, 10.0, START - timedelta(minutes=1))
+        downsampler.forget("user-1")
+        assert downsampler.keep("user-1", 61.0, 10.0, START - timedelta(minutes=1))
+
+
+class TestReplay:
+    """Test merging tracks and replaying them in accelerated time."""
+
+    def test_replay_is_accelerated_with_capped_gaps(self, monkeypatch):
+        """Test fixes of both tracks are sent in time order, waiting the scaled gap up to the cap."""
+        # Around the clocks going back at 03:00 CEST: the device's 02:15 CET comes after the user's 02:45 CEST
+        at = 1761438600000  # 2025-10-26 02:30 CEST
+        timeline = merge_tracks({
+            "user": [fix(at, "2025-10-26 02:30:00.000"), fix(at + 15 * 60 * 1000, "2025-10-26 02:45:00.000")],
+            "device": [fix(at + 45 * 60 * 1000, "2025-10-26 02:15:00.000", 61.0)],
+        })
+        assert [(track, location["timestamp"][11:16]) for track, location in timeline] == [
+            ("user", "02:30"), ("user", "02:45"), ("device", "02:15")]
+
+        delays, sent = [], []
+
+        async def record_sleep(seconds):
+            delays.append(seconds)
+
+        async def send(track, location):
+            sent.append(track)
+
+        monkeypatch.setattr(asyncio, "sleep", record_sleep)
+        assert asyncio.run(replay(timeline, 10, send, max_gap_seconds=2)) == 3
+        assert sent == ["user", "user", "device"]
+        assert delays == [2, 2]
+
+        delays.clear()
+        timeline = merge_tracks({"user": [fix(at, ""), fix(at + 5000, "")], "device": [fix(at + 15000, "")]})
+        asyncio.run(replay(timeline, 10, send, max_gap_seconds=2))
+        assert delays == [0.5, 1.0]
+
+
+class TestUserLocationHistory:
+    """Test recording, querying and replaying the user track."""
+
+    @pytest.mark.timeout(10)
+    def test_history_is_downsampled_and_replayed_with_the_device(self, test_client: TestClient, test_user_token: str):
+        """Test phone fixes are recorded when far enough apart and replay next to the dog's fixes."""
+        headers = {"Authorization": f"Bearer {test_user_token}"}
+        assert test_client.post("/devices", json=TestDataFixtures.device_data(imei=IMEI), headers=headers).status_code == 200
+
+        with test_client.websocket_connect(f"/ws?token={test_user_token}") as websocket:
+            for _ in range(2):
+                websocket.send_json({"type": "user_location", "data": TestDataFixtures.location_update_data()})
+            websocket.send_json({"type": "device_location", "data": TestDataFixtures.location_update_data(latitude=59.92, imei=IMEI)})
+        # A request after the messages, so they have been handled
+        history = test_client.get("/users/me/locations", headers=headers)
+        assert history.status_code == 200
+        assert [location["latitude"] for location in history.json()] == [59.9139]
+        assert len(history.json()[0]["timestamp"]) == len("2025-01-01 12:00:00.000")
+        assert "timestamp_ms" not in history.json()[0]
+
+        with test_client.websocket_connect(f"/ws?token={test_user_token}") as websocket:
+            websocket.send_json({"type": "replay", "data": {"device_id": "000000000000000"}})
+            assert receive_until(websocket, "replay_error")["data"]["detail"] == "Device not found"
+            websocket.send_json({"type": "replay", "data": {"device_id": IMEI, "speed": 0}})
+            assert "speed" in receive_until(websocket, "replay_error")["data"]["detail"]
+
+            websocket.send_json({"type": "replay", "data": {"device_id": IMEI, "speed": 1000}})
+            assert receive_until(websocket, "replay_start")["data"]["fixes"] == 2
+            locations = [websocket.receive_json() for _ in range(2)]
+            assert [(location["data"]["track"], location["data"]["latitude"]) for location in locations] == [
+                ("user", 59.9139), ("device", 59.92)]
+            assert locations[1]["data"]["device_id"] == IMEI
+            assert "timestamp_ms" not in locations[1]["data"]
+            assert websocket.receive_json() == {"type": "replay_end", "data": {"fixes": 2}}
+
+    def test_history_requires_it_to_be_enabled(self, test_client: TestClient, test_user_token: str, monkeypatch):
+        """Test the track endpoint is not found when history is not recorded."""
+        monkeypatch.setattr(main, "user_track_downsampler", None)
+        response = test_client.get("/users/me/locations", headers={"Authorization": f"Bearer {test_user_token}"})
+        assert response.status_code == 404
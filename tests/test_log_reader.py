@@ -0,0 +1,106 @@
+"""
+Tests for reading, filtering and following the server log.
+"""
+import json
+import os
+from fastapi.testclient import TestClient
+import main
+from log_reader import LineFilter, LogFollower, rotated_log_paths, tail_lines, read_lines_from_offset
+
+
+def json_line(level: str, message: str) -> str:
+    return json.dumps({"timestamp": "2025-01-01T00:00:00+00:00", "level": level, "logger": "main", "message": message})
+
+def write_lines(path, lines):
+    with open(path, "a") as file:
+        file.write("".join(line + "\n" for line in lines))
+
+
+class TestLogReader:
+    """Test log reading functionality."""
+
+    def test_tail_returns_last_lines_across_rotated_files(self, tmp_path):
+        """Test tail reads from the end and continues into the rotated backup."""
+        path = str(tmp_path / "test.log")
+        write_lines(path + ".1", [json_line("INFO", f"old {i}") for i in range(3)])
+        write_lines(path, [json_line("INFO", f"new {i}") for i in range(2)])
+
+        lines = tail_lines(rotated_log_paths(path, 3), 4, LineFilter())
+        assert [json.loads(line)["message"] for line in lines] == ["old 1", "old 2", "new 0", "new 1"]
+
+    def test_tail_filters_by_level_and_substring(self, tmp_path):
+        """Test filtering by minimum level and substring, for JSON and plain text lines."""
+        path = str(tmp_path / "test.log")
+        write_lines(path, [
+            "2025-01-01 00:00:00,000: main (ERROR) legacy device failure",
+            json_line("INFO", "device updated"),
+            json_line("INFO", "device retried after \"level\": \"ERROR\" (ERROR)"),
+            json_line("WARNING", "device missing"),
+            json_line("ERROR", "user failure"),
+        ])
+
+        lines = tail_lines([path], 10, LineFilter("warning", "device"))
+        assert len(lines) == 2
+        assert "legacy device failure" in lines[0]
+        assert json.loads(lines[1])["message"] == "device missing"
+
+    def test_read_from_offset_returns_complete_lines(self, tmp_path):
+        """Test offset reads stop at the last complete line."""
+        path = str(tmp_path / "test.log")
+        write_lines(path, ["first", "second"])
+        with open(path, "a") as file:
+            file.write("partial")
+
+        lines, next_offset = read_lines_from_offset(path, 0, 1024)
+        assert lines == ["first", "second"]
+        assert next_offset == len("first\nsecond\n")
+
+        lines, next_offset = read_lines_from_offset(path, 0, 8)
+        assert lines == ["first"]
+        assert next_offset == len("first\n")
+
+    def test_follower_follows_rotation(self, tmp_path):
+        """Test the follower returns new lines, including those written just before a rotation."""
+        path = str(tmp_path / "test.log")
+        write_lines(path, ["before"])
+        follower = LogFollower(path)
+        assert follower.read_new_lines() == []
+
+        write_lines(path, ["one"])
+        assert follower.read_new_lines() == ["one"]
+
+        write_lines(path, ["two"])
+        os.rename(path, path + ".1")
+        write_lines(path, ["three"])
+        assert follower.read_new_lines() == ["two", "three"]
+
+    def test_admin_logs_tail(self, test_client: TestClient, admin_token: str):
+        """Test the admin endpoint returns at most the requested number of lines and an offset."""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        response = test_client.get("/admin/logs?tail=2", headers=headers)
+
+        assert response.status_code == 200
+        assert len(response.text.strip().split("\n")) <= 2
+        assert int(response.headers["X-Log-Offset"]) > 0
+
+        response = test_client.get("/admin/logs?tail=2&level=bogus", headers=headers)
+        assert response.status_code == 400
+
+    def test_admin_logs_filter_without_tail(self, test_client: TestClient, admin_token: str, tmp_path, monkeypatch):
+        """Test filtering alone returns every matching line, and a missing log file is not an error."""
+        headers = {"Authorization": f"Bearer {admin_token}"}
+        path = str(tmp_path / "backend.log")
+        monkeypatch.setattr(main, "LOG_FILE_PATH", path)
+        write_lines(path, [json_line("ERROR" if i % 2 else "INFO", f"e{i}") for i in range(10)])
+
+        response = test_client.get("/admin/logs?level=error", headers=headers)
+        assert response.status_code == 200
+        assert [json.loads(line)["message"] for line in response.text.split("\n") if line] == ["e1", "e3", "e5", "e7", "e9"]
+        assert test_client.get("/admin/logs?tail=0&level=error", headers=headers).text == ""
+
+        monkeypatch.setattr(main, "LOG_FILE_PATH", str(tmp_path / "missing.log"))
+        response = test_client.get("/admin/logs?contains=e1", headers=headers)
+        assert (response.status_code, response.text, response.headers["X-Log-Offset"]) == (200, "", "0")
+        response = test_client.get("/admin/logs?offset=10", headers=headers)
+        assert (response.status_code, response.headers["X-Log-Offset"]) == (200, "10")
+        assert test_client.get("/admin/logs", headers=headers).status_code == 404
@@ -0,0 +1,74 @@
+"""
+Tests for the queue based, structured logging pipeline.
+"""
+import json
+import logging
+import time
+from logging_pipeline import JsonFormatter, CallSiteRateLimitFilter, LoggingPipeline, parse_log_levels
+
+
+def make_record(message: str, level: int = logging.INFO, lineno: int = 1, **extra) -> logging.LogRecord:
+    record = logging.LogRecord('test', level, 'test.py', lineno, message, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestLoggingPipeline:
+    """Test logging pipeline functionality."""
+
+    def test_json_formatter_includes_extra_fields(self):
+        """Test records are formatted as JSON with any extra fields."""
+        entry = json.loads(JsonFormatter().format(make_record("Updated location", device_id="123")))
+
+        assert entry["level"] == "INFO"
+        assert entry["logger"] == "test"
+        assert entry["message"] == "Updated location"
+        assert entry["device_id"] == "123"
+
+    def test_rate_limit_filter_limits_per_call_site(self):
+        """Test a noisy call site is throttled without affecting other call sites or warnings."""
+        rate_limit_filter = CallSiteRateLimitFilter(burst=3, interval=60)
+
+        passed = [rate_limit_filter.filter(make_record("noisy", lineno=1)) for _ in range(5)]
+        assert passed == [True, True, True, False, False]
+        assert rate_limit_filter.filter(make_record("other", lineno=2))
+        assert rate_limit_filter.filter(make_record("warning", level=logging.WARNING, lineno=1))
+
+    def test_rate_limit_filter_reports_suppressed_records(self):
+        """Test the first record of a new window carries the number of dropped records."""
+        rate_limit_filter = CallSiteRateLimitFilter(burst=1, interval=0.05)
+        for _ in range(3):
+            rate_limit_filter.filter(make_record("noisy"))
+
+        time.sleep(0.06)
+        record = make_record("noisy")
+        assert rate_limit_filter.filter(record)
+        assert record.suppressed == 2
+
+    def test_pipeline_writes_on_listener_thread(self):
+        """Test records reach the handlers through the queue."""
+        records = []
+
+        class ListHandler(logging.Handler):
+            def emit(self, record):
+                records.append(record)
+
+        logger = logging.getLogger("test_pipeline")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        pipeline = LoggingPipeline([ListHandler()])
+        pipeline.install(logger)
+        pipeline.stop()
+        pipeline.start()
+
+        logger.info("hello")
+        pipeline.stop()
+        # Again at exit
+        pipeline.stop()
+
+        assert [record.getMessage() for record in records] == ["hello"]
+
+    def test_parse_log_levels(self):
+        """Test per subsystem levels are parsed and invalid entries ignored."""
+        levels = parse_log_levels("main=debug, mqtt_handler=WARNING,bogus,other=NOPE")
+        assert levels == {"main": logging.DEBUG, "mqtt_handler": logging.WARNING}
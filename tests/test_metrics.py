@@ -0,0 +1,68 @@
+"""
+Tests for the metrics registry and the /metrics endpoint.
+"""
+import pytest
+from fastapi.testclient import TestClient
+from metrics import Registry, Counter, Gauge, Histogram, _Metric
+from tests.utils.fixtures import TestDataFixtures
+
+
+class TestMetrics:
+    """Test metrics functionality."""
+
+    def test_registry_renders_prometheus_text(self):
+        """Test counters, gauges and histograms render in the exposition format."""
+        registry = Registry()
+        counter = Counter('test_total', 'A counter', ['type'], registry=registry)
+        gauge = Gauge('test_gauge', 'A gauge', registry=registry)
+        histogram = Histogram('test_seconds', 'A histogram', buckets=(0.1, 1), registry=registry)
+
+        counter.labels('a').inc()
+        counter.labels('a').inc(2)
+        gauge.set_function(lambda: 7)
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        text = registry.render()
+        assert '# TYPE test_total counter' in text
+        assert 'test_total{type="a"} 3.0' in text
+        assert 'test_gauge 7' in text
+        assert 'test_seconds_bucket{le="0.1"} 1' in text
+        assert 'test_seconds_bucket{le="1"} 2' in text
+        assert 'test_seconds_bucket{le="+Inf"} 3' in text
+        assert 'test_seconds_count 3' in text
+
+    def test_wrong_label_count_fails(self):
+        """Test using the wrong number of labels is rejected."""
+        counter = Counter('test_labels_total', 'A counter', ['type'], registry=Registry())
+        with pytest.raises(ValueError):
+            counter.labels('a', 'b')
+
+    def test_metric_type_must_create_children(self):
+        """Test a metric type without _new_child cannot be created."""
+        class Incomplete(_Metric):
+            type = 'untyped'
+
+        with pytest.raises(TypeError):
+            Incomplete('test_incomplete', 'A metric', registry=Registry())
+
+    @pytest.mark.timeout(5)
+    def test_metrics_endpoint_reports_hot_paths(self, test_client: TestClient, test_user_token: str):
+        """Test REST, database and WebSocket activity shows up on /metrics."""
+        headers = {"Authorization": f"Bearer {test_user_token}"}
+        device_data = TestDataFixtures.device_data(imei="111222333444555")
+        assert test_client.post("/devices", json=device_data, headers=headers).status_code == 200
+
+        with test_client.websocket_connect(f'/ws?token={test_user_token}') as ws:
+            ws.receive_json()
+            location_data = TestDataFixtures.location_update_data(imei=device_data["imei"])
+            ws.send_json({"type": "device_location", "data": location_data})
+            response = test_client.get("/metrics")
+
+        assert response.status_code == 200
+        text = response.text
+        assert 'dogtracker_http_request_seconds_count{method="POST",route="/devices",status="200"}' in text
+        assert 'dogtracker_db_query_seconds_count{query="get_last_device_locations"}' in text
+        assert 'dogtracker_websocket_messages_sent_total{type="device_locations"}' in text
+        assert 'dogtracker_websocket_active_sessions 1' in text
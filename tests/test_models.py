@@ -0,0 +1,50 @@
+"""
+Tests for the slotted domain models and their serialization.
+"""
+import json
+import sys
+from dataclasses import asdict
+import pytest
+from models import DeviceLocation, Group, footprint, to_json
+from queries import compile_constructor
+from repository import DEVICE_LOCATION_FIELDS
+
+ROW = ('359000000000001', 'user-1', 'one@example.com', 'One', 'Rex', 59.912345, 10.754321, 12.5, 1.25, 80, 3900,
+       0, 9, -85, None, 'lte', '2024-05-01T12:00:00Z', '2024-05-01 12:00:01.123456')
+
+
+class TestModels:
+    """Test the domain models."""
+
+    def test_to_dict_matches_asdict(self):
+        """Test the generated to_dict gives the fields in order, like dataclasses.asdict."""
+        location = DeviceLocation(*ROW, type='own')
+        assert location.to_dict() == asdict(location)
+        assert list(location.to_dict()) == DEVICE_LOCATION_FIELDS + ['type']
+        assert not hasattr(location, '__dict__')
+
+    def test_messages_with_models_serialize(self):
+        """Test json.dumps serializes models nested in a message and still rejects other objects."""
+        group = Group('group-1', 'Walkers', None, 'user-1', '2024-05-01 12:00:00', ['user-1'])
+        message = {"type": "device_locations", "data": [DeviceLocation(*ROW, type='shared')], "groups": [group]}
+        decoded = json.loads(json.dumps(message, default=to_json))
+        assert decoded["data"][0] == dict(zip(DEVICE_LOCATION_FIELDS, ROW), type='shared')
+        assert decoded["groups"][0]["member_ids"] == ['user-1']
+        with pytest.raises(TypeError):
+            json.dumps({"data": object()}, default=to_json)
+
+    def test_location_footprint(self):
+        """Test a location's own storage, besides its values, is under half that of the equivalent dict."""
+        location = DeviceLocation(*ROW, type='own')
+        as_dict = location.to_dict()
+        assert sys.getsizeof(location) < sys.getsizeof(as_dict) / 2
+        assert footprint(as_dict) - footprint(location) == sys.getsizeof(as_dict) - sys.getsizeof(location)
+
+    def test_constructor_checks_fields(self):
+        """Test rows are only passed positionally to models whose fields they line up with."""
+        project = compile_constructor(DeviceLocation, DEVICE_LOCATION_FIELDS, type='own')
+        assert project(ROW) == DeviceLocation(*ROW, type='own')
+        with pytest.raises(ValueError):
+            compile_constructor(DeviceLocation, DEVICE_LOCATION_FIELDS[1:])
+        with pytest.raises(ValueError):
+            compile_constructor(DeviceLocation, DEVICE_LOCATION_FIELDS, kind='own')
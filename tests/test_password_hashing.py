@@ -0,0 +1,56 @@
+"""
+Tests for password hashing and transparent rehashing of legacy hashes.
+"""
+import hashlib
+import main
+from fastapi.testclient import TestClient
+from password_hashing import hash_password, verify_password, is_legacy_hash
+from tests.utils.fixtures import TestDataFixtures
+
+
+# The database connection belongs to the app's event loop thread, these run there via the test client portal
+async def set_password_hash(email: str, password_hash: str):
+    with main.db_manager.get_connection() as conn:
+        conn.execute('UPDATE users SET password_hash = ? WHERE email = ?', (password_hash, email))
+
+async def get_password_hash(email: str) -> str:
+    with main.db_manager.get_connection() as conn:
+        return conn.execute('SELECT password_hash FROM users WHERE email = ?', (email,)).fetchone()[0]
+
+
+class TestPasswordHashing:
+    """Test password hashing functionality."""
+
+    def test_hash_and_verify(self):
+        """Test a bcrypt hash verifies only the right password."""
+        password_hash = hash_password("testpass123", rounds=4)
+
+        assert password_hash.startswith("$2")
+        assert not is_legacy_hash(password_hash)
+        assert verify_password("testpass123", password_hash)
+        assert not verify_password("wrongpassword", password_hash)
+
+    def test_verify_legacy_hash(self):
+        """Test unsalted SHA-256 hashes from older databases still verify."""
+        legacy_hash = hashlib.sha256("testpass123".encode()).hexdigest()
+
+        assert is_legacy_hash(legacy_hash)
+        assert verify_password("testpass123", legacy_hash)
+        assert not verify_password("wrongpassword", legacy_hash)
+
+    def test_signin_rehashes_legacy_password(self, test_client: TestClient):
+        """Test signing in with a legacy hash replaces it with a bcrypt hash."""
+        user_data = TestDataFixtures.user_signup_data(email="legacy@example.com")
+        assert test_client.post("/signup", json=user_data).status_code == 200
+
+        legacy_hash = hashlib.sha256(user_data["password"].encode()).hexdigest()
+        test_client.portal.call(set_password_hash, user_data["email"], legacy_hash)
+
+        signin_data = TestDataFixtures.user_signin_data(email=user_data["email"], password=user_data["password"])
+        response = test_client.post("/signin", json=signin_data)
+        assert response.status_code == 200
+
+        assert test_client.portal.call(get_password_hash, user_data["email"]).startswith("$2")
+
+        response = test_client.post("/signin", json=signin_data)
+        assert response.status_code == 200
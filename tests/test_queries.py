@@ -0,0 +1,40 @@
+"""
+Tests for the statement registry and compiled row projections.
+"""
+import logging
+import pytest
+import repository
+from database_manager import DatabaseManager
+from queries import STATEMENTS, compile_projection, register
+
+
+class TestQueries:
+    """Test named statements and row projections."""
+
+    def test_projection_matches_zipping_fields(self):
+        """Test a compiled projection gives the same dict as zipping the fields, plus its constants."""
+        fields = repository.DEVICE_LOCATION_FIELDS
+        row = tuple(range(len(fields)))
+        assert compile_projection(fields)(row) == dict(zip(fields, row))
+        assert compile_projection(fields, type="own")(row) == {**dict(zip(fields, row)), "type": "own"}
+        assert list(compile_projection(fields, type="own")(row)) == fields + ["type"]
+        assert compile_projection(["uuid"])(("u1",)) == {"uuid": "u1"}
+        assert repository.device_location_from_row(row, "shared").type == "shared"
+
+    def test_projection_rejects_non_identifier_fields(self):
+        """Test field names are checked before they are compiled into code."""
+        with pytest.raises(ValueError):
+            compile_projection(["uuid", "x): pass\nimport os; ("])
+
+    def test_names_are_unique(self):
+        """Test a statement name cannot be registered twice."""
+        with pytest.raises(ValueError):
+            register("get_devices", "SELECT 1")
+
+    def test_registered_statements_prepare(self):
+        """Test every registered statement compiles against the schema, with one field per result column."""
+        conn = DatabaseManager(logging.getLogger(__name__), ":memory:").get_connection()
+        for statement in STATEMENTS.values():
+            cursor = conn.execute(statement.sql, (0,) * statement.sql.count("?"))
+            if statement.fields is not None:
+                assert len(cursor.description) == len(statement.fields), statement.name
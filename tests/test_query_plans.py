@@ -0,0 +1,85 @@
+"""
+Query plan regression tests for the hot queries, on a database the size of the load benchmark's small preset.
+The latency budgets depend on the machine, so they run only when QUERY_LATENCY_TESTS is set, e.g. on the perf runner.
+"""
+import asyncio
+import logging
+import os
+import statistics
+import time
+import pytest
+import main
+from benchmarks import load_benchmark
+from database_manager import DatabaseManager
+from query_profiler import QueryProfiler
+from repository import SQLiteRepository
+
+QUERY_LATENCY_TESTS_ENV_VAR = 'QUERY_LATENCY_TESTS'
+LOGGER = logging.getLogger(__name__)
+USER = load_benchmark.user_id(0)
+# Device 0 is among the shared ones
+SHARED_DEVICE = load_benchmark.device_imei(0)
+
+HOT_QUERIES = {
+    'get_friend_locations': lambda repository: main.get_friend_locations(USER),
+    'get_owned_device_locations': lambda repository: main.get_owned_device_locations(USER),
+    'get_last_device_locations': lambda repository: main.get_last_device_locations(USER),
+    'broadcast_to_shared_users': lambda repository: main.broadcast_to_shared_users(SHARED_DEVICE, {}),
+    'get_user_friends': lambda repository: main.connection_manager.get_user_friends(USER, repository),
+}
+# Median milliseconds; indexed they take well under one, a scan of the history takes hundreds
+LATENCY_BUDGET_MS = 20.0
+LATENCY_RUNS = 11
+
+
+@pytest.fixture(scope="module")
+def fixture_db(tmp_path_factory) -> str:
+    db_path = str(tmp_path_factory.mktemp("query_plans") / "fixture.db")
+    load_benchmark.ensure_seeded(db_path, load_benchmark.PRESETS['small'])
+    return db_path
+
+def run_hot_query(name: str, repository: SQLiteRepository, monkeypatch):
+    monkeypatch.setattr(main, "repository", repository)
+    return asyncio.run(HOT_QUERIES[name](repository))
+
+def full_scans(plan: str) -> list:
+    """Plan lines that read a whole table or index, or sort or group rows in a temporary b-tree."""
+    return [line.strip() for line in plan.splitlines()
+            if line.strip().startswith('SCAN ') or 'TEMP B-TREE FOR' in line]
+
+
+class TestQueryPlans:
+    """Test the hot queries stay index lookups and within their latency budgets."""
+
+    @pytest.mark.parametrize("name", list(HOT_QUERIES))
+    def test_hot_query_uses_indexes(self, name, fixture_db, monkeypatch):
+        """Test no statement run by a hot query scans a table."""
+        # Every statement counts as slow at 0 ms, so each has its plan recorded
+        quiet = logging.getLogger(f"{__name__}.plans")
+        quiet.disabled = True
+        profiler = QueryProfiler(quiet, slow_query_ms=0)
+        db_manager = DatabaseManager(LOGGER, fixture_db, profiler)
+        profiler.reset()
+
+        run_hot_query(name, SQLiteRepository(db_manager), monkeypatch)
+
+        statements = [entry for entry in profiler.summary(limit=1000) if entry["caller"].startswith("SQLiteRepository.")]
+        assert statements, f"{name} ran no queries"
+        for entry in statements:
+            assert entry["last_plan"], f"No plan for {entry['sql']}"
+            assert full_scans(entry["last_plan"]) == [], (
+                f"{entry['caller']} scans instead of using an index:\n{entry['sql']}\n{entry['last_plan']}")
+
+    @pytest.mark.skipif(not os.getenv(QUERY_LATENCY_TESTS_ENV_VAR), reason=f"{QUERY_LATENCY_TESTS_ENV_VAR} is not set")
+    @pytest.mark.parametrize("name", list(HOT_QUERIES))
+    def test_hot_query_latency_budget(self, name, fixture_db, monkeypatch):
+        """Test the median time of a hot query stays within its budget."""
+        repository = SQLiteRepository(DatabaseManager(LOGGER, fixture_db))
+        run_hot_query(name, repository, monkeypatch)
+
+        samples = []
+        for _ in range(LATENCY_RUNS):
+            started = time.perf_counter()
+            run_hot_query(name, repository, monkeypatch)
+            samples.append((time.perf_counter() - started) * 1000)
+        assert statistics.median(samples) < LATENCY_BUDGET_MS
@@ -0,0 +1,88 @@
+"""
+Tests for per statement query profiling and the slow query log.
+"""
+import asyncio
+import logging
+from fastapi.testclient import TestClient
+from database_manager import DatabaseManager
+from query_profiler import QueryProfiler
+from read_pool import ReadPool
+from repository import SQLiteRepository
+
+LOGGER = logging.getLogger(__name__)
+
+
+def find(profiler: QueryProfiler, caller: str, sql_start: str) -> dict:
+    matches = [entry for entry in profiler.summary(limit=1000)
+               if entry["caller"] == caller and entry["sql"].startswith(sql_start)]
+    assert matches, f"No statement of {caller} starting with {sql_start}"
+    return matches[0]
+
+
+class TestQueryProfiler:
+    """Test query timing, caller attribution and the slow query log."""
+
+    def test_statements_are_filed_under_the_calling_function(self):
+        """Test statements run through cursors and the connection shortcuts are counted per caller."""
+        profiler = QueryProfiler(LOGGER)
+        db_manager = DatabaseManager(LOGGER, ":memory:", profiler)
+        repository = SQLiteRepository(db_manager)
+
+        async def scenario():
+            await repository.add_device("111", "user-1", "Rex")
+            await repository.get_devices("user-1")
+            await repository.get_devices("user-1")
+
+        asyncio.run(scenario())
+        assert find(profiler, "SQLiteRepository.add_device", "INSERT INTO devices")["count"] == 1
+        stats = find(profiler, "SQLiteRepository.get_devices", "SELECT imei, name")
+        assert stats["count"] == 2
+        assert stats["slow_count"] == 0
+        assert stats["total_ms"] >= stats["max_ms"] > 0
+
+    def test_slow_queries_are_logged_with_their_plan(self, caplog):
+        """Test a statement over the threshold is logged once with its query plan."""
+        profiler = QueryProfiler(LOGGER, slow_query_ms=0)
+        conn = DatabaseManager(LOGGER, ":memory:", profiler).get_connection()
+
+        caplog.clear()
+        with caplog.at_level(logging.WARNING, logger=__name__):
+            conn.execute("SELECT device_id FROM device_locations WHERE device_id = ?", ("111",)).fetchall()
+
+        stats = find(profiler, "TestQueryProfiler.test_slow_queries_are_logged_with_their_plan", "SELECT device_id")
+        assert stats["slow_count"] == 1
+        assert "device_locations" in stats["last_plan"]
+        slow_logs = [record for record in caplog.records if record.getMessage().startswith("Slow query")]
+        assert len(slow_logs) == 1
+        assert "Query plan:" in slow_logs[0].getMessage()
+
+    def test_pool_reads_are_filed_under_the_repository_method(self, tmp_path):
+        """Test reads run on the read pool's threads keep the name of the method that asked for them."""
+        profiler = QueryProfiler(LOGGER)
+        db_manager = DatabaseManager(LOGGER, str(tmp_path / "primary.db"), profiler)
+        repository = SQLiteRepository(db_manager, ReadPool(db_manager.db_path, LOGGER, size=2, profiler=profiler))
+
+        async def scenario():
+            try:
+                await repository.get_user_groups("user-1")
+            finally:
+                await repository.read_pool.stop()
+
+        asyncio.run(scenario())
+        assert find(profiler, "SQLiteRepository.get_user_groups", "SELECT g.id")["count"] == 1
+
+    def test_admin_query_stats(self, test_client: TestClient, admin_token: str, test_user_token: str):
+        """Test admins can read and reset the statistics and others cannot."""
+        admin_headers = {"Authorization": f"Bearer {admin_token}"}
+        response = test_client.get("/admin/db/queries?sort=count&limit=5", headers=admin_headers)
+        assert response.status_code == 200
+        stats = response.json()
+        assert 0 < len(stats) <= 5
+        assert [entry["count"] for entry in stats] == sorted((entry["count"] for entry in stats), reverse=True)
+
+        assert test_client.get("/admin/db/queries?sort=bogus", headers=admin_headers).status_code == 400
+        assert test_client.get("/admin/db/queries", headers={"Authorization": f"Bearer {test_user_token}"}).status_code == 403
+
+        assert test_client.delete("/admin/db/queries", headers=admin_headers).status_code == 200
+        stats = test_client.get("/admin/db/queries", headers=admin_headers).json()
+        assert all(not entry["caller"].startswith("SQLiteRepository.add_") for entry in stats)
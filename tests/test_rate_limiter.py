@@ -0,0 +1,90 @@
+"""
+Tests for sign in/up rate limiting.
+"""
+import sqlite3
+import time
+import pytest
+from fastapi.testclient import TestClient
+import main
+from main import RATE_LIMIT_DB_PATH_ENV_VAR
+from rate_limiter import RateLimiter, RateLimiterBackend, InMemoryRateLimiterBackend, SQLiteRateLimiterBackend
+from tests.utils.fixtures import TestDataFixtures
+
+
+class TestRateLimiter:
+    """Test rate limiting functionality."""
+
+    def test_bucket_allows_burst_then_limits(self):
+        """Test a bucket allows its capacity and then asks the caller to wait."""
+        limiter = RateLimiter("test", capacity=3, per_minute=60, backend=InMemoryRateLimiterBackend())
+
+        assert [limiter.check("key") for _ in range(3)] == [0, 0, 0]
+        retry_after = limiter.check("key")
+        assert 0 < retry_after <= 1
+        assert limiter.check("other_key") == 0
+
+    def test_shared_backend_is_shared_between_limiters(self, tmp_path):
+        """Test limiters using the same SQLite file see each others requests."""
+        db_path = str(tmp_path / "rate_limits.db")
+        first = RateLimiter("test", capacity=2, per_minute=1, backend=SQLiteRateLimiterBackend(db_path))
+        second = RateLimiter("test", capacity=2, per_minute=1, backend=SQLiteRateLimiterBackend(db_path))
+
+        assert first.check("key") == 0
+        assert second.check("key") == 0
+        assert first.check("key") > 0
+        assert second.check("key") > 0
+
+    def test_shared_backend_prunes_full_buckets(self, tmp_path):
+        """Test buckets that have refilled are removed, so one-off keys do not pile up."""
+        backend = SQLiteRateLimiterBackend(str(tmp_path / "rate_limits.db"))
+        for index in range(3):
+            backend.take(f"ip:{index}", capacity=2, refill_per_second=1, now=1000.0)
+        backend.take("ip:busy", capacity=2, refill_per_second=1, now=1059.0)
+        backend.take("ip:busy", capacity=2, refill_per_second=1, now=1059.0)
+        assert len(backend) == 4
+
+        # Only the busy bucket is still short of its capacity once the prune runs
+        backend.take("ip:new", capacity=2, refill_per_second=1, now=1060.0)
+        assert len(backend) == 2
+
+    def test_shared_backend_fails_open_when_locked(self, tmp_path):
+        """Test a bucket file locked by another worker lets the request through instead of waiting."""
+        db_path = str(tmp_path / "rate_limits.db")
+        backend = SQLiteRateLimiterBackend(db_path)
+        other_worker = sqlite3.connect(db_path, isolation_level=None)
+        other_worker.execute("BEGIN IMMEDIATE")
+        try:
+            started = time.perf_counter()
+            assert backend.take("key", capacity=0, refill_per_second=1, now=1000.0) == 0
+            assert time.perf_counter() - started < 1
+        finally:
+            other_worker.execute("ROLLBACK")
+            other_worker.close()
+
+    def test_signin_is_rate_limited_per_email(self, test_client: TestClient):
+        """Test repeated sign in attempts for one email get 429 with Retry-After."""
+        signin_data = TestDataFixtures.user_signin_data(email="bruteforce@example.com", password="wrongpassword")
+
+        status_codes = [test_client.post("/signin", json=signin_data).status_code for _ in range(6)]
+        assert status_codes == [401] * 5 + [429]
+
+        response = test_client.post("/signin", json=signin_data)
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+
+    def test_shared_buckets_survive_restart(self, temp_db, tmp_path, monkeypatch):
+        """Test a worker starting up does not hand out a fresh burst from the shared buckets."""
+        monkeypatch.setenv(RATE_LIMIT_DB_PATH_ENV_VAR, str(tmp_path / "rate_limits.db"))
+        signin_data = TestDataFixtures.user_signin_data(email="restart@example.com", password="wrongpassword")
+        with TestClient(main.app) as client:
+            assert [client.post("/signin", json=signin_data).status_code for _ in range(6)] == [401] * 5 + [429]
+        with TestClient(main.app) as client:
+            assert client.post("/signin", json=signin_data).status_code == 429
+
+    def test_backend_must_implement_take(self):
+        """Test a backend without take cannot be created."""
+        class Incomplete(RateLimiterBackend):
+            pass
+
+        with pytest.raises(TypeError):
+            Incomplete()
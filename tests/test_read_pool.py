@@ -0,0 +1,100 @@
+"""
+Tests for routing reads to separate read connections and replicas.
+"""
+import asyncio
+import logging
+import shutil
+import time
+from datetime import datetime
+import pytest
+from fastapi.testclient import TestClient
+import main
+from database_manager import DatabaseManager
+from main import DB_PATH_ENV_VAR
+from read_pool import ReadPool, write_heartbeat
+from repository import SQLiteRepository
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch) -> str:
+    """Run the app on a database file, the read pool cannot share an in-memory database."""
+    db_path = str(tmp_path / "primary.db")
+    monkeypatch.setenv(DB_PATH_ENV_VAR, db_path)
+    return db_path
+
+def create_database(path: str) -> DatabaseManager:
+    db_manager = DatabaseManager(logging.getLogger(__name__), path)
+    conn = db_manager.get_connection()
+    conn.execute("INSERT INTO users (uuid, email, password_hash, nickname) VALUES ('user-1', 'one@example.com', 'hash', 'One')")
+    conn.execute("INSERT INTO devices (imei, owner_uuid, name) VALUES ('111', 'user-1', 'Rex')")
+    conn.commit()
+    return db_manager
+
+
+class TestReadPool:
+    """Test read connections and replica routing."""
+
+    def test_reads_see_primary_writes(self, tmp_path):
+        """Test reads on the pool see what the primary connection committed."""
+        db_manager = create_database(str(tmp_path / "primary.db"))
+        repository = SQLiteRepository(db_manager, ReadPool(db_manager.db_path, logging.getLogger(__name__), size=2))
+
+        async def scenario():
+            try:
+                assert [device["imei"] for device in await repository.get_devices("user-1")] == ["111"]
+                await repository.add_device("222", "user-1", "Fido")
+                await repository.insert_device_location("222", "user-1", {"latitude": 60.0, "longitude": 10.0}, datetime.now())
+                locations = await repository.get_owned_device_locations("user-1")
+                return sorted((location.device_id, location.latitude) for location in locations)
+            finally:
+                await repository.read_pool.stop()
+
+        assert asyncio.run(scenario()) == [("111", None), ("222", 60.0)]
+
+    def test_stale_replica_falls_back_to_primary(self, tmp_path):
+        """Test the replica serves reads only while its heartbeat is within the staleness tolerance."""
+        db_manager = create_database(str(tmp_path / "primary.db"))
+        replica_path = str(tmp_path / "replica.db")
+        write_heartbeat(db_manager.get_connection())
+        db_manager.get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        shutil.copy(db_manager.db_path, replica_path)
+        # Only the primary has this device, so it shows where a read was served from
+        db_manager.get_connection().execute("INSERT INTO devices (imei, owner_uuid, name) VALUES ('222', 'user-1', 'Fido')")
+        db_manager.get_connection().commit()
+
+        pool = ReadPool(db_manager.db_path, logging.getLogger(__name__), size=1, replica_path=replica_path,
+                        max_staleness_seconds=60, lag_check_seconds=0)
+
+        async def device_count():
+            rows = await pool.fetchall("SELECT imei FROM devices")
+            return len(rows)
+
+        async def scenario():
+            try:
+                fresh = await device_count()
+                pool.max_staleness_seconds = 0.1
+                time.sleep(0.2)
+                return fresh, await device_count()
+            finally:
+                await pool.stop()
+
+        assert asyncio.run(scenario()) == (1, 2)
+
+    def test_in_memory_database_is_rejected(self):
+        """Test a read pool cannot be created for an in-memory database."""
+        with pytest.raises(ValueError):
+            ReadPool(":memory:", logging.getLogger(__name__))
+
+    def test_endpoints_read_from_pool(self, test_client: TestClient, admin_token: str, test_user_token: str):
+        """Test listings are served through the read pool when the database is a file."""
+        assert main.read_pool is not None
+        headers = {"Authorization": f"Bearer {test_user_token}"}
+        assert test_client.post("/devices", json={"imei": "350000000000001", "name": "Rex"}, headers=headers).status_code == 200
+
+        response = test_client.get("/devices", headers=headers)
+        assert [device["imei"] for device in response.json()] == ["350000000000001"]
+
+        admin_headers = {"Authorization": f"Bearer {admin_token}"}
+        response = test_client.get("/admin/devices", headers=admin_headers)
+        assert [device["device_id"] for device in response.json()] == ["350000000000001"]
+        assert test_client.get("/admin/users?cursor=bogus", headers=admin_headers).status_code == 400
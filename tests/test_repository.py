@@ -0,0 +1,319 @@
+"""
+Contract tests run against every storage backend.
+The PostgreSQL backend is tested when asyncpg is installed and POSTGRES_TEST_DSN points to a scratch database.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+import sqlite3
+import pytest
+from database_manager import DatabaseManager, SCHEMA_VERSION
+from models import IngestResult, to_epoch_ms
+from repository import Repository, SQLiteRepository
+
+POSTGRES_TEST_DSN_ENV_VAR = 'POSTGRES_TEST_DSN'
+USERS = [("user-1", "one@example.com", "One"), ("user-2", "two@example.com", "Two"), ("user-3", "three@example.com", "Three")]
+START = datetime(2025, 1, 1, 12, 0, 0)
+
+
+async def open_sqlite():
+    db_manager = DatabaseManager(logging.getLogger(__name__), ':memory:')
+    conn = db_manager.get_connection()
+    conn.executemany("INSERT INTO users (uuid, email, password_hash, nickname) VALUES (?, ?, 'hash', ?)", USERS)
+    conn.commit()
+    return SQLiteRepository(db_manager), conn.close
+
+async def open_postgres():
+    pytest.importorskip("asyncpg")
+    dsn = os.getenv(POSTGRES_TEST_DSN_ENV_VAR)
+    if not dsn:
+        pytest.skip(f"{POSTGRES_TEST_DSN_ENV_VAR} is not set")
+    from postgres_repository import PostgresRepository
+    repository = await PostgresRepository.connect(dsn)
+    await repository.pool.execute('TRUNCATE users, user_locations, user_location_history, devices, device_locations, device_shares, '
+                                  'friends, groups, group_members CASCADE')
+    await repository.pool.executemany(
+        "INSERT INTO users (uuid, email, password_hash, nickname) VALUES ($1, $2, 'hash', $3)", USERS)
+    return repository, repository.close
+
+BACKENDS = {'sqlite': open_sqlite, 'postgres': open_postgres}
+
+# The location tables of schema version 0, keyed by text with datetime text timestamps
+VERSION_0_TABLES = [
+    "CREATE TABLE users (uuid TEXT PRIMARY KEY, email TEXT UNIQUE NOT NULL, password_hash TEXT NOT NULL, nickname TEXT NOT NULL, "
+    "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, last_seen TIMESTAMP, role TEXT NOT NULL DEFAULT 'U')",
+    "CREATE TABLE user_locations (uuid TEXT PRIMARY KEY, latitude REAL, longitude REAL, altitude REAL, speed REAL, "
+    "battery INTEGER, accuracy REAL, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)",
+    "CREATE TABLE devices (imei TEXT PRIMARY KEY, owner_uuid TEXT NOT NULL, name TEXT NOT NULL, "
+    "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, last_seen TIMESTAMP)",
+    "CREATE TABLE device_locations (id INTEGER PRIMARY KEY, device_id TEXT, latitude REAL, longitude REAL, altitude REAL, "
+    "speed REAL, battery INTEGER, battery_mv INTEGER, bark INTEGER, satellites INTEGER, lte_signal INTEGER, "
+    "lora_rssi INTEGER, connection_type TEXT, time TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)",
+    "CREATE INDEX idx_device_locations_device_timestamp ON device_locations (device_id, timestamp)",
+]
+
+
+@pytest.fixture(params=list(BACKENDS))
+def run(request):
+    """Run a scenario coroutine against a fresh repository of the backend."""
+    def runner(scenario):
+        async def main():
+            repository, close = await BACKENDS[request.param]()
+            try:
+                return await scenario(repository)
+            finally:
+                result = close()
+                if asyncio.iscoroutine(result):
+                    await result
+        return asyncio.run(main())
+    return runner
+
+def fix(latitude: float) -> dict:
+    return {'latitude': latitude, 'longitude': 10.0, 'speed': 1.5, 'battery': 80}
+
+
+class TestRepository:
+    """Test the repository contract on every backend."""
+
+    def test_friend_requests(self, run):
+        """Test a friend request is pending until accepted, then shares locations."""
+        async def scenario(repository):
+            await repository.add_friend_request("user-1", "user-2")
+            assert await repository.friendship_exists("user-2", "user-1")
+            friends = await repository.get_friends("user-2")
+            assert [(friend.uuid, friend.status) for friend in friends] == [("user-1", "pending")]
+
+            await repository.upsert_user_location("user-2", fix(60.0), START)
+            assert await repository.get_friend_locations("user-1") == []
+
+            assert await repository.accept_friend_request("user-1", "user-2")
+            locations = await repository.get_friend_locations("user-1")
+            assert [(location.uuid, location.latitude) for location in locations] == [("user-2", 60.0)]
+        run(scenario)
+
+    def test_latest_location_only_of_own_devices(self, run):
+        """Test users get the latest fix of their own devices only."""
+        async def scenario(repository):
+            await repository.add_device("111", "user-1", "Rex")
+            await repository.add_device("222", "user-2", "Fido")
+            await repository.add_device("333", "user-1", "Quiet")
+            for minute in range(3):
+                assert await repository.insert_device_location("111", "user-1", fix(60.0 + minute),
+                                                               START + timedelta(minutes=minute)) is IngestResult.STORED
+            assert await repository.insert_device_location("222", "user-2", fix(50.0), START) is IngestResult.STORED
+            assert await repository.insert_device_location("222", "user-1", fix(0.0), START) is IngestResult.UNKNOWN_DEVICE
+
+            locations = sorted(await repository.get_owned_device_locations("user-1"), key=lambda location: location.device_id)
+            assert [(location.device_id, location.latitude) for location in locations] == [("111", 62.0), ("333", None)]
+            assert (await repository.get_device_location("111")).latitude == 62.0
+        run(scenario)
+
+    def test_shared_devices(self, run):
+        """Test sharing a device makes it visible to the recipient until unshared."""
+        async def scenario(repository):
+            await repository.add_device("111", "user-1", "Rex")
+            await repository.insert_device_location("111", "user-1", fix(60.0), START)
+            assert not await repository.user_can_view_device("111", "user-2")
+
+            await repository.share_device("111", "user-1", "user-2")
+            assert await repository.user_can_view_device("111", "user-2")
+            assert await repository.get_device_share_recipients("111") == ["user-2"]
+            shared = await repository.get_shared_device_locations("user-2")
+            assert [(location.device_id, location.type) for location in shared] == [("111", "shared")]
+
+            assert await repository.unshare_device("111", "user-1", "user-2")
+            assert not await repository.user_can_view_device("111", "user-2")
+        run(scenario)
+
+    def test_location_history(self, run):
+        """Test history is bounded by the time range and limit, oldest first."""
+        async def scenario(repository):
+            await repository.add_device("111", "user-1", "Rex")
+            for minute in range(10):
+                await repository.insert_device_location("111", "user-1", fix(60.0 + minute), START + timedelta(minutes=minute))
+
+            history = await repository.get_device_location_history("111", START + timedelta(minutes=2), START + timedelta(minutes=8), 4)
+            assert [location['latitude'] for location in history] == [62.0, 63.0, 64.0, 65.0]
+            assert history[0]['timestamp'] == "2025-01-01 12:02:00.000"
+            assert history[0]['timestamp_ms'] == to_epoch_ms(START + timedelta(minutes=2))
+        run(scenario)
+
+    def test_user_location_history(self, run):
+        """Test a user's track is bounded by the time range, end exclusive and oldest first, with one fix per timestamp."""
+        async def scenario(repository):
+            for minute in range(5):
+                await repository.insert_user_location_history("user-1", fix(60.0 + minute), START + timedelta(minutes=minute))
+            await repository.insert_user_location_history("user-1", fix(70.0), START)
+
+            history = await repository.get_user_location_history("user-1", START, START + timedelta(minutes=3), 10)
+            assert [location['latitude'] for location in history] == [60.0, 61.0, 62.0]
+            assert history[0]['timestamp'] == "2025-01-01 12:00:00.000"
+            assert await repository.get_user_location_history("user-2", START, START + timedelta(minutes=3), 10) == []
+        run(scenario)
+
+    def test_resent_fixes_are_stored_once(self, run):
+        """Test a fix with the sequence number, or without one the full device time, of a stored fix is not stored again."""
+        async def scenario(repository):
+            await repository.add_device("111", "user-1", "Rex")
+            await repository.add_device("222", "user-1", "Fido")
+            timed = {**fix(60.0), 'time': '2025-01-01T12:00:00Z'}
+            assert await repository.insert_device_location("111", "user-1", timed, START) is IngestResult.STORED
+            resent = {**timed, 'time': '2025-01-01 13:00:00+01:00'}
+            assert await repository.insert_device_location("111", "user-1", resent, START + timedelta(seconds=5)) is IngestResult.DUPLICATE
+            assert await repository.insert_device_location("222", "user-1", timed, START) is IngestResult.STORED
+            sequenced = {**fix(61.0), 'time': '2025-01-01T12:00:00Z', 'seq': 7}
+            assert await repository.insert_device_location("111", "user-1", sequenced, START) is IngestResult.STORED
+            assert await repository.insert_device_location("111", "user-1", sequenced, START) is IngestResult.DUPLICATE
+            # The counter started over after a reboot
+            rebooted = {**fix(61.5), 'time': '2025-01-01T12:00:30Z', 'seq': 7}
+            assert await repository.insert_device_location("111", "user-1", rebooted, START) is IngestResult.STORED
+            # Without a date a device time repeats every day, and to the minute it is shared by several fixes
+            for device_time in ('12:00:00', '12:00:00', '2025-01-01 12:00', '2025-01-01 12:00'):
+                assert await repository.insert_device_location("111", "user-1", {**fix(62.0), 'time': device_time}, START) is IngestResult.STORED
+            assert await repository.insert_device_location("111", "user-1", fix(63.0), START) is IngestResult.STORED
+            assert await repository.insert_device_location("111", "user-1", fix(63.0), START) is IngestResult.STORED
+
+            history = await repository.get_device_location_history("111", START, START + timedelta(minutes=1), 10)
+            assert [location['latitude'] for location in history] == [60.0, 61.0, 61.5, 62.0, 62.0, 62.0, 62.0, 63.0, 63.0]
+        run(scenario)
+
+    def test_backend_must_implement_every_operation(self):
+        """Test a backend missing an operation fails when it is created, not when the operation is first used."""
+        class Partial(Repository):
+            async def get_user_uuid_by_email(self, email):
+                return None
+
+        with pytest.raises(TypeError):
+            Partial()
+
+    def test_remove_device_requires_owner(self, run):
+        """Test only the owner can remove a device."""
+        async def scenario(repository):
+            await repository.add_device("111", "user-1", "Rex")
+            assert not await repository.remove_device("111", "user-2")
+            assert await repository.device_exists("111")
+            assert await repository.remove_device("111", "user-1")
+            assert not await repository.device_exists("111")
+        run(scenario)
+
+    def test_groups(self, run):
+        """Test group membership and ownership."""
+        async def scenario(repository):
+            await repository.create_group("group-1", "Walkers", None, "user-1")
+            await repository.add_group_member("group-1", "user-2")
+            assert await repository.get_group_owner("group-1") == "user-1"
+            assert await repository.is_group_owner_or_member("group-1", "user-2")
+            assert not await repository.is_group_owner_or_member("group-1", "user-3")
+            assert sorted(await repository.get_group_members("group-1")) == ["user-1", "user-2"]
+
+            assert await repository.remove_group_member("group-1", "user-2")
+            await repository.delete_group("group-1")
+            assert await repository.get_group_owner("group-1") is None
+        run(scenario)
+
+
+class TestSchemaMigration:
+    """Test the migrations of SQLite databases of earlier schema versions."""
+
+    def test_version_0_database_is_migrated(self, tmp_path):
+        """Test history keyed by IMEI and UUID text is rekeyed and restamped while the API keeps its identifiers."""
+        path = str(tmp_path / "v0.db")
+        conn = sqlite3.connect(path)
+        for statement in VERSION_0_TABLES:
+            conn.execute(statement)
+        conn.executemany("INSERT INTO users (uuid, email, password_hash, nickname) VALUES (?, ?, 'hash', ?)", USERS)
+        conn.execute("INSERT INTO devices (imei, owner_uuid, name) VALUES ('111', 'user-1', 'Rex')")
+        conn.executemany("INSERT INTO device_locations (device_id, latitude, timestamp) VALUES (?, ?, ?)",
+                         [("111", 60.0 + minute, START + timedelta(minutes=minute)) for minute in range(3)] +
+                         [("gone", 0.0, START)])
+        conn.execute("INSERT INTO user_locations (uuid, latitude, timestamp) VALUES ('user-2', 59.0, ?)", (START,))
+        conn.commit()
+        conn.close()
+
+        db_manager = DatabaseManager(logging.getLogger(__name__), path)
+        conn = db_manager.get_connection()
+        assert db_manager.schema_version() == SCHEMA_VERSION
+        assert conn.execute("SELECT typeof(device_id), typeof(timestamp) FROM device_locations").fetchall() == [("integer", "integer")] * 3
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name LIKE '%_v0'").fetchall() == []
+
+        async def scenario():
+            repository = SQLiteRepository(db_manager)
+            await repository.add_friend_request("user-1", "user-2")
+            await repository.accept_friend_request("user-1", "user-2")
+            history = await repository.get_device_location_history("111", START, START + timedelta(hours=1), 10)
+            assert [(location['latitude'], location['timestamp']) for location in history] == [
+                (60.0, "2025-01-01 12:00:00.000"), (61.0, "2025-01-01 12:01:00.000"), (62.0, "2025-01-01 12:02:00.000")]
+            assert (await repository.get_device_location("111")).latitude == 62.0
+            locations = await repository.get_friend_locations("user-1")
+            assert [(location.uuid, location.timestamp) for location in locations] == [("user-2", "2025-01-01 12:00:00.000")]
+        asyncio.run(scenario())
+        conn.close()
+
+        # Opening the migrated database again changes nothing
+        reopened = DatabaseManager(logging.getLogger(__name__), path)
+        assert reopened.get_connection().execute("SELECT COUNT(*) FROM device_locations").fetchone()[0] == 3
+        reopened.get_connection().close()
+
+    def test_version_1_resent_fixes_are_removed(self, tmp_path):
+        """Test the first stored copy of each fix resent with a full device time is kept and later resends are ignored."""
+        path = str(tmp_path / "v1.db")
+        DatabaseManager(logging.getLogger(__name__), path).get_connection().close()
+        # Back to version 1, which had no sequence numbers or unique fix indexes
+        conn = sqlite3.connect(path)
+        conn.execute("DROP INDEX idx_device_locations_device_seq_time")
+        conn.execute("DROP INDEX idx_device_locations_device_time")
+        conn.execute("ALTER TABLE device_locations DROP COLUMN seq")
+        conn.execute("ALTER TABLE device_locations DROP COLUMN device_time")
+        conn.execute("INSERT INTO users (uuid, email, password_hash, nickname) VALUES ('user-1', 'one@example.com', 'hash', 'One')")
+        conn.execute("INSERT INTO devices (imei, owner_uuid, name) VALUES ('111', 'user-1', 'Rex')")
+        conn.executemany("INSERT INTO device_locations (device_id, latitude, time, timestamp) VALUES (1, ?, ?, ?)",
+                         [(60.0, "2025-01-01T12:00:00Z", 1), (60.5, "2025-01-01T12:00:00Z", 2), (61.0, "2025-01-01T12:01:00Z", 3),
+                          (62.0, "12:00:00", 4), (62.0, "12:00:00", 5), (63.0, None, 6), (63.0, None, 7)])
+        conn.execute("PRAGMA user_version = 1")
+        conn.commit()
+        conn.close()
+
+        db_manager = DatabaseManager(logging.getLogger(__name__), path)
+        conn = db_manager.get_connection()
+        assert db_manager.schema_version() == SCHEMA_VERSION
+        assert conn.execute("SELECT latitude FROM device_locations ORDER BY id").fetchall() == [
+            (60.0,), (61.0,), (62.0,), (62.0,), (63.0,), (63.0,)]
+
+        async def scenario():
+            repository = SQLiteRepository(db_manager)
+            assert await repository.insert_device_location("111", "user-1", {'time': "2025-01-01T12:01:00Z"}, START) is IngestResult.DUPLICATE
+            assert await repository.insert_device_location("111", "user-1", {'time': "2025-01-01T12:01:00Z", 'seq': 1}, START) is IngestResult.STORED
+            assert await repository.insert_device_location("111", "user-1", {'time': "12:00:00"}, START) is IngestResult.STORED
+        asyncio.run(scenario())
+        conn.close()
+
+    def test_version_2_sequence_numbers_are_rekeyed(self, tmp_path):
+        """Test a sequence number reused after a reboot is stored once the version 2 index is replaced."""
+        path = str(tmp_path / "v2.db")
+        DatabaseManager(logging.getLogger(__name__), path).get_connection().close()
+        # Back to version 2, which keyed fixes by sequence number alone and parsed device times to the minute
+        conn = sqlite3.connect(path)
+        conn.execute("DROP INDEX idx_device_locations_device_seq_time")
+        conn.execute("CREATE UNIQUE INDEX idx_device_locations_device_seq ON device_locations (device_id, seq) WHERE seq IS NOT NULL")
+        conn.execute("INSERT INTO users (uuid, email, password_hash, nickname) VALUES ('user-1', 'one@example.com', 'hash', 'One')")
+        conn.execute("INSERT INTO devices (imei, owner_uuid, name) VALUES ('111', 'user-1', 'Rex')")
+        conn.executemany("INSERT INTO device_locations (device_id, latitude, time, seq, device_time, timestamp) VALUES (1, ?, ?, ?, ?, ?)",
+                         [(60.0, "2025-01-01T12:00:00Z", 1, 1735732800000, 1), (61.0, "2025-01-01 12:01", None, 1735732860000, 2)])
+        conn.execute("PRAGMA user_version = 2")
+        conn.commit()
+        conn.close()
+
+        db_manager = DatabaseManager(logging.getLogger(__name__), path)
+        conn = db_manager.get_connection()
+        assert db_manager.schema_version() == SCHEMA_VERSION
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'idx_device_locations_device_seq'").fetchone()[0] == 0
+        assert conn.execute("SELECT device_time FROM device_locations ORDER BY id").fetchall() == [(1735732800000,), (None,)]
+
+        async def scenario():
+            repository = SQLiteRepository(db_manager)
+            assert await repository.insert_device_location("111", "user-1", {'time': "2025-01-01T12:00:00Z", 'seq': 1}, START) is IngestResult.DUPLICATE
+            assert await repository.insert_device_location("111", "user-1", {'time': "2025-01-01T12:05:00Z", 'seq': 1}, START) is IngestResult.STORED
+            assert await repository.insert_device_location("111", "user-1", {'time': "2025-01-01 12:01"}, START) is IngestResult.STORED
+        asyncio.run(scenario())
+        conn.close()
@@ -0,0 +1,103 @@
+"""
+Tests for the per device daily rollups.
+"""
+import asyncio
+import logging
+import time
+import pytest
+from fastapi.testclient import TestClient
+from database_manager import DatabaseManager
+from geo import haversine_distance_m
+from rollups import DailyRollups, Fix, RollupWorker, utc_day
+from tests.utils.fixtures import TestDataFixtures
+
+DAY_START = 1735689600.0  # 2025-01-01T00:00:00Z
+
+
+def make_fix(offset_seconds: float, latitude: float, longitude: float, speed: float = None, battery: int = None,
+             bark: int = None, connection_type: str = "lte") -> Fix:
+    return Fix("device", latitude, longitude, speed, battery, bark, connection_type, DAY_START + offset_seconds)
+
+
+class TestRollups:
+    """Test daily rollup functionality."""
+
+    @pytest.fixture
+    def rollups(self) -> DailyRollups:
+        return DailyRollups(DatabaseManager(logging.getLogger(__name__), ":memory:"), logging.getLogger(__name__))
+
+    def test_incremental_batches_match_single_batch(self, rollups: DailyRollups):
+        """Test distance, speed, barks, battery drain and uptime accumulate across batches."""
+        rollups.apply([
+            make_fix(0, 60.0, 10.0, speed=1.0, battery=90, bark=1),
+            make_fix(60, 60.001, 10.0, speed=3.0, battery=89),
+        ])
+        rollups.apply([
+            make_fix(120, 60.002, 10.0, speed=2.0, battery=88, bark=2, connection_type="lora"),
+            make_fix(3720, 60.003, 10.0, battery=80),  # an hour later, counts as offline
+        ])
+
+        [stats] = rollups.get_daily_stats("device", utc_day(DAY_START))
+        expected_distance = 3 * haversine_distance_m(60.0, 10.0, 60.001, 10.0)
+        assert stats["fix_count"] == 4
+        assert stats["distance_m"] == pytest.approx(expected_distance, rel=1e-6)
+        assert stats["max_speed"] == 3.0
+        assert stats["avg_speed"] == pytest.approx(2.0)
+        assert stats["bark_count"] == 3
+        assert stats["battery_drain_per_hour"] == pytest.approx(10 / (3720 / 3600))
+        assert stats["uptime_seconds"] == {"lte": 120}
+
+    def test_fixes_are_split_by_utc_day(self, rollups: DailyRollups):
+        """Test fixes on either side of midnight end up in separate days."""
+        rollups.apply([make_fix(-30, 60.0, 10.0), make_fix(30, 60.0, 10.001)])
+
+        stats = rollups.get_daily_stats("device", "2024-12-31")
+        assert [day["day"] for day in stats] == ["2024-12-31", "2025-01-01"]
+        assert stats[0]["distance_m"] == 0
+        assert stats[1]["distance_m"] > 0
+        assert stats[1]["uptime_seconds"] == {"lte": 60}
+
+    @pytest.mark.timeout(5)
+    def test_worker_applies_batches_on_its_own_connection(self, tmp_path):
+        """Test the worker writes a file database's rollups from a thread, readable on the shared connection."""
+        logger = logging.getLogger(__name__)
+        rollups = DailyRollups(DatabaseManager(logger, str(tmp_path / "rollups.db")), logger)
+
+        async def scenario():
+            worker = RollupWorker(rollups, logger)
+            worker.start()
+            worker.submit(make_fix(0, 60.0, 10.0, speed=1.0))
+            worker.submit(make_fix(60, 60.001, 10.0, speed=3.0))
+            await worker.stop()
+        asyncio.run(scenario())
+
+        [stats] = rollups.get_daily_stats("device", utc_day(DAY_START))
+        assert stats["fix_count"] == 2
+        assert stats["max_speed"] == 3.0
+
+    @pytest.mark.timeout(5)
+    def test_device_stats_endpoint(self, test_client: TestClient, test_user_token: str):
+        """Test ingested locations are reflected in the device stats endpoint."""
+        headers = {"Authorization": f"Bearer {test_user_token}"}
+        device_data = TestDataFixtures.device_data(imei="333444555666777")
+        assert test_client.post("/devices", json=device_data, headers=headers).status_code == 200
+
+        with test_client.websocket_connect(f'/ws?token={test_user_token}') as ws:
+            for latitude in (60.0, 60.001):
+                location_data = TestDataFixtures.location_update_data(latitude=latitude, speed=4.0, imei=device_data["imei"])
+                ws.send_json({"type": "device_location", "data": location_data})
+
+        # The rollups lag ingest until the worker has applied the fixes
+        stats = {}
+        while stats.get("fix_count") != 2:
+            response = test_client.get(f"/devices/{device_data['imei']}/stats", headers=headers)
+            assert response.status_code == 200
+            stats = response.json()[0] if response.json() else {}
+            time.sleep(0.01)
+        assert stats["distance_m"] == pytest.approx(haversine_distance_m(60.0, 10.7522, 60.001, 10.7522), rel=1e-6)
+        assert stats["max_speed"] == 4.0
+
+    def test_device_stats_endpoint_requires_access(self, test_client: TestClient, test_user_token: str):
+        """Test stats of devices the user cannot see are not found."""
+        headers = {"Authorization": f"Bearer {test_user_token}"}
+        assert test_client.get("/devices/000000000000000/stats", headers=headers).status_code == 404
@@ -0,0 +1,118 @@
+"""
+Tests for request and WebSocket message tracing and the sampling profiler.
+"""
+import json
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+from main import app, TRACE_EXPORT_PATH_ENV_VAR
+from sampling_profiler import SamplingProfiler
+from tests.utils.fixtures import TestDataFixtures
+from tracing import Tracer, JsonLinesSpanExporter, SPAN_STATUS_ERROR
+
+
+def read_spans(path) -> list:
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+def children(spans: list, parent: dict) -> list:
+    return [span for span in spans if span["parentSpanId"] == parent["spanId"]]
+
+def spin(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestTracing:
+    """Test spans, their export and the traced endpoints."""
+
+    def test_spans_nest_under_sampled_roots(self, tmp_path):
+        """Test child spans join their root's trace and nothing is recorded outside a root span."""
+        path = tmp_path / "spans.jsonl"
+        tracer = Tracer(JsonLinesSpanExporter(str(path)))
+        tracer.exporter.start()
+
+        with tracer.span("orphan") as orphan:
+            assert orphan is None
+        with tracer.span("root", root=True, user="u1"):
+            with tracer.span("child"):
+                pass
+            with pytest.raises(ValueError):
+                with tracer.span("failing"):
+                    raise ValueError("boom")
+        with Tracer(tracer.exporter, sample_rate=0).span("unsampled", root=True) as unsampled:
+            assert unsampled is None
+        tracer.shutdown()
+
+        spans = {span["name"]: span for span in read_spans(path)}
+        assert set(spans) == {"root", "child", "failing"}
+        root = spans["root"]
+        assert root["parentSpanId"] == "" and root["attributes"] == {"user": "u1"}
+        assert {span["name"] for span in children(list(spans.values()), root)} == {"child", "failing"}
+        assert all(span["traceId"] == root["traceId"] for span in spans.values())
+        assert spans["failing"]["status"]["code"] == SPAN_STATUS_ERROR
+        assert root["endTimeUnixNano"] >= spans["child"]["endTimeUnixNano"]
+
+    @pytest.mark.timeout(10)
+    def test_requests_and_websocket_messages_are_traced(self, temp_db, tmp_path, monkeypatch):
+        """Test requests and WebSocket messages are exported with their auth, database and fan-out phases."""
+        path = tmp_path / "spans.jsonl"
+        monkeypatch.setenv(TRACE_EXPORT_PATH_ENV_VAR, str(path))
+        with TestClient(app) as client:
+            client.post("/signup", json=TestDataFixtures.user_signup_data())
+            token = client.post("/signin", json=TestDataFixtures.user_signin_data()).json()["token"]
+            headers = {"Authorization": f"Bearer {token}"}
+            assert client.post("/devices", json=TestDataFixtures.device_data(), headers=headers).status_code == 200
+            with client.websocket_connect(f"/ws?token={token}") as websocket:
+                websocket.send_json({"type": "device_location", "data": {"device_id": "123456789012345",
+                                                                          "latitude": 59.9, "longitude": 10.7}})
+            # A request after the message, so it has been handled before shutdown flushes the spans
+            client.get("/devices", headers=headers)
+
+        spans = read_spans(path)
+        request = next(span for span in spans if span["name"] == "HTTP POST /devices")
+        assert request["attributes"]["http.status_code"] == 200
+        assert {"auth.token", "db.add_device"} <= {span["name"] for span in children(spans, request)}
+
+        message = next(span for span in spans if span["name"] == "WS device_location")
+        assert {"deserialize", "db.insert_device_location", "db.get_device_location", "fanout.shared_users"} <= {
+            span["name"] for span in children(spans, message)}
+
+
+class TestSamplingProfiler:
+    """Test the sampling profiler and its admin endpoint."""
+
+    def test_samples_other_threads(self):
+        """Test the collapsed stacks show where a busy thread spends its time."""
+        stop = threading.Event()
+        worker = threading.Thread(target=spin, args=(stop,), name="busy")
+        worker.start()
+        try:
+            profiler = SamplingProfiler(interval=0.001)
+            profiler.run(0.1)
+        finally:
+            stop.set()
+            worker.join()
+
+        assert profiler.samples > 10
+        lines = profiler.collapsed().splitlines()
+        busy = [line for line in lines if line.startswith("busy;") and ";spin (test_tracing.py:" in line]
+        assert busy
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+    @pytest.mark.timeout(10)
+    def test_profile_endpoint(self, test_client: TestClient, admin_token: str, test_user_token: str):
+        """Test admins get a collapsed stack profile, bad bounds are rejected and others are refused."""
+        admin_headers = {"Authorization": f"Bearer {admin_token}"}
+        started = time.monotonic()
+        response = test_client.post("/admin/profile?seconds=0.2&interval_ms=2", headers=admin_headers)
+        assert response.status_code == 200
+        assert time.monotonic() - started >= 0.2
+        assert int(response.headers["X-Profile-Samples"]) > 0
+        assert response.text and all(line.rsplit(" ", 1)[1].isdigit() for line in response.text.splitlines())
+
+        assert test_client.post("/admin/profile?seconds=0", headers=admin_headers).status_code == 400
+        assert test_client.post("/admin/profile?seconds=1&interval_ms=0", headers=admin_headers).status_code == 400
+        assert test_client.post("/admin/profile?seconds=0.1",
+                                headers={"Authorization": f"Bearer {test_user_token}"}).status_code == 403
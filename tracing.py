@@ -0,0 +1,161 @@
+"""
+Opt-in tracing of requests and WebSocket messages.
+Spans nest through a context variable, so a request's auth, database, serialization and fan-out phases
+end up under its root span, also when they run on another thread with a copy of the context.
+Finished spans are written as JSON lines with OpenTelemetry's span field names.
+"""
+import atexit
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Dict, Iterator, Optional
+
+SPAN_STATUS_OK = 'OK'
+SPAN_STATUS_ERROR = 'ERROR'
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: Optional[str]
+    start_ns: int
+    end_ns: int = 0
+    status: str = SPAN_STATUS_OK
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self) -> dict:
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_span_id or '',
+            'name': self.name,
+            'startTimeUnixNano': self.start_ns,
+            'endTimeUnixNano': self.end_ns,
+            'durationMs': (self.end_ns - self.start_ns) / 1e6,
+            'status': {'code': self.status},
+            'attributes': self.attributes,
+        }
+
+
+current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+
+class JsonLinesSpanExporter:
+    """Writes finished spans to a file on a background thread; drops spans rather than block when it falls behind."""
+
+    def __init__(self, path: str, queue_size: int = 10000):
+        self.path = path
+        self.queue: queue.Queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def export(self, span: Span):
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as file:
+            while True:
+                span = self.queue.get()
+                if span is None:
+                    return
+                file.write(json.dumps(span.to_dict(), default=str) + '\n')
+                if self.queue.empty():
+                    file.flush()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._write, name='span-exporter', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Write what is queued and close the file."""
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+# Tracer
+class Tracer:
+    """
+    Starts spans and hands them to the exporter when they end. Without an exporter every span is a no-op.
+    Root spans are sampled at `sample_rate`; other spans are only recorded inside a sampled root span.
+    """
+
+    def __init__(self, exporter: Optional[JsonLinesSpanExporter] = None, sample_rate: float = 1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    @contextmanager
+    def span(self, name: str, root: bool = False, **attributes) -> Iterator[Optional[Span]]:
+        """A span under the current one, or a new trace when `root`. Yields None when the span is not recorded."""
+        parent = current_span.get()
+        if self.exporter is None or (parent is None and (not root or random.random() >= self.sample_rate)):
+            yield None
+            return
+
+        span = Span(name, parent.trace_id if parent else os.urandom(16).hex(), os.urandom(8).hex(),
+                    parent.span_id if parent else None, time.time_ns(), attributes=attributes)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = SPAN_STATUS_ERROR
+            span.set_attribute('exception.type', type(e).__name__)
+            raise
+        finally:
+            current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self.exporter.export(span)
+
+    def traced(self, name: str):
+        """Decorator running a coroutine function in a span."""
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def shutdown(self):
+        if self.exporter is not None:
+            self.exporter.stop()
+
+
+class TracedProxy:
+    """Forwards to `target`, running each of its coroutine methods in a span named `prefix.method`."""
+
+    def __init__(self, target: Any, tracer: Tracer, prefix: str):
+        self._target = target
+        self._tracer = tracer
+        self._prefix = prefix
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._target, name)
+        if not inspect.iscoroutinefunction(attribute):
+            return attribute
+        return self._tracer.traced(f'{self._prefix}.{name}')(attribute)